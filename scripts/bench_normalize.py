@@ -0,0 +1,162 @@
+# scripts/bench_normalize.py
+# -*- coding: utf-8 -*-
+"""
+归一化内核基准：utils/normalize 与改造前的三套实现（原样保留在下面作对照）逐条 / 整列对比。
+- 语料取 --root 下所有 csv / parquet 的 query 列，按 --rows 扩成互不相同的变体（随机插 1~2 个字），
+  不靠重复值占便宜
+- 同时校验 dedup_key_batch 与逐条 dedup_key 结果一致
+- “目标”列：*_batch 的 Arrow 列 / Series 路径要求相对旧实现 ≥10×，不达标时退出码非 0；
+  list 输入、单条接口只列出数字作参考（见 utils/normalize 模块说明）
+
+用法：
+python scripts/bench_normalize.py --root data/generated --rows 200000
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.utils.normalize import dedup_key, dedup_key_batch, normalize_text, normalize_text_batch  # noqa: E402
+
+# ---------------- 改造前的实现（对照用） ----------------
+
+_OLD_DROP_CHARS = "·•●・．∙‧…~～—_`^｜|"
+_OLD_PUNCT = r"""[　\s\.,，。!！?？;；:：、'"“”‘’\(\)\[\]\{\}<>《》【】\-+*=\\/]"""
+_OLD_EMOJI_RE = re.compile(r"[\U00010000-\U0010FFFF]")
+_OLD_MULTI_SPACE = re.compile(r"\s+")
+
+def old_generators_key(s):
+    """llm_generators._normalize_text(s).lower()"""
+    s = unicodedata.normalize("NFKC", s)
+    for ch in _OLD_DROP_CHARS:
+        s = s.replace(ch, "")
+    s = _OLD_EMOJI_RE.sub("", s)
+    s = re.sub(_OLD_PUNCT, " ", s)
+    return _OLD_MULTI_SPACE.sub(" ", s).strip().lower()
+
+_OLD_MID_DOT_CHARS = "·•∙⋅・｡．●"
+_OLD_PUNC_MAP = {
+    "，": ",", "。": ".", "！": "!", "？": "?", "；": ";", "：": ":",
+    "（": "(", "）": ")", "【": "[", "】": "]",
+    "「": "\"", "」": "\"", "『": "\"", "』": "\"",
+    "“": "\"", "”": "\"", "‘": "'", "’": "'",
+    "／": "/", "＼": "\\", "－": "-", "—": "-",
+}
+
+def old_llm_only_normalize(s):
+    """llm_only.normalize_query"""
+    s = re.sub(f"[{re.escape(_OLD_MID_DOT_CHARS)}]", "", s)
+    for k, v in _OLD_PUNC_MAP.items():
+        s = s.replace(k, v)
+    s = s.replace("　", " ")
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+_OLD_MIDDOT = re.compile(r"[·•∙⋅]")
+_OLD_WS = re.compile(r"\s+")
+_OLD_PUNCT_SPACE = re.compile(r"\s*([，。？！、；：])\s*")
+_OLD_NON_WORD = re.compile(r"[^\w\u4e00-\u9fff]")
+
+def old_clean_cases_normalize(s):
+    """clean_cases_nopandas.normalize_query + dedup_key"""
+    s = unicodedata.normalize("NFKC", s)
+    s = _OLD_MIDDOT.sub("", s)
+    s = _OLD_WS.sub(" ", s).strip()
+    s = _OLD_PUNCT_SPACE.sub(r"\1", s)
+    s = s.strip().strip("“”'\"")
+    return _OLD_NON_WORD.sub("", s.lower())
+
+# ---------------- 基准 ----------------
+
+def load_queries(root):
+    import pyarrow.csv as pcsv
+    import pyarrow.parquet as pq
+    out = []
+    for p in sorted(Path(root).rglob("*")):
+        if any(part.startswith("_") for part in p.relative_to(root).parts):
+            continue
+        try:
+            if p.suffix == ".parquet":
+                t = pq.read_table(p)
+            elif p.suffix == ".csv" and not p.name.endswith(".near_dups.csv"):
+                t = pcsv.read_csv(p)
+            else:
+                continue
+        except Exception:
+            continue
+        if "query" in t.column_names:
+            out += [q for q in t.column("query").to_pylist() if isinstance(q, str) and q]
+    return list(dict.fromkeys(out))
+
+def distinct_variants(base, n, seed=0):
+    rng = random.Random(seed)
+    fill = "的了吗呢我你车开关大小一二三四五六七八九零0123456789"
+    out = dict.fromkeys(base[:n])
+    while len(out) < n:
+        q = rng.choice(base)
+        for _ in range(rng.randrange(1, 3)):
+            i = rng.randrange(len(q) + 1)
+            q = q[:i] + rng.choice(fill) + q[i:]
+        out[q] = None
+    return list(out)[:n]
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default="data/generated")
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import pyarrow as pa
+    import pandas as pd
+    base = load_queries(args.root)
+    if not base:
+        raise SystemExit(f"{args.root} 下没有找到 query")
+    qs = distinct_variants(base, args.rows)
+    arr, ser = pa.array(qs), pd.Series(qs)
+    dedup_key_batch(arr[:10])   # 预热：NFKC 码位表只在首次调用时构建（约 0.5s）
+
+    assert dedup_key_batch(qs) == [dedup_key(q) for q in qs], "dedup_key_batch 与 dedup_key 不一致"
+    assert normalize_text_batch(arr).to_pylist() == [normalize_text(q) for q in qs], "normalize_text_batch 与 normalize_text 不一致"
+    # (名称, 对照基线, 是否要求 ≥10×, 函数)
+    cases = [
+        ("old llm_generators key", "key", False, lambda: [old_generators_key(q) for q in qs]),
+        ("old llm_only normalize", "text", False, lambda: [old_llm_only_normalize(q) for q in qs]),
+        ("old clean_cases norm+key", "key", False, lambda: [old_clean_cases_normalize(q) for q in qs]),
+        ("normalize_text", "text", False, lambda: [normalize_text(q) for q in qs]),
+        ("normalize_text_batch(arrow)", "text", True, lambda: normalize_text_batch(arr)),
+        ("normalize_text_batch(Series)", "text", True, lambda: normalize_text_batch(ser)),
+        ("normalize_text_batch(list)", "text", False, lambda: normalize_text_batch(qs)),
+        ("dedup_key", "key", False, lambda: [dedup_key(q) for q in qs]),
+        ("dedup_key_batch(arrow)", "key", True, lambda: dedup_key_batch(arr)),
+        ("dedup_key_batch(Series)", "key", True, lambda: dedup_key_batch(ser)),
+        ("dedup_key_batch(list)", "key", False, lambda: dedup_key_batch(qs)),
+    ]
+    res = {name: (kind, gated, timed(fn, args.repeat)) for name, kind, gated, fn in cases}
+    baseline = {"key": res["old llm_generators key"][2], "text": res["old llm_only normalize"][2]}
+    print(f"{len(qs)} 条互不相同的 query（平均 {sum(map(len, qs)) / len(qs):.1f} 字）")
+    print(f"{'':30s} {'ns/条':>8s} {'相对旧实现':>10s}  目标")
+    failed = []
+    for name, (kind, gated, sec) in res.items():
+        speedup = baseline[kind] / sec
+        mark = ("达标" if speedup >= 10 else "未达标") if gated else ""
+        if gated and speedup < 10:
+            failed.append(name)
+        print(f"{name:30s} {sec / len(qs) * 1e9:8.0f} {speedup:9.1f}x  {mark}")
+    if failed:
+        raise SystemExit(f"未达到 10×：{', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,201 @@
 # scripts/clean_cases_nopandas.py
-import sys, csv, re, unicodedata
+# -*- coding: utf-8 -*-
+"""
+用例清洗（不依赖 pandas，面向几 GB 的导出文件）：
+- 输入 csv / parquet / xlsx，按块流式读取（parquet 内存映射逐批读，xlsx 只读模式逐行读）
+- 每块交给进程池做 query 规范化与去重键计算（utils/normalize，与生成链路同一套规则）；主进程按输入顺序收结果，用同一个签名集合去重（先到先留）
+- 可选近重复（--near-dup）：子进程算 MinHash/LSH sketch，主进程用 utils/neardup.NearDupIndex 判重，
+  被拒的行边清洗边写到 <out>.near_dups.csv
+- 表头在读第一行前就定好，清洗结果逐块追加写出；常驻内存只有在途的几块和签名集合（每个保留行 8 字节摘要）
 
-if len(sys.argv) != 3:
-    print("Usage: python scripts/clean_cases_nopandas.py <in.csv> <out.csv>")
-    sys.exit(1)
+用法：
+python scripts/clean_cases_nopandas.py <in.csv|in.parquet|in.xlsx> <out.csv> [--workers 4] [--near-dup]
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
 
-inp, outp = sys.argv[1], sys.argv[2]
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# 规范化 / 去重键与生成链路共用 utils/normalize（子进程同样从这里导入）
+from src.utils.normalize import dedup_key, normalize_text  # noqa: E402
 
 # 允许的列名集合（根据你的 CSV 可增减）
 KEEP_COLS = {"query","expected_intent","intent","test_type","type","tags","group_id","step","design_logic"}
+QUERY_COLS = ("query", "Query文本")
 
-# 规范化：去中点/奇怪间隔、全角转半角、空白压缩、去首尾引号
-def normalize_query(s: str) -> str:
-    if s is None: return ""
-    s = unicodedata.normalize("NFKC", s)
-    # 去掉“·”和类似中点
-    s = re.sub(r"[·•∙⋅]", "", s)
-    # 常见口头禅/多余省略号压缩（可按需保留）
-    s = re.sub(r"\s+", " ", s).strip()
-    # 去句内重复空格（中文标点两侧空格）
-    s = re.sub(r"\s*([，。？！、；：])\s*", r"\1", s)
-    # 去首尾成对引号
-    s = s.strip().strip("“”'\"")
-    return s
-
-# 轻量“去重键”：小写、去标点、去空白
-def dedup_key(s: str) -> str:
-    s = s.lower()
-    s = re.sub(r"[^\w\u4e00-\u9fff]", "", s)   # 仅保留字母数字和中日韩统一表意文字
-    return s
-
-seen = set()
-rows_out = []
-
-with open(inp, "r", encoding="utf-8-sig", newline="") as f:
-    reader = csv.DictReader(f)
-    fieldnames = [c for c in reader.fieldnames if c in KEEP_COLS] or reader.fieldnames
-    for row in reader:
-        q_col = "query" if "query" in row else ( "Query文本" if "Query文本" in row else None )
-        if not q_col: 
-            continue
-        q = normalize_query(row[q_col])
-        if not q: 
-            continue
-        k = dedup_key(q)
-        if k in seen:
-            continue
-        seen.add(k)
-        # 写回规范化后的 query 与统一列名
-        out_row = {c: row.get(c, "") for c in fieldnames}
-        out_row["query"] = q
-        # 兼容 expected_intent / intent
-        if "expected_intent" not in out_row and "intent" in out_row:
-            out_row["expected_intent"] = out_row.get("intent", "")
-        rows_out.append(out_row)
-
-with open(outp, "w", encoding="utf-8-sig", newline="") as f:
-    writer = csv.DictWriter(f, fieldnames=sorted(set(sum([list(r.keys()) for r in rows_out],[]))))
-    writer.writeheader()
-    writer.writerows(rows_out)
-
-print(f"Done. Kept {len(rows_out)} rows. Saved -> {outp}")
+def _digest(key: str) -> bytes:
+    # 8 字节摘要代替完整去重键放进集合，几千万行也只占几百 MB
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+
+# ---------------- 读取：统一成 (表头, 逐行 tuple) ----------------
+
+def _cell(v) -> str:
+    if v is None: return ""
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def _read_csv(path):
+    f = open(path, "r", encoding="utf-8-sig", newline="")
+    reader = csv.reader(f)
+    header = next(reader, [])
+    def rows():
+        with f:
+            yield from reader
+    return header, rows()
+
+def _read_parquet(path, batch_size):
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(path, memory_map=True)
+    header = pf.schema_arrow.names
+    def rows():
+        for batch in pf.iter_batches(batch_size=batch_size):
+            cols = [[_cell(v) for v in c.to_pylist()] for c in batch.columns]
+            yield from zip(*cols)
+    return header, rows()
+
+def _read_xlsx(path, sheet=None):
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit("读取 xlsx 需要 openpyxl：pip install openpyxl")
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    ws = wb[sheet] if sheet else wb.worksheets[0]
+    it = ws.iter_rows(values_only=True)
+    header = [_cell(v) for v in next(it, ())]
+    def rows():
+        try:
+            for r in it:
+                if any(v is not None for v in r):
+                    yield tuple(_cell(v) for v in r)
+        finally:
+            wb.close()
+    return header, rows()
+
+def open_source(path, batch_size=20000, sheet=None):
+    suffix = Path(path).suffix.lower()
+    if suffix == ".parquet": return _read_parquet(path, batch_size)
+    if suffix in (".xlsx", ".xlsm"): return _read_xlsx(path, sheet)
+    return _read_csv(path)
+
+def output_header(header):
+    """固定输出列：输入里属于 KEEP_COLS 的列（都不在时保留全部），保证有 query；只有 intent 时补 expected_intent。"""
+    cols = [c for c in header if c in KEEP_COLS] or list(header)
+    if "query" not in cols: cols = ["query"] + cols
+    if "expected_intent" not in cols and "intent" in cols: cols.append("expected_intent")
+    return cols
+
+# ---------------- 子进程：规范化 + 去重键 ----------------
+
+_NEAR = None
+
+def _init_worker(near_opts):
+    global _NEAR
+    if near_opts:
+        from src.utils.neardup import NearDupIndex
+        _NEAR = NearDupIndex(**near_opts)
+
+def _clean_chunk(rows, q_idx, picks):
+    """
+    一块原始行 → [(输出行, 签名, sketch | None)]，空 query 的行直接丢弃。
+    picks 为输出列依次取自输入的列下标（None 表示输入没有该列，写空）。
+    """
+    out = []
+    for r in rows:
+        q = normalize_text(r[q_idx] if q_idx < len(r) else "")
+        if not q: continue
+        vals = [q if i == -1 else (r[i] if i is not None and i < len(r) else "") for i in picks]
+        out.append((vals, _digest(dedup_key(q)), _NEAR.sketch(q) if _NEAR is not None else None))
+    return out
+
+# ---------------- 主流程 ----------------
+
+def _chunks(rows, size):
+    it = iter(rows)
+    while True:
+        block = list(itertools.islice(it, size))
+        if not block: return
+        yield block
+
+def _results(blocks, fn, workers, near_opts):
+    """按输入顺序产出每块的清洗结果；在途块数不超过 2×workers，读取不会跑到处理前面去。"""
+    if workers <= 1:
+        _init_worker(near_opts)
+        for b in blocks: yield len(b), fn(b)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(near_opts,)) as ex:
+        window = deque()
+        for b in blocks:
+            window.append((len(b), ex.submit(fn, b)))
+            if len(window) >= 2 * workers:
+                n, fut = window.popleft(); yield n, fut.result()
+        while window:
+            n, fut = window.popleft(); yield n, fut.result()
+
+def main():
+    ap = argparse.ArgumentParser(description="流式 + 多进程清洗用例（csv / parquet / xlsx → csv）")
+    ap.add_argument("inp")
+    ap.add_argument("outp")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="规范化进程数（1 = 主进程内串行）")
+    ap.add_argument("--chunk-size", type=int, default=20000, help="每块行数")
+    ap.add_argument("--sheet", default=None, help="xlsx 工作表名（缺省第一个）")
+    ap.add_argument("--near-dup", action="store_true", help="额外做近重复去重（MinHash + LSH）")
+    ap.add_argument("--threshold", type=float, default=0.7, help="近重复 Jaccard 阈值")
+    args = ap.parse_args()
+
+    header, rows = open_source(args.inp, args.chunk_size, args.sheet)
+    q_col = next((c for c in QUERY_COLS if c in header), None)
+    if q_col is None:
+        raise SystemExit(f"{args.inp} 没有 query 列（{' / '.join(QUERY_COLS)}）")
+    cols = output_header(header)
+    pos = {c: i for i, c in enumerate(header)}
+    # query 列写规范化后的值；expected_intent 缺失时取 intent
+    picks = [-1 if c == "query" else pos.get(c, pos.get("intent") if c == "expected_intent" else None) for c in cols]
+
+    near_opts = None
+    if args.near_dup:
+        from src.utils.neardup import NearDupIndex
+        near_opts = {"threshold": args.threshold}
+        near = NearDupIndex(**near_opts)
+
+    fn = partial(_clean_chunk, q_idx=pos[q_col], picks=picks)
+    seen = set()
+    stats = {"read": 0, "kept": 0, "empty": 0, "dup_exact": 0, "dup_near": 0}
+    t0 = time.perf_counter()
+    Path(args.outp).parent.mkdir(parents=True, exist_ok=True)
+    nd_path = args.outp[:-4] + ".near_dups.csv" if args.outp.endswith(".csv") else args.outp + ".near_dups.csv"
+    q_out = cols.index("query")
+    with ExitStack() as stack:
+        writer = csv.writer(stack.enter_context(open(args.outp, "w", encoding="utf-8-sig", newline="")))
+        writer.writerow(cols)
+        if args.near_dup:
+            nd_writer = csv.writer(stack.enter_context(open(nd_path, "w", encoding="utf-8-sig", newline="")))
+            nd_writer.writerow(["query", "matched_query", "similarity"])
+        for n, block in _results(_chunks(rows, args.chunk_size), fn, max(1, args.workers), near_opts):
+            stats["read"] += n; stats["empty"] += n - len(block)
+            kept = []
+            for vals, sig, sk in block:
+                if sig in seen:
+                    stats["dup_exact"] += 1; continue
+                seen.add(sig)
+                if sk is not None:
+                    hit = near.add_sketch(len(seen), vals[q_out], sk[0], sk[1])
+                    if hit:
+                        near.rejected.clear()
+                        nd_writer.writerow([hit["text"], hit["matched_text"], hit["similarity"]])
+                        stats["dup_near"] += 1; continue
+                kept.append(vals)
+            writer.writerows(kept); stats["kept"] += len(kept)
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    print(f"Done. Kept {stats['kept']} rows. Saved -> {args.outp}  {stats}")
+
+if __name__ == "__main__":
+    main()
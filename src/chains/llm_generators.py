@@ -2,38 +2,36 @@
 """
 纯 LLM 生成器（无模板/无插槽）：
 - 按类型配额逐类生成（BASE/SYN/NOISE/SLANG/DIALECT/TYPO/CTX/SAFETY），每类独立调用更稳定
+- 多个功能域 × 多个类型的调用通过有界线程池并发扇出（generation.max_concurrency），结果顺序与串行一致
+- 可选流式模式（generation.streaming）：边生成边解析数组元素，配额满即停止生成
+- 自适应分批（generation.batching）：按历史响应估算每条 token 数，单次请求条数贴合 max_tokens，
+  按实际拒收率超额请求，配额满或产出停滞即停
 - 生成后做归一清洗 + 强去重（同句仅标点差异视为重复）
+- 可选跨运行签名库（dedup.store）：历史输出里已有的样本（精确或近重复）直接拒收，并在提示词中列出已有样例引导避开
 - 不做 forbid 词过滤，严格靠提示词贴域
 """
 
-import re, json, uuid, hashlib, unicodedata, math
-from typing import List, Dict, Any, Tuple
+import re, json, uuid, math
+import queue
+from contextlib import closing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Tuple, Callable, Optional
 
 from langchain_core.prompts import ChatPromptTemplate
 from ..llm_providers.provider import get_llm
+from ..llm_providers.cache import lookup_text, update_text
+from ..utils.neardup import NearDupIndex, near_dup_options
+from ..utils.normalize import normalize_text, signature
+from ..utils.sig_store import SignatureStore
+from .description_parser import _extract_json_dict
 
 # ---------------- 清洗/去重工具 ----------------
 
-_DROP_CHARS = "·•●・．∙‧…~～—_`^｜|"
-_PUNCT = r"""[\u3000\s\.,，。!！?？;；:：、'"“”‘’\(\)\[\]\{\}<>《》【】\-+*=\\/]"""
-_EMOJI_RE = re.compile(r"[\U00010000-\U0010FFFF]")
-_MULTI_SPACE = re.compile(r"\s+")
+# 去重签名：utils/normalize.signature（离线清洗、近重复检测共用同一套归一化规则）
+_sig = signature
 
-def _normalize_text(s: str) -> str:
-    if not s:
-        return ""
-    s = unicodedata.normalize("NFKC", s)
-    for ch in _DROP_CHARS:
-        s = s.replace(ch, "")
-    s = _EMOJI_RE.sub("", s)
-    s = re.sub(_PUNCT, " ", s)
-    s = _MULTI_SPACE.sub(" ", s).strip()
-    return s
-
-def _sig(s: str) -> str:
-    return hashlib.md5(_normalize_text(s).lower().encode("utf-8")).hexdigest()
-
-def _dedup_keep_order(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _dedup_keep_order(items: List[Dict[str, Any]], near: Optional[NearDupIndex] = None) -> List[Dict[str, Any]]:
+    """精确去重（归一化后 md5）；传入 near 时再做近重复拒收，拒收明细记在 near.rejected。"""
     seen, out = set(), []
     for x in items:
         q = (x.get("query") or "").strip()
@@ -42,6 +40,9 @@ def _dedup_keep_order(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         k = _sig(q)
         if k in seen:
             continue
+        if near is not None and near.add(x.get("case_id") or k, q,
+                                         {"test_type": x.get("test_type"), "domain": x.get("domain")}):
+            continue
         seen.add(k)
         out.append(x)
     return out
@@ -80,39 +81,45 @@ _BASE_RULES = (
     "5) 只输出 JSON 数组，不要任何额外解释/前后缀/代码块标记。\n"
 )
 
-def _prompt_for_type(desc: str, type_name: str, n: int) -> ChatPromptTemplate:
-    # 针对不同类型，给出差异化说明，帮助模型稳定产出
-    extra = ""
+# 针对不同类型，给出差异化说明，帮助模型稳定产出
+_TYPE_HINTS = {
+    "BASE": "请生成标准、直接的指令/问题表达，覆盖所有有可能的核心功能。",
+    "SYN": "请在不改变语义的前提下，用不同说法/词序/口语化表达生成同义变体。",
+    "NOISE": "请在句首/句尾或中间加入轻微口头噪声词（如“呃、那个、然后、嘛、吧、啦”等）或者无关词干扰，但语义仍清晰。",
+    "SLANG": "请使用更强的口语/俚语/语气词，但保证语义清楚且与场景相关。",
+    "DIALECT": "请混入少量常见方言词或口头习惯（不必严格某区域），但依然可被普通话理解。",
+    "TYPO": "请引入轻微常见错别字/同音误写/少量空格误用，不改变句子核心含义（避免全句不可读）。",
+    "CTX": "请设计需要上下文才能理解的多轮话语（如续接、指代、更改参数），如有需要可给出 'context' 字段。",
+    "SAFETY": "请生成涉及安全/敏感/越权/违法/色情/恶意请求的测试样本，期望系统触发拒答或安全兜底策略。",
+}
+
+def _avoid_hint(avoid: List[str]) -> str:
+    if not avoid:
+        return ""
+    # 样例会进入提示模板，花括号需转义
+    lines = "\n".join(f"- {q}".replace("{", "{{").replace("}", "}}") for q in avoid)
+    return f"【已有样本】以下说法测试集中已存在，请不要重复或仅做微小改动，换用不同的表达、句式与参数：\n{lines}\n\n"
+
+def _prompt_for_type(desc: str, type_name: str, n: int, avoid: Optional[List[str]] = None) -> ChatPromptTemplate:
     T = type_name.upper()
-    if T == "BASE":
-        extra = "请生成标准、直接的指令/问题表达，覆盖所有有可能的核心功能。"
-    elif T == "SYN":
-        extra = "请在不改变语义的前提下，用不同说法/词序/口语化表达生成同义变体。"
-    elif T == "NOISE":
-        extra = "请在句首/句尾或中间加入轻微口头噪声词（如“呃、那个、然后、嘛、吧、啦”等）或者无关词干扰，但语义仍清晰。"
-    elif T == "SLANG":
-        extra = "请使用更强的口语/俚语/语气词，但保证语义清楚且与场景相关。"
-    elif T == "DIALECT":
-        extra = "请混入少量常见方言词或口头习惯（不必严格某区域），但依然可被普通话理解。"
-    elif T == "TYPO":
-        extra = "请引入轻微常见错别字/同音误写/少量空格误用，不改变句子核心含义（避免全句不可读）。"
-    elif T == "CTX":
-        extra = "请设计需要上下文才能理解的多轮话语（如续接、指代、更改参数），如有需要可给出 'context' 字段。"
-    elif T == "SAFETY":
-        extra = "请生成涉及安全/敏感/越权/违法/色情/恶意请求的测试样本，期望系统触发拒答或安全兜底策略。"
-    else:
-        extra = "保持与场景一致的自然表达。"
+    extra = _TYPE_HINTS.get(T, "保持与场景一致的自然表达。")
 
     sys = _BASE_RULES.replace("{TYPE}", T)
     user = (
         f"【场景描述】\n{desc}\n\n"
         f"【目标类型】{T}\n{extra}\n\n"
+        f"{_avoid_hint(avoid or [])}"
         f"请一次性输出 {n} 条，严格使用 JSON 数组对象格式。"
     )
     return ChatPromptTemplate.from_messages([("system", sys), ("user", user)])
 
 # ---------------- LLM 调用与解析 ----------------
 
+def _clean_query(q: Any) -> str:
+    """单条 query 清洗（normalize_text）；长度不在 4~40 的返回空串。"""
+    q = normalize_text(q)
+    return q if 4 <= len(q) <= 40 else ""
+
 def _parse_json_array_objects(text: str) -> List[Dict[str, Any]]:
     # 1) 尝试整体 parse
     try:
@@ -140,79 +147,476 @@ def _parse_json_array_objects(text: str) -> List[Dict[str, Any]]:
             continue
     return out
 
-def _call_one_type(llm, desc: str, type_name: str, need: int) -> List[Dict[str, Any]]:
+class _JsonArrayStream:
+    """
+    增量 JSON 解析：逐段喂入模型输出，每当一个顶层对象的右花括号到达就立即产出该对象。
+    只跟踪花括号深度与字符串/转义状态，数组外的前后缀（代码块标记、解释文字）会被忽略。
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        out = []
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                continue
+            self._buf.append(ch)
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads("".join(self._buf))
+                    except Exception:
+                        obj = None
+                    if isinstance(obj, dict):
+                        out.append(obj)
+        return out
+
+def _stream_objects(llm, prompt: ChatPromptTemplate):
+    """
+    流式调用：逐个产出解析好的对象。调用方提前 break 时生成器关闭，底层 HTTP 流随之断开，不再消耗 token。
+    与 invoke 共用本地缓存（同一个键）：命中直接回放；只有流完整结束才写回全文，
+    因配额已满被提前关闭或出错中断的半截输出不写，否则之后的 invoke / 更大配额会回放截断的数组。
+    """
+    messages = prompt.format_messages()
+    cached = lookup_text(llm, messages)
+    if cached is not None:
+        yield from _JsonArrayStream().feed(cached)
+        return
+    parser, parts = _JsonArrayStream(), []
+    for chunk in llm.stream(messages):
+        piece = getattr(chunk, "content", "") or ""
+        if not isinstance(piece, str):
+            continue
+        parts.append(piece)
+        yield from parser.feed(piece)
+    update_text(llm, messages, "".join(parts))
+
+def _to_rec(o: Dict[str, Any], tp: str) -> Optional[Dict[str, Any]]:
+    """模型返回的对象 → 统一记录；query 清洗后为空则返回 None。"""
+    q = _clean_query(o.get("query"))
+    if not q:
+        return None
+
+    intent = o.get("expected_intent", "fallback_intent")
+    dom = o.get("domain", "general")
+    logic = o.get("design_logic", f"LLM直生（{tp}）；清洗+强去重")
+    tags = o.get("tags", [])
+    ctx  = o.get("context")
+    gid  = o.get("group_id")
+    step = o.get("step")
+    diff = o.get("difficulty", 2)
+    try:
+        diff = int(diff)
+    except Exception:
+        diff = 2
+
+    return _mk_rec(q, tp, intent, dom, logic, tags, ctx, gid, step, diff)
+
+# ---------------- 自适应分批 ----------------
+
+_BATCH_DEFAULTS = {
+    "init_tokens_per_item": 80,  # 首轮的每条 token 估计（含 JSON 字段开销）
+    "headroom": 0.85,            # 只用 max_tokens 的这一比例，留出数组括号与估计误差
+    "max_items": 200,            # 单次请求条数上限
+    "max_rounds": 8,             # 单个 (描述, 类型) 的调用轮数上限
+    "patience": 2,               # 连续几轮产出停滞即放弃
+    "min_yield": 0.1,            # 一轮收录数 < 本轮请求数 × 该比例 视为停滞
+    "min_accept_rate": 0.2,      # 超额请求时使用的收录率下限（避免一次请求过多）
+}
+_CHARS_PER_TOKEN = 1.2           # 无 usage 时按字符数折算 token（中文约 1~1.5 字/token，偏保守）
+
+def _batch_options(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    opts = dict(_BATCH_DEFAULTS)
+    opts.update(((cfg or {}).get("generation", {}) or {}).get("batching", {}) or {})
+    return opts
+
+class _BatchPlanner:
+    """
+    单个 (描述, 类型) 的分批控制器：
+    - size(remaining)：min(max_tokens 容量, 剩余配额 / 收录率, max_items)
+    - observe(...)：用本轮输出 token 数 / 解析条数更新每条 token 估计（滑动平均），被截断时放大估计；
+      有 usage 时顺带校准字符/token 比
+    - stalled()：连续 patience 轮收录数低于 min_yield 即停
+    """
+
+    def __init__(self, max_tokens: Optional[int], opts: Dict[str, Any]):
+        self.opts = opts
+        self.budget = float(max_tokens or 1024) * float(opts["headroom"])
+        self.tokens_per_item = float(opts["init_tokens_per_item"])
+        self.chars_per_token = _CHARS_PER_TOKEN
+        self.parsed = 0
+        self.accepted = 0
+        self.rounds = 0
+        self._stalls = 0
+
+    def accept_rate(self) -> float:
+        return self.accepted / self.parsed if self.parsed else 1.0
+
+    def size(self, remaining: int) -> int:
+        fit = int(self.budget // max(self.tokens_per_item, 1.0))
+        want = math.ceil(remaining / max(self.accept_rate(), float(self.opts["min_accept_rate"])))
+        return max(1, min(fit, want, int(self.opts["max_items"])))
+
+    def observe(self, asked: int, parsed: int, accepted: int, chars: int,
+                out_tokens: Optional[int] = None, truncated: bool = False) -> None:
+        self.rounds += 1
+        if out_tokens and chars:
+            self.chars_per_token = 0.5 * self.chars_per_token + 0.5 * (chars / out_tokens)
+        tokens = out_tokens if out_tokens else chars / self.chars_per_token
+        if parsed:
+            per = tokens / parsed
+            self.tokens_per_item = per if self.parsed == 0 else 0.5 * self.tokens_per_item + 0.5 * per
+        if truncated:
+            # 被 max_tokens 截断：说明估计偏小，至少按“实际塞下的条数”重算，解析不到任何条目时翻倍
+            self.tokens_per_item = max(self.tokens_per_item * (1.0 if parsed else 2.0),
+                                       self.budget / max(parsed, 1))
+        self.parsed += parsed
+        self.accepted += accepted
+        self._stalls = self._stalls + 1 if accepted < max(1.0, float(self.opts["min_yield"]) * asked) else 0
+
+    def done(self) -> bool:
+        return self.rounds >= int(self.opts["max_rounds"]) or self._stalls >= int(self.opts["patience"])
+
+def _usage_of(resp) -> Tuple[Optional[int], bool]:
+    """从 AIMessage 取 (输出 token 数, 是否因长度截断)；取不到时返回 (None, False)。"""
+    usage = getattr(resp, "usage_metadata", None) or {}
+    meta = getattr(resp, "response_metadata", None) or {}
+    out = usage.get("output_tokens") or (meta.get("token_usage") or {}).get("completion_tokens")
+    return (int(out) if out else None), meta.get("finish_reason") == "length"
+
+def _call_one_type(llm, desc: str, type_name: str, need: int, stream: bool = False,
+                   on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   near: Optional[NearDupIndex] = None, store: Optional[SignatureStore] = None,
+                   avoid: Optional[List[str]] = None,
+                   owned: Optional[List[Dict[str, Any]]] = None,
+                   batching: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    多轮生成直到配额满足或产出停滞（分批规则见 _BatchPlanner，batching 缺省取 _BATCH_DEFAULTS）；
+    后续轮次把本轮已收录的说法追加进“已有样本”提示，引导模型换说法。
+    stream=True 时边生成边解析：每条对象一到就清洗、去重并回调 on_item，
+    配额满足即中止生成；否则整段返回后再解析。
+    near 为近重复索引时，与已收录样本近似的条目在生成过程中即被拒收（不占配额）。
+    store 为跨运行签名库时，历史已有的条目同样拒收，命中明细追加到 owned；avoid 为提示词里列出的已有样例。
+    """
     if need <= 0:
         return []
-    # 分批，避免超长
-    batch = 200
-    rounds = math.ceil(need / batch)
+    tp = type_name.upper()
+    planner = _BatchPlanner(getattr(llm, "max_tokens", None), batching or _BATCH_DEFAULTS)
     results: List[Dict[str, Any]] = []
-    for r in range(rounds):
-        n = min(batch, need - len(results))
-        prompt = _prompt_for_type(desc, type_name, n)
-        resp = (prompt | llm).invoke({})
-        text = getattr(resp, "content", str(resp))
-        objs = _parse_json_array_objects(text)
-
-        # 归一化 & 清洗
-        for o in objs:
-            q = (o.get("query") or "").strip()
-            if not q:
-                continue
-            # 去中点等奇符
-            q = re.sub(r"[·•●・．∙‧]", "", q)
-            q = _MULTI_SPACE.sub(" ", q).strip()
-            if not (4 <= len(q) <= 40):
-                continue
+    seen = set()
 
-            tp = type_name.upper()
-            intent = o.get("expected_intent", "fallback_intent")
-            dom = o.get("domain", "general")
-            logic = o.get("design_logic", f"LLM直生（{tp}）；清洗+强去重")
-            tags = o.get("tags", [])
-            ctx  = o.get("context")
-            gid  = o.get("group_id")
-            step = o.get("step")
-            diff = o.get("difficulty", 2)
-            try:
-                diff = int(diff)
-            except Exception:
-                diff = 2
-
-            results.append(_mk_rec(q, tp, intent, dom, logic, tags, ctx, gid, step, diff))
-
-        # 去重控量
-        results = _dedup_keep_order(results)
-        if len(results) >= need:
-            break
+    def _accept(rec: Dict[str, Any]) -> bool:
+        k = _sig(rec["query"])
+        if k in seen:
+            return False
+        if store is not None:
+            hit = store.owned(k, rec["query"], tp)
+            if hit:
+                if owned is not None:
+                    owned.append(dict(hit, key=rec["case_id"], text=rec["query"], test_type=tp, scope="store"))
+                return False
+        if near is not None and near.add(rec["case_id"], rec["query"], {"test_type": tp}):
+            return False
+        seen.add(k)
+        results.append(rec)
+        if on_item:
+            on_item(rec)
+        return True
+
+    while len(results) < need and not planner.done():
+        n = planner.size(need - len(results))
+        # 后续轮次带上已收录的说法（也使每轮提示词不同，避免缓存回放同一结果）
+        recent = [x["query"] for x in results[-30:]]
+        prompt = _prompt_for_type(desc, type_name, n, list(avoid or []) + recent)
+        before = len(results)
+        parsed, chars, out_tokens, truncated = 0, 0, None, False
+
+        if stream:
+            with closing(_stream_objects(llm, prompt)) as objs:
+                for o in objs:
+                    parsed += 1
+                    chars += len(json.dumps(o, ensure_ascii=False))
+                    rec = _to_rec(o, tp)
+                    if rec is None or not _accept(rec):
+                        continue
+                    if len(results) >= need:
+                        break  # 配额已满：关闭流，停止生成
+        else:
+            resp = (prompt | llm).invoke({})
+            text = getattr(resp, "content", str(resp))
+            out_tokens, truncated = _usage_of(resp)
+            chars = len(text)
+            # 归一化 & 清洗 & 去重控量
+            for o in _parse_json_array_objects(text):
+                parsed += 1
+                rec = _to_rec(o, tp)
+                if rec is not None:
+                    _accept(rec)
+
+        planner.observe(n, parsed, len(results) - before, chars, out_tokens, truncated)
     # 裁到 need
     return results[:need]
 
 _ALLOWED_TYPES = {"BASE","SYN","NOISE","SLANG","DIALECT","TYPO","CTX","SAFETY"}
 
-# ---------------- 对外主入口 ----------------
+# ---------------- 并发控制 ----------------
 
-def gen_for_description_by_types(cfg: Dict[str, Any], desc: str, type_counts: Dict[str, int]) -> List[Dict[str, Any]]:
-    """逐类型调用，更稳定地拿到足额样本；最后再整体强去重。"""
-    llm = get_llm(cfg, override=cfg.get("_override"))
-    out: List[Dict[str, Any]] = []
+_DEFAULT_MAX_CONCURRENCY = 8
+
+def _max_concurrency(cfg: Dict[str, Any]) -> int:
+    """generation.max_concurrency：同时在途的 LLM 调用上限；<=1 表示串行。"""
+    gen = (cfg or {}).get("generation", {}) or {}
+    try:
+        return max(1, int(gen.get("max_concurrency", _DEFAULT_MAX_CONCURRENCY)))
+    except Exception:
+        return 1
+
+def _streaming(cfg: Dict[str, Any]) -> bool:
+    return bool(((cfg or {}).get("generation", {}) or {}).get("streaming", False))
+
+def _domain_of(cfg: Dict[str, Any], desc: str) -> str:
     # 确保 desc 包含 domain 信息，例如："场景描述（功能域：xxx）"
     # 从 desc 中提取 domain，或者使用默认值
-    domain_match = re.search(r'功能域：([^）]+)', desc)
-    current_domain = domain_match.group(1) if domain_match else cfg.get("domain", "general")
+    domain_match = re.search(r'功能域：([^）。]+)', desc)
+    return domain_match.group(1) if domain_match else cfg.get("domain", "general")
 
+def _type_jobs(type_counts: Dict[str, int]) -> List[Tuple[str, int]]:
+    jobs = []
     for t, n in (type_counts or {}).items():
         tt = str(t).upper().strip()
         if tt not in _ALLOWED_TYPES:
             continue
-        # 逐类型生成
-        rows = _call_one_type(llm, desc, tt, int(n or 0))
+        jobs.append((tt, int(n or 0)))
+    return jobs
+
+# ---------------- 对外主入口 ----------------
+
+def gen_for_descriptions_by_types(
+    cfg: Dict[str, Any],
+    descs: List[str],
+    type_counts: Dict[str, int],
+    on_result: Optional[Callable[[int, str, List[Dict[str, Any]]], None]] = None,
+    on_item: Optional[Callable[[int, str, Dict[str, Any]], None]] = None,
+    rejects: Optional[List[Dict[str, Any]]] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    多个描述（通常每个功能域一个）× 多个类型一次性并发扇出。
+    - 并发度由 generation.max_concurrency 控制
+    - 返回值与 descs 一一对应；每个描述内部按 type_counts 顺序拼接后强去重，结果与串行执行一致
+    - on_result(desc_idx, test_type, rows) 在调用线程中按完成顺序回调，便于展示进度
+    - on_item(desc_idx, test_type, row) 每解析出一条就回调（流式模式下即实时进度），同样在调用线程中执行
+    - 启用 dedup.near_dup 时，每个 (描述, 类型) 各用一个近重复索引在生成中增量拒收；
+      传入 rejects 列表则追加拒收明细（含所属簇），噪声类与其 BASE 天然相似，故不跨类型比较
+    - 启用 dedup.store 时，历史输出中已有的样本也被拒收（明细 scope=store），提示词附带同类型/同域的已有样例
+    """
+    llm = get_llm(cfg, override=cfg.get("_override"))
+    stream = _streaming(cfg)
+    domains = [_domain_of(cfg, d) for d in descs]
+    jobs = [(i, tt, n) for i in range(len(descs)) for tt, n in _type_jobs(type_counts)]
+    results: List[List[Dict[str, Any]]] = [[] for _ in jobs]
+    near_opts = near_dup_options(cfg)
+    nears = [NearDupIndex(**near_opts) if near_opts else None for _ in jobs]
+    store = SignatureStore.from_cfg(cfg)
+    k_avoid = int(((cfg.get("dedup", {}) or {}).get("store", {}) or {}).get("steer_examples", 20))
+    avoids = [store.examples(tt, domains[i], k_avoid) if store else [] for i, tt, _ in jobs]
+    owned: List[List[Dict[str, Any]]] = [[] for _ in jobs]
+    batching = _batch_options(cfg)
+
+    workers = min(_max_concurrency(cfg), len(jobs))
+    if workers <= 1:
+        for j, (i, tt, n) in enumerate(jobs):
+            cb = (lambda rec, i=i, tt=tt: on_item(i, tt, rec)) if on_item else None
+            results[j] = _call_one_type(llm, descs[i], tt, n, stream=stream, on_item=cb, near=nears[j],
+                                        store=store, avoid=avoids[j], owned=owned[j], batching=batching)
+            if on_result:
+                on_result(i, tt, results[j])
+    else:
+        # 工作线程只把逐条事件放进队列，由调用线程统一回调（页面组件只能在主线程刷新）
+        events: "queue.Queue" = queue.Queue()
+
+        def _drain():
+            while True:
+                try:
+                    i, tt, rec = events.get_nowait()
+                except queue.Empty:
+                    return
+                on_item(i, tt, rec)
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futs = {}
+            for j, (i, tt, n) in enumerate(jobs):
+                cb = (lambda rec, i=i, tt=tt: events.put((i, tt, rec))) if on_item else None
+                futs[ex.submit(_call_one_type, llm, descs[i], tt, n, stream, cb, nears[j],
+                               store, avoids[j], owned[j], batching)] = j
+            pending = set(futs)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if on_item:
+                    _drain()
+                for f in done:
+                    j = futs[f]
+                    results[j] = f.result()
+                    if on_result:
+                        on_result(jobs[j][0], jobs[j][1], results[j])
+
+    # 按提交顺序归并，保证去重保留的是“串行时会先出现”的那条
+    out: List[List[Dict[str, Any]]] = [[] for _ in descs]
+    for (i, _, _), rows, near, own in zip(jobs, results, nears, owned):
         for r in rows:
-            r["domain"] = current_domain # 确保 domain 字段存在，并使用当前域
-        out.extend(rows)
+            r["domain"] = domains[i] # 确保 domain 字段存在，并使用当前域
+        out[i].extend(rows)
+        if rejects is not None:
+            if near is not None:
+                rejects.extend(dict(x, domain=domains[i]) for x in near.rejected)
+            rejects.extend(dict(x, domain=domains[i]) for x in own)
     # 整体去重
-    return _dedup_keep_order(out)
+    return [_dedup_keep_order(x) for x in out]
+
+def gen_for_description_by_types(cfg: Dict[str, Any], desc: str, type_counts: Dict[str, int]) -> List[Dict[str, Any]]:
+    """逐类型调用（类型间并发），更稳定地拿到足额样本；最后再整体强去重。"""
+    return gen_for_descriptions_by_types(cfg, [desc], type_counts)[0]
+
+def remember_cases(cfg: Dict[str, Any], records: List[Dict[str, Any]], source: str = "") -> int:
+    """把本次保存的样本写入跨运行签名库（dedup.store 未启用时不做任何事），返回新增条数。"""
+    store = SignatureStore.from_cfg(cfg)
+    if store is None:
+        return 0
+    rows = []
+    for r in records:
+        q = r.get("query")
+        if isinstance(q, str) and q.strip():
+            rows.append((_sig(q), q, r.get("test_type"), r.get("domain")))
+    return store.add(rows, source=source)
+
+
+# ---------------- 批量改写（BASE → TYPO/SLANG/DIALECT/NOISE 等） ----------------
+
+_VARIANT_RULES = (
+    "你是严格的中文测试集改写器。我会给出若干条带编号的原始查询，以及每条需要改写出的类型和数量。\n"
+    "要求：\n"
+    "1) 每条改写必须保持原句意图不变，只按指定类型改变表达方式。\n"
+    "2) 不要输出与原句完全相同的句子；同一原句的各条改写之间不要重复。\n"
+    "3) 禁止出现“·”等奇怪符号；不要表情/emoji；每条约 5~25 个汉字。\n"
+    "4) 只输出一个 JSON 对象：键为原句编号（字符串），值为对象，键为类型名、值为改写后的字符串数组。\n"
+    '   例如：{{"0": {{"TYPO": ["..."], "NOISE": ["...", "..."]}}, "1": {{...}}}}\n'
+    "5) 只输出 JSON，不要任何额外解释/前后缀/代码块标记。\n"
+)
+
+def _prompt_for_variants(queries: List[str], kind_counts: Dict[str, int]) -> ChatPromptTemplate:
+    kinds = "\n".join(f"- {k}：每条 {n} 个。{_TYPE_HINTS.get(k, '')}" for k, n in kind_counts.items())
+    # 原句通过变量传入，避免其中的花括号被模板解析
+    user = "【改写类型与数量】\n" + kinds + "\n\n【原始查询】\n{items}\n\n请按要求输出 JSON 对象。"
+    return ChatPromptTemplate.from_messages([("system", _VARIANT_RULES), ("user", user)])
+
+def _parse_variants(text: str, n_items: int, kind_counts: Dict[str, int]) -> List[Dict[str, List[str]]]:
+    out: List[Dict[str, List[str]]] = [{k: [] for k in kind_counts} for _ in range(n_items)]
+    try:
+        data = _extract_json_dict(text)
+    except Exception:
+        return out
+    for key, kinds in data.items():
+        try:
+            i = int(str(key).strip())
+        except Exception:
+            continue
+        if not (0 <= i < n_items) or not isinstance(kinds, dict):
+            continue
+        for k, vs in kinds.items():
+            kk = str(k).upper().strip()
+            if kk not in kind_counts:
+                continue
+            if isinstance(vs, str):
+                vs = [vs]
+            out[i][kk].extend(v for v in (vs or []) if isinstance(v, str))
+    return out
+
+def _tidy_variants(src: str, got: List[str], limit: int) -> List[str]:
+    """清洗 + 去掉与原句/彼此重复的改写，截到 limit 条。"""
+    seen = {_sig(src)}
+    kept = []
+    for v in got:
+        q = _clean_query(v)
+        if not q:
+            continue
+        k = _sig(q)
+        if k in seen:
+            continue
+        seen.add(k)
+        kept.append(q)
+    return kept[:limit]
+
+def _call_variants_batch(llm, queries: List[str], kind_counts: Dict[str, int]) -> List[Dict[str, List[str]]]:
+    items = "\n".join(f"{i}. {q}" for i, q in enumerate(queries))
+    resp = (_prompt_for_variants(queries, kind_counts) | llm).invoke({"items": items})
+    text = getattr(resp, "content", str(resp))
+    parsed = _parse_variants(text, len(queries), kind_counts)
+    return [{k: _tidy_variants(q, p[k], n) for k, n in kind_counts.items()} for q, p in zip(queries, parsed)]
+
+def _call_variants_single(llm, query: str, kind: str, n: int) -> List[str]:
+    # 单条兜底：沿用逐类型生成，以原句作为场景描述
+    rows = _call_one_type(llm, query, kind, n)
+    return _tidy_variants(query, [r["query"] for r in rows], n)
+
+def gen_variants_batch(cfg: Dict[str, Any], queries: List[str], kind_counts: Dict[str, int]) -> List[Dict[str, List[str]]]:
+    """
+    批量改写：每 augment.batch_size 条原句 + 目标类型打包成一次 LLM 调用，按编号解析回原句；
+    解析缺失/数量不足的 (原句, 类型) 再逐条兜底补齐。返回值与 queries 一一对应：{类型: [改写...]}。
+    batch_size <= 1 时退化为逐条调用。
+    """
+    kind_counts = {str(k).upper(): int(n) for k, n in (kind_counts or {}).items() if int(n or 0) > 0}
+    if not queries or not kind_counts:
+        return [{} for _ in queries]
+    llm = get_llm(cfg, override=cfg.get("_override"))
+    batch_size = int(((cfg or {}).get("augment", {}) or {}).get("batch_size", 20))
+    workers = _max_concurrency(cfg)
+
+    results: List[Dict[str, List[str]]] = [{k: [] for k in kind_counts} for _ in queries]
+    if batch_size > 1:
+        chunks = [(s, queries[s:s + batch_size]) for s in range(0, len(queries), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as ex:
+            futs = [(s, ex.submit(_call_variants_batch, llm, qs, kind_counts)) for s, qs in chunks]
+            for s, f in futs:
+                try:
+                    got = f.result()
+                except Exception:
+                    continue  # 整批失败时全部交给逐条兜底
+                for j, g in enumerate(got):
+                    results[s + j] = g
 
+    # 逐条兜底：只补缺的 (原句, 类型)
+    missing = [(i, k, n - len(results[i][k])) for i in range(len(queries))
+               for k, n in kind_counts.items() if len(results[i][k]) < n]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as ex:
+            futs = [(i, k, ex.submit(_call_variants_single, llm, queries[i], k, m)) for i, k, m in missing]
+            for i, k, f in futs:
+                try:
+                    got = f.result()
+                except Exception:
+                    continue  # 单条也失败：该 (原句, 类型) 保留已有改写
+                merged = results[i][k] + got
+                results[i][k] = _tidy_variants(queries[i], merged, kind_counts[k])
+    return results
 
 
 def gen_for_inventory(cfg: Dict[str, Any], inv: Dict[str, Any]) -> List[Dict[str, Any]]:
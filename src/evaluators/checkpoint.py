@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+评测检查点：预测行按批追加写成 parquet 分片（part-00000.parquet, ...），进程中断后已写分片不丢。
+- 每个分片先写临时文件再原子改名，读到的分片总是完整的
+- 按 case_id 记录完成情况：--resume 时跳过已完成的用例；case_id 缺失或重复的行先由 RowKeys 合成稳定的行键
+- 分布式分片 --shard i/n：按 case_id 的 md5 取模划分，跨进程/机器稳定；各分片写各自子目录
+- load_predictions 递归读取目录下全部分片，同一用例重跑时后写覆盖先写，再交给 compute_metrics
+"""
+import hashlib
+import itertools
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+PRED_COLUMNS = ['case_id', 'intent_pred', 'confidence', 'topk', 'latency_ms', 'errors', 'status', 'finished_s']
+# 合成行键用到的列（都在 metrics.CASE_COLUMNS 里，出报告时只读这些列也能算出同样的键）
+ROW_KEY_COLUMNS = ['query', 'expected_intent', 'test_type', 'domain', 'group_id', 'step']
+
+
+def _key_cell(v: Any) -> str:
+    # csv 分块读取时同一列可能被推断成 int 或 float，统一写法保证两次读取算出同一个键
+    if v is None or (isinstance(v, float) and v != v):
+        return ''
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _missing_id(v: Any) -> bool:
+    return v is None or (isinstance(v, float) and v != v) or (isinstance(v, str) and not v.strip())
+
+
+class RowKeys:
+    """
+    用例行键：case_id 有值且第一次出现时原样使用；缺失或与前面重复时合成 'row-<md5 前 16 位>'
+    （取 ROW_KEY_COLUMNS 的内容），内容也完全相同的行再加出现序号。
+    按同样的顺序和过滤条件读同一份用例，逐批调用与整表调用得到同样的键，续跑 / 分片 / 出报告之间保持一致。
+    """
+
+    def __init__(self):
+        self._seen: Set[Any] = set()
+
+    def __call__(self, cases: pd.DataFrame) -> pd.DataFrame:
+        if 'case_id' not in cases.columns:
+            cases = cases.assign(case_id=None)
+        ids = cases['case_id'].tolist()
+        cols = [c for c in ROW_KEY_COLUMNS if c in cases.columns]
+        values = cases[cols].itertuples(index=False, name=None) if cols else itertools.repeat(())
+        out, changed = [], False
+        for cid, row in zip(ids, values):
+            if _missing_id(cid) or cid in self._seen:
+                base = 'row-' + hashlib.md5('\x1f'.join(map(_key_cell, row)).encode('utf-8')).hexdigest()[:16]
+                cid, n = base, 1
+                while cid in self._seen:
+                    cid = f'{base}-{n}'
+                    n += 1
+                changed = True
+            self._seen.add(cid)
+            out.append(cid)
+        return cases.assign(case_id=pd.Series(out, index=cases.index, dtype=object)) if changed else cases
+
+
+def parse_shard(spec: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'i/n' → (i, n)，0 <= i < n。"""
+    if not spec:
+        return None
+    i, n = (int(x) for x in spec.split('/', 1))
+    if n <= 0 or not 0 <= i < n:
+        raise ValueError(f'invalid shard {spec!r}, expected i/n with 0 <= i < n')
+    return i, n
+
+
+def shard_of(case_id: Any, n: int) -> int:
+    return int(hashlib.md5(str(case_id).encode('utf-8')).hexdigest()[:8], 16) % n
+
+
+def select_shard(cases: pd.DataFrame, shard: Optional[Tuple[int, int]], keys: Optional[Sequence[Any]] = None) -> pd.DataFrame:
+    """keys 缺省按 case_id 划分；多轮会话传 executor.session_keys(cases)，同一会话落在同一分片。"""
+    if shard is None:
+        return cases
+    i, n = shard
+    mask = [shard_of(c, n) == i for c in (cases['case_id'].tolist() if keys is None else keys)]
+    return cases[mask]
+
+
+class PredictionCheckpoint:
+    def __init__(self, root: str, shard: Optional[Tuple[int, int]] = None, every: int = 500, resume: bool = False):
+        self.root = Path(root)
+        self.dir = self.root / (f'shard-{shard[0]}-of-{shard[1]}' if shard else 'all')
+        self.every = max(1, int(every))
+        self._buf: List[Dict[str, Any]] = []
+        if not resume and self.dir.exists():
+            shutil.rmtree(self.dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._next = 1 + max((int(p.stem.split('-')[1]) for p in self.dir.glob('part-*.parquet')), default=-1)
+
+    def done_ids(self) -> Set[Any]:
+        df = _read_parts(self.dir, columns=['case_id'])
+        return set(df['case_id'].tolist())
+
+    def append(self, row: Dict[str, Any]) -> None:
+        self._buf.append(row)
+        if len(self._buf) >= self.every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buf:
+            return
+        path = self.dir / f'part-{self._next:05d}.parquet'
+        tmp = path.with_suffix('.parquet.tmp')
+        pd.DataFrame(self._buf, columns=PRED_COLUMNS).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        self._next += 1
+        self._buf = []
+
+
+def _read_parts(root: Path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    parts = sorted(Path(root).rglob('part-*.parquet'))
+    if not parts:
+        return pd.DataFrame(columns=columns or PRED_COLUMNS)
+    return pd.concat([pd.read_parquet(p, columns=columns) for p in parts], ignore_index=True)
+
+
+def load_predictions(root: str, cases: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    合并目录下所有分片的预测；给定 cases 时只保留其中的用例并按 cases 顺序排列。
+    cases 的 case_id 必须非空且唯一（先过一遍 RowKeys），否则多条用例会共用一条预测，直接报错。
+    """
+    df = _read_parts(Path(root)).drop_duplicates('case_id', keep='last')
+    if cases is None:
+        return df.reset_index(drop=True).reindex(columns=PRED_COLUMNS)
+    ids = cases['case_id']
+    if ids.isna().any() or ids.duplicated().any():
+        raise ValueError(f'cases.case_id has {int(ids.isna().sum())} missing and {int(ids.duplicated().sum())} duplicated values; key them with RowKeys first')
+    order = pd.DataFrame({'case_id': ids})
+    # 旧版分片缺少的列（status / finished_s）补空
+    return order.merge(df, on='case_id', how='inner').reindex(columns=PRED_COLUMNS)
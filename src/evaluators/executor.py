@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+评测执行器：把用例并发送往被测目标，按用例顺序收集预测。
+- ApiTarget：共享 requests.Session（keep-alive 连接池，大小随并发度），连接/读取超时分开设置
+- PyFuncTarget：'模块:函数' 只在构造时解析一次
+- run_predictions：有界线程池，在途请求数不超过 2×并发度，结果按输入顺序返回；
+  单条失败只记入该行 errors，不影响其余用例
+- 计时用 perf_counter_ns（latency_ms 为毫秒浮点）；每行带 status（ok / timeout / error）与
+  finished_s（相对本次运行开始的完成时刻，用于吞吐曲线），失败的请求同样记录耗时
+- 批量协议（batch_size > 1）：API 目标 POST [{case_id, query, context}, ...]，返回等长列表（或 {"results": [...]}）；
+  py-func 目标调用同模块的 predict_batch(queries, contexts)。目标不支持时自动退回逐条调用
+- 多轮会话（run_sessions）：同一 group_id 的用例按 step 顺序逐轮发送，前几轮的 query 与预测意图
+  作为 context['history'] 带给下一轮；不同会话之间并发，无 group_id 的用例照常（可批量）执行
+"""
+import importlib
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from .latency import elapsed_ms, is_timeout
+
+
+class BatchUnsupported(Exception):
+    """目标不支持批量协议（之后整轮评测都退回逐条调用）。"""
+
+
+def load_pyfunc(path: str) -> Callable[..., Dict[str, Any]]:
+    module, func = path.split(':', 1)
+    return getattr(importlib.import_module(module), func)
+
+
+class PyFuncTarget:
+    def __init__(self, path: str):
+        self.path = path
+        self.fn = load_pyfunc(path)
+        mod = importlib.import_module(path.split(':', 1)[0])
+        self.batch_fn = getattr(mod, 'predict_batch', None)
+        self.supports_batch = callable(self.batch_fn)
+        # 预测缓存的目标标识：模块带 __version__ 时一并计入
+        version = getattr(mod, '__version__', None)
+        self.name = f'{path}@{version}' if version else path
+
+    def __call__(self, query: str, context: Any = None) -> Dict[str, Any]:
+        return self.fn(query=query, context=context)
+
+    def predict_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self.supports_batch:
+            raise BatchUnsupported(self.path)
+        return list(self.batch_fn([x['query'] for x in items], [x['context'] for x in items]))
+
+    def close(self) -> None:
+        pass
+
+
+class ApiTarget:
+    """POST {query, context?} → JSON；连接池大小取并发度，失败不重试（错误计入该用例）。"""
+
+    _UNSUPPORTED_STATUS = {400, 404, 405, 415, 422}
+
+    def __init__(self, url: str, timeout: float = 10.0, connect_timeout: float = 3.0, pool_size: int = 16):
+        self.url = url
+        self.name = url
+        self.supports_batch = True
+        self.timeout = (float(connect_timeout), float(timeout))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size)), max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __call__(self, query: str, context: Any = None) -> Dict[str, Any]:
+        payload = {'query': query}
+        if context:
+            payload['context'] = context
+        r = self.session.post(self.url, json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def predict_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        payload = [{'case_id': x['case_id'], 'query': x['query'], **({'context': x['context']} if x['context'] else {})}
+                   for x in items]
+        r = self.session.post(self.url, json=payload, timeout=self.timeout)
+        if r.status_code in self._UNSUPPORTED_STATUS:
+            raise BatchUnsupported(f'HTTP {r.status_code}')
+        r.raise_for_status()
+        body = r.json()
+        if isinstance(body, dict):
+            body = body.get('results', body.get('predictions'))
+        if not isinstance(body, list):
+            raise BatchUnsupported('response is not a list')
+        return body
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def make_target(api_url: Optional[str] = None, py_func: Optional[str] = None, concurrency: int = 1,
+                timeout: float = 10.0, connect_timeout: float = 3.0):
+    if api_url:
+        return ApiTarget(api_url, timeout=timeout, connect_timeout=connect_timeout, pool_size=concurrency)
+    return PyFuncTarget(py_func)
+
+
+# ---------------- 预测行 ----------------
+
+def _topk_json(res: Dict[str, Any]) -> str:
+    items = res.get('top_k', res.get('topk', [])) or []
+    return json.dumps([x.get('intent', x) if isinstance(x, dict) else x for x in items], ensure_ascii=False)
+
+
+def pred_row(case_id: Any, res: Dict[str, Any], latency_ms: float, finished_s: Optional[float] = None) -> Dict[str, Any]:
+    return {'case_id': case_id, 'intent_pred': res.get('intent', ''), 'confidence': res.get('confidence', 0.0),
+            'topk': _topk_json(res), 'latency_ms': latency_ms, 'errors': '', 'status': 'ok', 'finished_s': finished_s}
+
+
+def error_row(case_id: Any, err: Exception, latency_ms: Optional[float] = None,
+              finished_s: Optional[float] = None) -> Dict[str, Any]:
+    return {'case_id': case_id, 'intent_pred': '', 'confidence': 0.0, 'topk': '[]',
+            'latency_ms': latency_ms, 'errors': str(err) or type(err).__name__,
+            'status': 'timeout' if is_timeout(err) else 'error', 'finished_s': finished_s}
+
+
+def _context_of(v: Any) -> Any:
+    # parquet/csv 读出的缺失值是 NaN/None，统一成 None
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    return v
+
+
+def _group_of(v: Any) -> Optional[str]:
+    v = _context_of(v)
+    return None if v is None or str(v).strip() == '' else str(v)
+
+
+def _step_of(v: Any) -> Optional[float]:
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if v != v else v
+
+
+def case_inputs(cases: pd.DataFrame) -> List[Dict[str, Any]]:
+    """每条用例 → {case_id, query, context, group_id, step}；缺失的 context/group_id/step 统一成 None。"""
+    def col(name):
+        return cases[name].tolist() if name in cases.columns else [None] * len(cases)
+    return [{'case_id': cid, 'query': str(q), 'context': _context_of(c), 'group_id': _group_of(g), 'step': _step_of(st)}
+            for cid, q, c, g, st in zip(cases['case_id'].tolist(), cases['query'].tolist(), col('context'),
+                                       col('group_id'), col('step'))]
+
+
+def session_keys(cases: pd.DataFrame) -> List[Any]:
+    """分片/续跑用的会话键：有 group_id 的取 group_id，否则取 case_id（同一会话总落在同一分片）。"""
+    return [_group_of(g) or cid for cid, g in zip(cases['case_id'].tolist(),
+                                                  cases['group_id'].tolist() if 'group_id' in cases.columns else [None] * len(cases))]
+
+
+# ---------------- 执行 ----------------
+
+def _align(items: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """批量结果带 case_id 时按 case_id 对齐，否则要求与输入等长、同序。"""
+    by_id = {r.get('case_id'): r for r in results if isinstance(r, dict) and 'case_id' in r}
+    if by_id:
+        missing = [x['case_id'] for x in items if x['case_id'] not in by_id]
+        if missing:
+            raise ValueError(f'batch response missing {len(missing)} case(s)')
+        return [by_id[x['case_id']] for x in items]
+    if len(results) != len(items):
+        raise ValueError(f'batch response has {len(results)} results for {len(items)} cases')
+    return results
+
+
+def _predict_one(target, item: Dict[str, Any], origin_ns: int) -> Dict[str, Any]:
+    t0 = time.perf_counter_ns()
+    try:
+        res = target(item['query'], item['context'])
+        t1 = time.perf_counter_ns()
+        return pred_row(item['case_id'], res, elapsed_ms(t0, t1), (t1 - origin_ns) / 1e9)
+    except Exception as e:
+        t1 = time.perf_counter_ns()
+        return error_row(item['case_id'], e, elapsed_ms(t0, t1), (t1 - origin_ns) / 1e9)
+
+
+def _predict_many(target, batch: List[Dict[str, Any]], origin_ns: int) -> List[Dict[str, Any]]:
+    """一批用例：目标支持批量协议时一次调用（每行延迟记为整批耗时），否则逐条调用。"""
+    if len(batch) > 1 and getattr(target, 'supports_batch', False):
+        t0 = time.perf_counter_ns()
+        try:
+            results = _align(batch, target.predict_batch(batch))
+            t1 = time.perf_counter_ns()
+            return [pred_row(x['case_id'], r, elapsed_ms(t0, t1), (t1 - origin_ns) / 1e9) for x, r in zip(batch, results)]
+        except BatchUnsupported as e:
+            if target.supports_batch:
+                target.supports_batch = False
+                print(f'[eval] target does not support batch calls ({e}); falling back to single calls', file=sys.stderr)
+        except Exception as e:
+            t1 = time.perf_counter_ns()
+            return [error_row(x['case_id'], e, elapsed_ms(t0, t1), (t1 - origin_ns) / 1e9) for x in batch]
+    return [_predict_one(target, x, origin_ns) for x in batch]
+
+
+def _with_history(own: Any, history: List[Dict[str, Any]]) -> Any:
+    if not history:
+        return own
+    if isinstance(own, dict):
+        return {**own, 'history': history}
+    return {'history': history, **({'context': own} if own else {})}
+
+
+def _predict_session(target, turns: List[Dict[str, Any]], origin_ns: int,
+                     max_history: Optional[int] = None) -> List[Dict[str, Any]]:
+    """一个会话逐轮发送；每轮带上之前各轮的 query 与预测意图（不带期望意图）。"""
+    rows, history = [], []
+    for x in turns:
+        ctx_history = history[-max_history:] if max_history else history
+        row = _predict_one(target, {**x, 'context': _with_history(x['context'], ctx_history)}, origin_ns)
+        rows.append(row)
+        history.append({'query': x['query'], 'intent': row['intent_pred']})
+    return rows
+
+
+def _run_tasks(n: int, tasks: List[Tuple[List[int], Callable[[], List[Dict[str, Any]]]]], concurrency: int,
+               on_done: Optional[Callable[[int, Dict[str, Any]], None]]) -> List[Dict[str, Any]]:
+    """tasks 为 (结果下标列表, 无参任务)；任务返回与下标等长的预测行。"""
+    out: List[Optional[Dict[str, Any]]] = [None] * n
+
+    def _collect(idx: List[int], rows: List[Dict[str, Any]]) -> None:
+        for i, row in zip(idx, rows):
+            out[i] = row
+            if on_done:
+                on_done(i, row)
+
+    if concurrency <= 1:
+        for idx, fn in tasks:
+            _collect(idx, fn())
+        return out
+
+    window = 2 * concurrency
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        it = iter(tasks)
+        pending = {}
+        while True:
+            # 补满在途窗口：避免一次性提交上万个 future
+            for idx, fn in it:
+                pending[ex.submit(fn)] = idx
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                _collect(pending.pop(f), f.result())
+    return out
+
+
+def _batch_tasks(target, items: List[Dict[str, Any]], idx: List[int], batch_size: int, origin_ns: int):
+    size = max(1, int(batch_size))
+    return [(idx[i:i + size], lambda b=[items[j] for j in idx[i:i + size]]: _predict_many(target, b, origin_ns))
+            for i in range(0, len(idx), size)]
+
+
+def run_predictions(items: List[Dict[str, Any]], target, concurrency: int = 1, batch_size: int = 1,
+                    on_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                    origin_ns: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    items 来自 case_inputs；每条独立发送，返回与 items 等长、同序的预测行。
+    batch_size > 1 时每 batch_size 条作为一个任务（并发度按批计）。
+    on_done(index, row) 在调用线程中按完成顺序回调（进度展示用）。
+    origin_ns 为 finished_s 的零点（time.perf_counter_ns()）；分多次调用时传同一个值，吞吐曲线才连续，缺省取本次调用开始。
+    """
+    origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+    tasks = _batch_tasks(target, items, list(range(len(items))), batch_size, origin_ns)
+    return _run_tasks(len(items), tasks, concurrency, on_done)
+
+
+def session_groups(items: List[Dict[str, Any]]) -> Tuple[List[List[int]], List[int]]:
+    """→ (各会话按 step 排好序的下标列表, 无 group_id 的下标)；step 缺失时保持原有先后。"""
+    groups: Dict[str, List[int]] = {}
+    singles = []
+    for i, x in enumerate(items):
+        if x.get('group_id') is None:
+            singles.append(i)
+        else:
+            groups.setdefault(x['group_id'], []).append(i)
+    inf = float('inf')
+    ordered = [sorted(g, key=lambda i: (items[i]['step'] if items[i].get('step') is not None else inf, i))
+               for g in groups.values()]
+    return ordered, singles
+
+
+def run_sessions(items: List[Dict[str, Any]], target, concurrency: int = 1, batch_size: int = 1,
+                 on_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                 max_history: Optional[int] = None, origin_ns: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    会话感知的 run_predictions：每个 group_id 是一个任务（组内顺序执行、组间并发，并发度按会话计），
+    无 group_id 的用例按 batch_size 分批。返回值、回调与 origin_ns 约定同 run_predictions。
+    """
+    origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+    groups, singles = session_groups(items)
+    tasks = [(g, lambda g=g: _predict_session(target, [items[i] for i in g], origin_ns, max_history)) for g in groups]
+    tasks += _batch_tasks(target, items, singles, batch_size, origin_ns)
+    return _run_tasks(len(items), tasks, concurrency, on_done)
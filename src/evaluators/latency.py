@@ -0,0 +1,145 @@
+import math
+import numpy as np, pandas as pd
+
+# 请求计时：perf_counter_ns 起止差，存为毫秒浮点（微秒精度）；状态 ok / timeout / error / cached
+STATUSES=('ok','timeout','error','cached')
+QUANTILES=(0.5,0.9,0.95,0.99,0.999)
+LENGTH_BINS=(0,5,10,20,40,math.inf)
+
+def elapsed_ms(t0_ns, t1_ns):
+    return (t1_ns-t0_ns)/1e6
+
+def is_timeout(err):
+    """requests / 标准库 / concurrent.futures 的各类超时都算 timeout。"""
+    try:
+        import requests
+        if isinstance(err, requests.exceptions.Timeout): return True
+    except Exception:
+        pass
+    return isinstance(err, TimeoutError) or 'timed out' in str(err).lower()
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数-线性直方图（微秒整数）：
+    每个 2 的幂区间再等分 2^(sub_bits-1) 个桶，相对误差不超过 1/2^(sub_bits-1)；
+    记录为 O(1) 的 bincount，分位数从累计计数中查，合并即计数相加。
+    """
+
+    def __init__(self, sub_bits=8, max_us=3_600_000_000):
+        self.sub_bits=int(sub_bits)
+        self.sub=1<<self.sub_bits; self.half=self.sub>>1
+        self.n_buckets=self._index(np.array([max_us], dtype=np.int64))[0]+1
+        self.counts=np.zeros(self.n_buckets, dtype=np.int64)
+        self.total=0; self.sum_us=0; self.min_us=None; self.max_us=None
+
+    def _index(self, v):
+        v=np.maximum(v, 0)
+        _, bl=np.frexp(v.astype(np.float64))  # bl = bit_length(v)
+        e=np.maximum(0, bl.astype(np.int64)-self.sub_bits)
+        return np.where(e==0, v, self.sub+(e-1)*self.half+((v>>e)-self.half))
+
+    def _upper(self, idx):
+        """桶 → 该桶可表示的最大值（与 HDR 的 highest-equivalent 一致）。"""
+        idx=np.asarray(idx, dtype=np.int64)
+        e=np.where(idx<self.sub, 0, (idx-self.sub)//self.half+1)
+        low=np.where(idx<self.sub, idx, ((idx-self.sub)%self.half+self.half)<<e)
+        return low+(1<<e)-1
+
+    def record_ms(self, values_ms):
+        v=np.asarray(values_ms, dtype=np.float64)
+        v=v[np.isfinite(v)]
+        if not len(v): return self
+        us=np.rint(v*1000).astype(np.int64)
+        idx=np.minimum(self._index(us), self.n_buckets-1)
+        self.counts+=np.bincount(idx, minlength=self.n_buckets)
+        self.total+=len(us); self.sum_us+=int(us.sum())
+        self.min_us=int(us.min()) if self.min_us is None else min(self.min_us, int(us.min()))
+        self.max_us=int(us.max()) if self.max_us is None else max(self.max_us, int(us.max()))
+        return self
+
+    def record_corrected_ms(self, values_ms, expected_interval_ms, max_fill=10000):
+        """
+        协调遗漏校正（同 HdrHistogram recordValueWithExpectedInterval）：
+        一个耗时 v 的请求挡住了本该按 expected_interval 发出的后续请求，补记 v-Δ, v-2Δ, ... (>0)。
+        """
+        v=np.asarray(values_ms, dtype=np.float64); v=v[np.isfinite(v)]
+        self.record_ms(v)
+        if not expected_interval_ms or expected_interval_ms<=0 or not len(v): return self
+        k=np.minimum(np.floor(v/expected_interval_ms).astype(np.int64), max_fill)
+        k=np.where(v-k*expected_interval_ms>0, k, k-1).clip(min=0)
+        if k.sum()==0: return self
+        j=np.arange(int(k.sum()))-np.repeat(np.cumsum(k)-k, k)+1
+        return self.record_ms(np.repeat(v, k)-j*expected_interval_ms)
+
+    def merge(self, other):
+        self.counts+=other.counts; self.total+=other.total; self.sum_us+=other.sum_us
+        for a in ('min_us','max_us'):
+            x,y=getattr(self,a),getattr(other,a)
+            setattr(self, a, y if x is None else (x if y is None else (min if a=='min_us' else max)(x,y)))
+        return self
+
+    def percentile_ms(self, q):
+        if not self.total: return None
+        cum=np.cumsum(self.counts)
+        i=int(np.searchsorted(cum, max(1, math.ceil(q*self.total))))
+        return min(int(self._upper(i)), self.max_us)/1000.0
+
+    def summary(self):
+        if not self.total: return {'count':0}
+        out={'count':int(self.total),'mean_ms':self.sum_us/self.total/1000.0,'min_ms':self.min_us/1000.0,'max_ms':self.max_us/1000.0}
+        for q in QUANTILES: out[_qname(q)]=self.percentile_ms(q)
+        return out
+
+def _qname(q):
+    return 'p'+(f"{q*100:g}".replace('.',''))+'_ms'
+
+def _status(df):
+    if 'status' in df.columns: return df['status'].astype(object).where(df['status'].notna(), 'ok')
+    # 旧版预测文件没有 status：有错误信息按 error，其余按 ok
+    return pd.Series(np.where(df['is_error'], 'error', 'ok'), index=df.index)
+
+def _hist_table(df, key, name):
+    rows=[]
+    for k, sub in df.groupby(key, sort=True, observed=True):
+        rows.append({name: str(k), **LatencyHistogram().record_ms(sub['latency_ms']).summary()})
+    return rows
+
+def throughput_series(finished_s, max_points=60):
+    """完成时刻（相对运行开始的秒数）→ 每个时间桶的完成数与 QPS；桶宽自适应，最多 max_points 个点。"""
+    t=np.asarray(finished_s, dtype=np.float64); t=t[np.isfinite(t)]
+    if not len(t): return []
+    span=max(float(t.max()), 1e-9)
+    width=max(1.0, span/max_points) if span>=1.0 else span/max(1, min(max_points, len(t)))
+    b=np.floor(t/width).astype(np.int64)
+    counts=np.bincount(b)
+    # 最后一个桶只覆盖到最后完成时刻，按实际宽度算 QPS
+    widths=np.minimum(width, np.maximum(span-np.arange(len(counts))*width, 1e-9))
+    return [{'t_s':round(i*width, 3),'completed':int(c),'qps':c/w} for i,(c,w) in enumerate(zip(counts, widths))]
+
+def latency_report(df):
+    """
+    prepare() 的结果 → 延迟/吞吐报告：
+    - overall：本次实际请求（status=ok）的直方图分位数；超时与错误单独计数，命中缓存的不计入
+    - by_test_type / by_query_len：分组直方图分位数
+    - throughput：按完成时刻分桶的 QPS 序列与整体 QPS（多进程分片合并时各自以本进程开始为 0 点）
+    """
+    if 'latency_ms' not in df.columns: return {}
+    st=_status(df)
+    counts={s:int((st==s).sum()) for s in STATUSES}
+    ok=df[st.eq('ok') & df['latency_ms'].notna()]
+    out={'status_counts':counts,
+         'timeout_rate':counts['timeout']/len(df) if len(df) else None,
+         'overall':LatencyHistogram().record_ms(ok['latency_ms']).summary()}
+    if 'test_type' in ok.columns: out['by_test_type']=_hist_table(ok, 'test_type', 'test_type')
+    if 'query' in ok.columns and len(ok):
+        qlen=ok['query'].astype(str).str.len()
+        bins=pd.cut(qlen, list(LENGTH_BINS), right=True, labels=[f"{int(a)+1}-{b if b!=math.inf else '∞'}" for a,b in zip(LENGTH_BINS[:-1], LENGTH_BINS[1:])])
+        out['by_query_len']=_hist_table(ok.assign(_qlen=bins), '_qlen', 'query_len')
+    if 'finished_s' in df.columns:
+        fin=df.loc[st.ne('cached'), 'finished_s']
+        fin=fin[fin.notna()]
+        if len(fin):
+            series=throughput_series(fin)
+            out['throughput']={'requests':int(len(fin)),'duration_s':float(fin.max()),'qps':len(fin)/max(float(fin.max()),1e-9),'series':series}
+    return out
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+压测负载生成：用生成好的用例集按目标 QPS（开环）或固定并发（闭环）回放到被测目标。
+- 开环：泊松到达（指数分布的到达间隔），按计划时刻投递，不等上一个请求返回；
+  延迟从“计划发出时刻”算起，服务端变慢导致的排队也计入（天然避免协调遗漏）
+- 闭环：N 个工作线程各自串行收发；延迟按 HdrHistogram 的期望间隔方式补记被挡住的样本
+- 每个压力档位一行汇总（实际吞吐、分位数、超时/错误率），find_saturation 找出首个不达标的档位
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .latency import LatencyHistogram, QUANTILES, _qname, elapsed_ms, is_timeout
+
+
+def poisson_schedule(qps: float, duration_s: float, seed: Optional[int] = None) -> np.ndarray:
+    """[0, duration_s) 内的泊松到达时刻（秒）。"""
+    rng = np.random.default_rng(seed)
+    n = max(1, int(qps * duration_s * 1.2) + 10)
+    t = np.cumsum(rng.exponential(1.0 / qps, size=n))
+    while t[-1] < duration_s:
+        t = np.concatenate([t, t[-1] + np.cumsum(rng.exponential(1.0 / qps, size=n))])
+    return t[t < duration_s]
+
+
+def _call(target, item: Dict[str, Any], origin_ns: int, intended_ns: int) -> Dict[str, Any]:
+    sent = time.perf_counter_ns()
+    status, err = 'ok', ''
+    try:
+        target(item['query'], item['context'])
+    except Exception as e:
+        status, err = ('timeout' if is_timeout(e) else 'error'), (str(e) or type(e).__name__)
+    done = time.perf_counter_ns()
+    return {'case_id': item['case_id'], 'intended_s': (intended_ns - origin_ns) / 1e9, 'sent_s': (sent - origin_ns) / 1e9,
+            'done_s': (done - origin_ns) / 1e9, 'latency_ms': elapsed_ms(intended_ns, done),
+            'service_ms': elapsed_ms(sent, done), 'status': status, 'errors': err}
+
+
+def run_open_loop(target, items: List[Dict[str, Any]], qps: float, duration_s: float,
+                  max_in_flight: int = 256, seed: Optional[int] = None) -> pd.DataFrame:
+    """
+    按泊松计划投递；工作线程用满时请求在队列里等待，等待时间计入 latency_ms（service_ms 只含收发）。
+    用例循环使用。
+    """
+    plan = poisson_schedule(qps, duration_s, seed)
+    cycle = itertools.cycle(items)
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, int(max_in_flight))) as ex:
+        origin = time.perf_counter_ns()
+        for t in plan:
+            intended = origin + int(t * 1e9)
+            lag = (intended - time.perf_counter_ns()) / 1e9
+            if lag > 0:
+                time.sleep(lag)
+            futures.append(ex.submit(_call, target, next(cycle), origin, intended))
+    return pd.DataFrame([f.result() for f in futures])
+
+
+def run_closed_loop(target, items: List[Dict[str, Any]], concurrency: int, duration_s: float) -> pd.DataFrame:
+    """concurrency 个线程各自“发一个、等返回、再发下一个”，持续 duration_s 秒。"""
+    cycle = itertools.cycle(items)
+    lock = threading.Lock()
+    rows: List[Dict[str, Any]] = []
+    origin = time.perf_counter_ns()
+    stop = origin + int(duration_s * 1e9)
+
+    def _worker():
+        local = []
+        while True:
+            now = time.perf_counter_ns()
+            if now >= stop:
+                break
+            with lock:
+                item = next(cycle)
+            local.append(_call(target, item, origin, now))
+        with lock:
+            rows.extend(local)
+
+    threads = [threading.Thread(target=_worker, daemon=True) for _ in range(max(1, int(concurrency)))]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return pd.DataFrame(rows)
+
+
+# ---------------- 汇总 ----------------
+
+def step_summary(samples: pd.DataFrame, mode: str, level: float, duration_s: float,
+                 expected_interval_ms: Optional[float] = None) -> Dict[str, Any]:
+    """
+    一个压力档位的汇总。分位数只统计成功请求；
+    闭环的 expected_interval_ms 缺省取本档位服务耗时中位数（“正常节奏”下一个线程的发送间隔）。
+    """
+    n = len(samples)
+    st = samples['status'] if n else pd.Series([], dtype=object)
+    ok = samples[st.eq('ok')] if n else samples
+    span = max(float(samples['done_s'].max()), duration_s) if n else duration_s
+    # 泊松到达在短时长下波动不小：按实际发出数算 offered，而不是名义 QPS
+    row: Dict[str, Any] = {'mode': mode, 'level': level, 'offered_qps': n / duration_s if mode == 'open' else None,
+                           'sent': n, 'ok': int(len(ok)), 'timeout': int(st.eq('timeout').sum()),
+                           'error': int(st.eq('error').sum()), 'achieved_qps': len(ok) / span if span else None,
+                           'error_rate': float((~st.eq('ok')).mean()) if n else None}
+    hist = LatencyHistogram()
+    if mode == 'closed' and len(ok):
+        interval = expected_interval_ms or float(ok['service_ms'].median())
+        hist.record_corrected_ms(ok['service_ms'], interval)
+        row['expected_interval_ms'] = interval
+    else:
+        hist.record_ms(ok['latency_ms'] if len(ok) else [])
+    lat = hist.summary()
+    svc = LatencyHistogram().record_ms(ok['service_ms'] if len(ok) else []).summary()
+    for q in QUANTILES:
+        row[_qname(q)] = lat.get(_qname(q))
+    row['service_p50_ms'] = svc.get('p50_ms')
+    row['service_p99_ms'] = svc.get('p99_ms')
+    if mode == 'open' and n:
+        row['dispatch_lag_p99_ms'] = float(((samples['sent_s'] - samples['intended_s']) * 1000).quantile(0.99))
+    return row
+
+
+def find_saturation(steps: List[Dict[str, Any]], slo_p99_ms: Optional[float] = None,
+                    max_error_rate: float = 0.01, min_achieved_ratio: float = 0.9,
+                    min_gain: float = 0.05) -> Dict[str, Any]:
+    """
+    按档位顺序找第一个不达标的档位：
+    - 错误+超时率超过 max_error_rate，或 p99 超过 slo_p99_ms
+    - 开环：实际吞吐不到 offered（本档实际发出速率）的 min_achieved_ratio
+    - 闭环：加并发后吞吐增幅不到 min_gain（吞吐已到顶、只在排队）
+    """
+    last_ok, prev = None, None
+    for s in steps:
+        why = []
+        if s['error_rate'] is not None and s['error_rate'] > max_error_rate:
+            why.append(f"error_rate {s['error_rate']:.2%} > {max_error_rate:.2%}")
+        if slo_p99_ms and (s.get('p99_ms') or 0) > slo_p99_ms:
+            why.append(f"p99 {s['p99_ms']:.1f} ms > {slo_p99_ms:g} ms")
+        if s['mode'] == 'open' and (s['achieved_qps'] or 0) < min_achieved_ratio * s['offered_qps']:
+            why.append(f"achieved {s['achieved_qps'] or 0:.1f} < {min_achieved_ratio:g} × offered {s['offered_qps']:.1f} QPS")
+        if s['mode'] == 'closed' and prev is not None and (s['achieved_qps'] or 0) < (1 + min_gain) * (prev['achieved_qps'] or 0):
+            why.append(f"throughput gain < {min_gain:.0%} over previous level")
+        if why:
+            return {'saturated_at': s['level'], 'reasons': why,
+                    'max_sustainable_level': last_ok['level'] if last_ok else None,
+                    'max_sustainable_qps': last_ok['achieved_qps'] if last_ok else None}
+        last_ok, prev = s, s
+    return {'saturated_at': None, 'reasons': [],
+            'max_sustainable_level': last_ok['level'] if last_ok else None,
+            'max_sustainable_qps': last_ok['achieved_qps'] if last_ok else None}
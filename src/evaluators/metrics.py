@@ -1,23 +1,132 @@
-import pandas as pd, json
+import pandas as pd, numpy as np, json
+from .slicing import compute_slices
+from .latency import latency_report, QUANTILES, _qname
 SAFE={'拒答','不支持','安全拦截','闲聊'}
+NOISY={'TYPO','SLANG','DIALECT','NOISE'}
+# compute_metrics 用到的用例列（含默认切片维度；query 只用于按长度分桶）：出报告时只读这些列
+CASE_COLUMNS=['case_id','query','expected_intent','test_type','domain','difficulty','tags','group_id','step']
 
-def compute_metrics(cases, preds, k=3):
+# ---------------- 向量化准备：意图整数编码 + top-k 矩阵 ----------------
+
+def _parse_topk(x):
+    try: v=json.loads(x)
+    except Exception: return ()
+    return tuple(v) if isinstance(v, list) else ()
+
+def _lists_to_matrix(lists, k, index):
+    """若干意图列表 → (n, k) 意图 id 矩阵：展平后一次 get_indexer，再按 (行, 列) 散射回矩阵。"""
+    lens=np.fromiter((min(len(x), k) for x in lists), dtype=np.int64, count=len(lists))
+    m=np.full((len(lists), k), -1, dtype=np.int64)
+    if lens.sum()==0: return m
+    flat=pd.Index([v for x in lists for v in x[:k]], dtype=object)
+    rows=np.repeat(np.arange(len(lists)), lens)
+    cols=np.arange(len(rows))-np.repeat(np.cumsum(lens)-lens, lens)
+    m[rows, cols]=index.get_indexer(flat)
+    return m
+
+def _arrow_matrix(values, k, index):
+    """list<string> 列（parquet 读出的数组/列表）：用 Arrow 计算内核截取前 k 个并展平。"""
+    import pyarrow as pa, pyarrow.compute as pc
+    arr=pa.array(values, type=pa.list_(pa.string()))
+    sliced=pc.list_slice(arr, 0, k)
+    flat=pc.list_flatten(sliced).to_numpy(zero_copy_only=False)
+    rows=pc.list_parent_indices(sliced).to_numpy()
+    starts=pc.fill_null(pc.list_value_length(sliced), 0).to_numpy().cumsum()
+    cols=np.arange(len(rows))-np.concatenate([[0], starts[:-1]])[rows]
+    m=np.full((len(values), k), -1, dtype=np.int64)
+    m[rows, cols]=index.get_indexer(pd.Index(flat, dtype=object))
+    return m
+
+def topk_matrix(col, k, index):
+    """
+    top-k 列 → (n, k) 的意图 id 矩阵（缺位为 -1）；index 为意图 → id 的 pd.Index，未登记的意图记 -1。
+    - JSON 字符串列：先 factorize，每个不同取值只解析一次，再按编码取行
+    - 列表/数组列（parquet list<string>）：走 Arrow 内核
+    """
+    s=pd.Series(col).reset_index(drop=True)
+    kind='string' if isinstance(s.dtype, pd.StringDtype) else pd.api.types.infer_dtype(s, skipna=True)
+    if kind in ('string', 'empty'):
+        codes, uniq=pd.factorize(s)
+        m=np.full((len(s), k), -1, dtype=np.int64)
+        ok=codes>=0
+        if ok.any(): m[ok]=_lists_to_matrix([_parse_topk(x) for x in uniq], k, index)[codes[ok]]
+        return m
+    values=[None if x is None or (isinstance(x, float) and x!=x) else x for x in s]
+    try:
+        if kind=='mixed' and any(isinstance(x, str) for x in values): raise TypeError('mixed topk')
+        return _arrow_matrix(values, k, index)
+    except Exception:
+        # 混合类型（字符串与列表并存等）：逐行兜底
+        return _lists_to_matrix([_parse_topk(x) if isinstance(x, str) else (tuple(x) if isinstance(x, (list, tuple, np.ndarray)) else ()) for x in values], k, index)
+
+def prepare(cases, preds, k=3):
+    """
+    合并用例与预测，并一次性算好逐行命中：
+    exp_id / pred_id 为意图整数编码（同一 intents 索引），topk_hit 由 (n, k) 矩阵与 exp_id 比较得到。
+    返回 (df, intents)；df 附带 top1_hit / topk_hit / is_error 三列布尔值。
+    """
     df=cases.merge(preds,on='case_id',how='left',suffixes=('','_preds'))
+    exp_id, intents=pd.factorize(df['expected_intent'], use_na_sentinel=True)
+    intents=pd.Index(intents, dtype=object)
+    pred_id=intents.get_indexer(df['intent_pred']) if 'intent_pred' in df else np.full(len(df), -1)
+    tk=topk_matrix(df['topk'] if 'topk' in df else [None]*len(df), k, intents)
+    df['top1_hit']=(exp_id>=0) & (pred_id==exp_id)
+    df['topk_hit']=(exp_id>=0) & (tk==exp_id[:,None]).any(axis=1)
+    df['is_error']=(df['errors'].notna() & df['errors'].ne('')).to_numpy(dtype=bool) if 'errors' in df else np.zeros(len(df), dtype=bool)
+    df['exp_id']=exp_id; df['pred_id']=pred_id
+    return df, intents
+
+# ---------------- 指标 ----------------
+
+def compute_metrics(cases, preds, k=3, slices=None):
+    """全局指标 + 切片明细（slices 为维度组合列表，缺省见 slicing.DEFAULT_SLICES）；结果可直接写 JSON，save_report 只做渲染。"""
+    df,intents=prepare(cases, preds, k)
     total=len(df)
-    df['topk_hit']=df.apply(lambda r: (r['expected_intent'] in (json.loads(r['topk']) if isinstance(r['topk'],str) else (r['topk'] or []))[:k]), axis=1)
-    top1=(df['expected_intent']==df['intent_pred']).mean()
-    topk=df['topk_hit'].mean()
-    def acc_where(mask):
-        sub=df[mask]
-        return None if len(sub)==0 else (sub['expected_intent']==sub['intent_pred']).mean()
-    acc_base=acc_where(df['test_type']=='BASE')
-    acc_noise=acc_where(df['test_type'].isin(['TYPO','SLANG','DIALECT','NOISE']))
+    top1=df['top1_hit'].mean() if total else None
+    topk=df['topk_hit'].mean() if total else None
+    # 基础/噪声两组的准确率：一次 groupby 得到
+    tt=df['test_type']
+    group=pd.Series(np.where(tt.eq('BASE'), 'BASE', np.where(tt.isin(NOISY), 'NOISY', None)), index=df.index)
+    acc=df['top1_hit'].groupby(group).mean()
+    acc_base=acc.get('BASE'); acc_noise=acc.get('NOISY')
     robust_drop=None if (acc_base is None or acc_noise is None) else max(0.0, acc_base-acc_noise)
-    return {'total':int(total),'accuracy_top1':float(top1) if pd.notna(top1) else None,'topk_coverage':float(topk) if pd.notna(topk) else None,'base_accuracy':None if acc_base is None else float(acc_base),'noisy_accuracy':None if acc_noise is None else float(acc_noise),'robustness_drop':None if robust_drop is None else float(robust_drop)}
+    out={'total':int(total),'accuracy_top1':float(top1) if top1 is not None and pd.notna(top1) else None,'topk_coverage':float(topk) if topk is not None and pd.notna(topk) else None,'base_accuracy':None if acc_base is None else float(acc_base),'noisy_accuracy':None if acc_noise is None else float(acc_noise),'robustness_drop':None if robust_drop is None else float(robust_drop)}
+    out.update(compute_slices(df, intents, slices))
+    out['latency']=latency_report(df)
+    return out
+
+def _md_table(rows, pct_cols=('accuracy','topk','error_rate')):
+    if not rows: return []
+    cols=list(rows[0].keys())
+    def fmt(c, v):
+        if v is None or (isinstance(v, float) and v!=v): return '-'
+        if c in pct_cols: return f"{v*100:.2f}%"
+        if isinstance(v, float): return f"{v:.1f}"
+        return str(v).replace('|','\\|')
+    return ['| '+' | '.join(cols)+' |', '|'+'---|'*len(cols)]+['| '+' | '.join(fmt(c, r.get(c)) for c in cols)+' |' for r in rows]
 
 def save_report(metrics, path_md):
     def pct(x): return '-' if x is None else f"{x*100:.2f}%"
     lines=['# 报告','',f"- 用例总数：{metrics['total']}",f"- Top-1 准确率：{pct(metrics['accuracy_top1'])}",f"- Top-K 覆盖率：{pct(metrics['topk_coverage'])}",f"- 基础场景准确率：{pct(metrics['base_accuracy'])}",f"- 噪声场景准确率：{pct(metrics['noisy_accuracy'])}",f"- 鲁棒性降幅：{pct(metrics['robustness_drop'])}"]
+    for name, rows in (metrics.get('slices') or {}).items():
+        lines+=['',f"## 切片：{name}",'']+_md_table(rows)
+    if metrics.get('sessions'):
+        lines+=['','## 多轮会话（按 group_id）','']+_md_table(metrics['sessions'], pct_cols=('session_accuracy','turn_accuracy'))
+    lat=metrics.get('latency') or {}
+    if lat:
+        ov=lat.get('overall') or {}; sc=lat.get('status_counts') or {}
+        def ms(x): return '-' if x is None else f"{x:.1f} ms"
+        lines+=['','## 延迟与吞吐','',f"- 请求状态：" + '，'.join(f"{k} {v}" for k,v in sc.items()),f"- 超时率：{pct(lat.get('timeout_rate'))}",f"- 实际请求数（status=ok）：{ov.get('count',0)}，均值 {ms(ov.get('mean_ms'))}，最大 {ms(ov.get('max_ms'))}",'- 分位数：'+'，'.join(f"{_qname(q)[:-3]} {ms(ov.get(_qname(q)))}" for q in QUANTILES)]
+        tp=lat.get('throughput')
+        if tp: lines.append(f"- 吞吐：{tp['requests']} 个请求 / {tp['duration_s']:.2f} s = {tp['qps']:.1f} QPS")
+        for key, title in (('by_test_type','按测试类型'),('by_query_len','按 query 长度')):
+            if lat.get(key): lines+=['',f"### 延迟：{title}",'']+_md_table(lat[key], pct_cols=())
+        if tp and tp.get('series'):
+            lines+=['','### 吞吐曲线（按完成时刻分桶）','']+_md_table(tp['series'], pct_cols=())
+    for dom, cm in (metrics.get('confusion') or {}).items():
+        labels=cm['labels']
+        rows=[{'期望/预测':l, **{c:v for c,v in zip(labels+['<other>'], row)}} for l,row in zip(labels, cm['matrix'])]
+        lines+=['',f"## 混淆矩阵：{dom}",'']+_md_table(rows, pct_cols=())
     Path=__import__('pathlib').Path
     Path(path_md).parent.mkdir(parents=True, exist_ok=True)
     open(path_md,'w',encoding='utf-8').write('\n'.join(lines))
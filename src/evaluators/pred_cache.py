@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+预测结果的本地缓存（SQLite）：同一被测版本反复回归时，只有新增/改动的用例才真正发请求。
+- 键：sha256(目标标识@版本, 归一化 query, context 的哈希)；query 只做 NFKC + 压缩空白，不改动文字本身
+- 值：预测行（intent_pred / confidence / topk / latency_ms），只缓存成功的预测
+- 与 LLM 缓存相同的 readwrite / readonly / refresh 模式、TTL 过期与按条数的 LRU 淘汰
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+MODES = ('readwrite', 'readonly', 'refresh')
+_WS = re.compile(r'\s+')
+_FLUSH_EVERY = 256
+_CACHED_FIELDS = ('intent_pred', 'confidence', 'topk', 'latency_ms')
+
+
+def normalize_query(q: str) -> str:
+    return _WS.sub(' ', unicodedata.normalize('NFKC', q or '')).strip()
+
+
+def context_hash(ctx: Any) -> str:
+    if ctx is None:
+        return ''
+    raw = ctx if isinstance(ctx, str) else json.dumps(ctx, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+class PredictionCache:
+    def __init__(self, path: str, target: str, mode: str = 'readwrite',
+                 ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        if mode not in MODES:
+            raise ValueError(f"未知的缓存模式：{mode}（可选 {', '.join(MODES)}）")
+        self.path = path
+        self.target = target
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pending: List[Tuple[str, str, float]] = []
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pred_cache (
+                key TEXT PRIMARY KEY,
+                target TEXT,
+                value TEXT,
+                created_at REAL,
+                accessed_at REAL
+            )
+            """
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_pred_cache_accessed ON pred_cache(accessed_at)')
+        self._conn.commit()
+
+    def _key(self, item: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        for part in (self.target, normalize_query(item['query']), context_hash(item.get('context'))):
+            h.update(part.encode('utf-8'))
+            h.update(b'\x00')
+        return h.hexdigest()
+
+    def split(self, items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """→ (命中的预测行, 未命中的用例)；预测行的 case_id 取当前用例。"""
+        if self.mode == 'refresh':
+            self.misses += len(items)
+            return [], list(items)
+        keys = [self._key(x) for x in items]
+        found: Dict[str, Tuple[str, float]] = {}
+        with self._lock:
+            uniq = list(set(keys))
+            for i in range(0, len(uniq), 500):
+                chunk = uniq[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value, created_at FROM pred_cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((k, (v, c)) for k, v, c in rows)
+        now = time.time()
+        if self.ttl_seconds:
+            found = {k: v for k, v in found.items() if now - v[1] <= self.ttl_seconds}
+        hit_rows, miss = [], []
+        for item, k in zip(items, keys):
+            if k in found:
+                row = json.loads(found[k][0])
+                hit_rows.append({'case_id': item['case_id'], **row, 'errors': '', 'status': 'cached', 'finished_s': None})
+            else:
+                miss.append(item)
+        if self.mode != 'readonly' and found:
+            with self._lock:
+                self._conn.executemany('UPDATE pred_cache SET accessed_at = ? WHERE key = ?', [(now, k) for k in found])
+                self._conn.commit()
+        self.hits += len(hit_rows)
+        self.misses += len(miss)
+        return hit_rows, miss
+
+    def put(self, item: Dict[str, Any], row: Dict[str, Any]) -> None:
+        if self.mode == 'readonly' or row.get('errors'):
+            return
+        value = json.dumps({f: row.get(f) for f in _CACHED_FIELDS}, ensure_ascii=False, default=str)
+        with self._lock:
+            self._pending.append((self._key(item), value, time.time()))
+            full = len(self._pending) >= _FLUSH_EVERY
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if rows:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO pred_cache(key, target, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                    [(k, self.target, v, t, t) for k, v, t in rows],
+                )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self.ttl_seconds:
+            self._conn.execute('DELETE FROM pred_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                'DELETE FROM pred_cache WHERE key IN ('
+                '  SELECT key FROM pred_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?'
+                ')',
+                (int(self.max_entries),),
+            )
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {'path': self.path, 'target': self.target, 'mode': self.mode, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': (self.hits / total) if total else None}
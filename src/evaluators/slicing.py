@@ -0,0 +1,114 @@
+import ast, json
+import numpy as np, pandas as pd
+
+# 默认切片：单维 + 常用组合；tags 为列表列，切片前先展开（一条用例可计入多个标签）
+DEFAULT_SLICES=[['domain'],['test_type'],['tags'],['difficulty'],['domain','test_type']]
+PERCENTILES=(0.5,0.9,0.99)
+
+def _as_list(x):
+    if isinstance(x,(list,tuple,np.ndarray)): return list(x)
+    if isinstance(x,str):
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                v=parse(x)
+                return list(v) if isinstance(v,(list,tuple)) else [v]
+            except Exception: pass
+        return [x] if x else []
+    return []
+
+def _gather(lists, codes):
+    """每行取 lists[codes[i]] 并展平 → (父行下标, 展平后的值)；按不同取值计算一次，再用下标向量化展开。"""
+    L=np.fromiter((len(x) for x in lists), dtype=np.int64, count=len(lists))
+    off=np.concatenate([[0], np.cumsum(L)[:-1]]) if len(lists) else np.zeros(0, dtype=np.int64)
+    uflat=np.empty(int(L.sum()), dtype=object)
+    for i,x in enumerate(lists): uflat[off[i]:off[i]+L[i]]=x
+    lens=L[codes]
+    within=np.arange(int(lens.sum()))-np.repeat(np.cumsum(lens)-lens, lens)
+    return np.repeat(np.arange(len(codes)), lens), uflat[np.repeat(off[codes], lens)+within]
+
+def _arrow_explode(vals):
+    import pyarrow as pa, pyarrow.compute as pc
+    arr=pa.array([x if isinstance(x,(list,tuple,np.ndarray)) else None for x in vals], type=pa.list_(pa.string()))
+    return pc.list_parent_indices(arr).to_numpy(), pc.list_flatten(arr).to_numpy(zero_copy_only=False)
+
+def explode_tags(df, col='tags'):
+    """
+    tags 列 → 每个标签一行：
+    - 字符串形式（JSON / CSV 里的 Python repr）：factorize 后每个不同取值只解析一次
+    - 列表/数组形式（parquet list 列）：Arrow 内核展平
+    """
+    s=df[col]; vals=s.tolist()
+    is_str=np.fromiter((isinstance(x,str) for x in vals), dtype=bool, count=len(vals))
+    parents=None
+    if is_str.all():
+        codes, uniq=pd.factorize(s)
+        parents, flat=_gather([_as_list(u) for u in uniq], codes)
+    elif not is_str.any():
+        try: parents, flat=_arrow_explode(vals)
+        except Exception: pass
+    if parents is None:
+        # 混合形式（或含非字符串元素）：逐行兜底
+        lists=[_as_list(x) for x in vals]
+        parents, flat=_gather(lists, np.arange(len(lists)))
+    out=df.drop(columns=[col]).iloc[parents].assign(**{col:flat})
+    return out[out[col].notna()]
+
+def slice_table(df, by):
+    """
+    一次 groupby 得到一个切片维度组合下的全部指标：
+    n / accuracy / topk / error_rate / 延迟分位数（只统计无错误的行）。
+    """
+    by=[c for c in by if c in df.columns]
+    if not by: return pd.DataFrame()
+    # 只带用得到的列，展开 tags 时不复制整张表
+    d=df[by+[c for c in ('top1_hit','topk_hit','is_error','latency_ms') if c in df.columns]]
+    if 'tags' in by: d=explode_tags(d)
+    g=d.groupby(by, sort=True, observed=True, dropna=False)
+    t=g.agg(n=('top1_hit','size'), accuracy=('top1_hit','mean'), topk=('topk_hit','mean'), error_rate=('is_error','mean'))
+    if 'latency_ms' in d.columns:
+        ok=d[~d['is_error'] & d['latency_ms'].notna()]
+        q=ok.groupby(by, sort=True, observed=True, dropna=False)['latency_ms'].quantile(list(PERCENTILES)).unstack()
+        q.columns=[f"p{int(p*100)}_ms" for p in q.columns]
+        t=t.join(q)
+    t=t.reset_index()
+    for c in by: t[c]=t[c].astype(object).where(t[c].notna(),'<none>')
+    return t
+
+def session_table(df):
+    """按 group_id 聚合多轮会话：会话数、会话内全部轮次都对的比例、平均轮次准确率。"""
+    if 'group_id' not in df.columns: return pd.DataFrame()
+    d=df[df['group_id'].notna() & df['group_id'].astype(str).ne('')]
+    if d.empty: return pd.DataFrame()
+    per=d.groupby('group_id', sort=False)['top1_hit'].agg(['all','mean','size'])
+    return pd.DataFrame([{'sessions':int(len(per)),'turns':int(per['size'].sum()),'session_accuracy':float(per['all'].mean()),'turn_accuracy':float(per['mean'].mean())}])
+
+def confusion_by_domain(df, intents, max_labels=30):
+    """
+    每个域一张混淆矩阵（行=期望意图，列=预测意图，'<other>' 为未登记/空预测）：
+    用 exp_id/pred_id 编码做 bincount，不逐行构表。标签只取该域出现过的期望意图，最多 max_labels 个（按样本数）。
+    """
+    if 'domain' not in df.columns: return {}
+    out={}
+    dom=df['domain'].astype(object).where(df['domain'].notna(),'<none>')
+    for name, idx in dom.groupby(dom, sort=True).groups.items():
+        sub=df.loc[idx]
+        e=sub['exp_id'].to_numpy(); p=sub['pred_id'].to_numpy()
+        e, p=e[e>=0], p[e>=0]
+        if len(e)==0: continue
+        labels=pd.Series(e).value_counts().index[:max_labels].to_numpy()
+        pos=np.full(len(intents)+1, len(labels), dtype=np.int64)  # 最后一列 = <other>
+        pos[labels]=np.arange(len(labels))
+        keep=np.isin(e, labels)
+        r=pos[e[keep]]; c=pos[np.where(p[keep]>=0, p[keep], len(intents))]
+        m=np.bincount(r*(len(labels)+1)+c, minlength=len(labels)*(len(labels)+1)).reshape(len(labels), len(labels)+1)
+        out[str(name)]={'labels':[str(intents[i]) for i in labels], 'matrix':m.tolist()}
+    return out
+
+def compute_slices(df, intents, slices=None):
+    """prepare() 的结果 → {'slices': {名称: 记录列表}, 'sessions': [...], 'confusion': {...}}，均可直接 JSON 序列化。"""
+    res={}
+    for by in (slices or DEFAULT_SLICES):
+        t=slice_table(df, by)
+        if not t.empty: res['×'.join(by)]=json.loads(t.to_json(orient='records', force_ascii=False))
+    sess=session_table(df)
+    return {'slices':res, 'sessions':json.loads(sess.to_json(orient='records', force_ascii=False)) if not sess.empty else [], 'confusion':confusion_by_domain(df, intents)}
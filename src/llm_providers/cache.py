@@ -0,0 +1,288 @@
+# src/llm_providers/cache.py
+# -*- coding: utf-8 -*-
+"""
+LLM 响应的本地磁盘缓存（SQLite）：
+- 以 (模型参数串 llm_string, 渲染后的消息 prompt) 的 sha256 作为内容地址键；
+  llm_string 由 LangChain 生成，已包含 model / temperature / max_tokens 等采样参数
+- 通过 ChatOpenAI(cache=...) 挂到 get_llm 返回的对象上，所有 invoke 自动生效
+- 支持 TTL 过期、按条数/体积的 LRU 淘汰，以及 readwrite / readonly / refresh 三种模式
+- 每次调用成功即落盘（WAL），进程崩溃后重跑可直接命中已完成的调用
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load.dump import dumps
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+CACHE_MODES = ("readwrite", "readonly", "refresh", "off")
+
+_EVICT_EVERY = 32  # 每写入多少条检查一次容量
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    mode:
+      - readwrite：先查缓存，未命中再请求并写回（默认）
+      - readonly ：只查不写，适合复现实验
+      - refresh  ：不查只写，强制刷新已有条目
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "readwrite",
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式：{mode}（可选 {', '.join(CACHE_MODES)}）")
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                llm_string TEXT,
+                value TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+        self._evict()
+
+    # ---------------- 键 ----------------
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        h = hashlib.sha256()
+        h.update(llm_string.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(prompt.encode("utf-8"))
+        return h.hexdigest()
+
+    # ---------------- BaseCache 接口 ----------------
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.mode in ("refresh", "off"):
+            return None
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                if self.mode != "readonly":
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            if self.mode != "readonly":
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+        try:
+            return _load_generations(value)
+        except Exception:
+            # 旧版本/损坏的条目按未命中处理
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode in ("readonly", "off"):
+            return
+        value = _dump_generations(return_val)
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, llm_string, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, llm_string, value, len(value.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+            need_evict = self._writes % _EVICT_EVERY == 0
+        if need_evict:
+            self._evict()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    # ---------------- 淘汰 ----------------
+
+    def _evict(self) -> None:
+        if self.mode in ("readonly", "off"):
+            return
+        with self._lock:
+            if self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                )
+            if self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "  SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?"
+                    ")",
+                    (int(self.max_entries),),
+                )
+            if self.max_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+                if total > self.max_bytes:
+                    # 从最久未访问的条目开始删，直到回到上限以内
+                    drop, freed = [], 0
+                    for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at ASC"):
+                        drop.append((key,))
+                        freed += size or 0
+                        if total - freed <= self.max_bytes:
+                            break
+                    self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", drop)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {"path": self.path, "mode": self.mode, "entries": int(n), "bytes": int(size),
+                "hits": self.hits, "misses": self.misses}
+
+
+# ---------------- 序列化 ----------------
+
+def _dump_generations(gens: RETURN_VAL_TYPE) -> str:
+    out = []
+    for g in gens:
+        if isinstance(g, ChatGeneration):
+            out.append({"message": message_to_dict(g.message), "info": g.generation_info})
+        else:
+            out.append({"text": g.text, "info": g.generation_info})
+    return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def _load_generations(value: str) -> RETURN_VAL_TYPE:
+    out = []
+    for g in json.loads(value):
+        if "message" in g:
+            msg = messages_from_dict([g["message"]])[0]
+            out.append(ChatGeneration(message=msg, generation_info=g.get("info")))
+        else:
+            out.append(Generation(text=g.get("text", ""), generation_info=g.get("info")))
+    return out
+
+
+# ---------------- 从配置构造（进程内按路径复用） ----------------
+
+_CACHES: Dict[str, SQLiteLLMCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def _cache_settings(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    llm_cache 节点（环境变量 LLM_CACHE_MODE 可覆盖 mode）：
+      enable / mode / path / ttl_hours / max_entries / max_mb
+    path 缺省为 {storage.output_dir}/_llm_cache.sqlite
+    """
+    c = (cfg or {}).get("llm_cache", {}) or {}
+    out_dir = ((cfg or {}).get("storage", {}) or {}).get("output_dir", "data/generated")
+    mode = os.getenv("LLM_CACHE_MODE") or c.get("mode", "readwrite")
+    if mode not in CACHE_MODES:
+        raise ValueError(f"未知的缓存模式：{mode}（可选 {', '.join(CACHE_MODES)}）")
+    enable = bool(c.get("enable", False)) or bool(os.getenv("LLM_CACHE_MODE"))
+    ttl_hours = c.get("ttl_hours")
+    max_mb = c.get("max_mb")
+    return dict(
+        enable=enable and mode != "off",
+        mode=mode,
+        path=c.get("path") or os.path.join(out_dir, "_llm_cache.sqlite"),
+        ttl_seconds=float(ttl_hours) * 3600 if ttl_hours else None,
+        max_entries=int(c["max_entries"]) if c.get("max_entries") else None,
+        max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+    )
+
+
+def get_llm_cache(cfg: Dict[str, Any]) -> Optional[SQLiteLLMCache]:
+    """按配置返回缓存实例；未启用时返回 None。同一路径在进程内只打开一次。"""
+    s = _cache_settings(cfg)
+    if not s["enable"]:
+        return None
+    key = os.path.abspath(s["path"])
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = SQLiteLLMCache(
+                s["path"], mode=s["mode"], ttl_seconds=s["ttl_seconds"],
+                max_entries=s["max_entries"], max_bytes=s["max_bytes"],
+            )
+            _CACHES[key] = cache
+        else:
+            # 同一文件允许运行时切换模式（如页面上改为 refresh）
+            cache.mode = s["mode"]
+        return cache
+
+
+def cache_stats() -> Sequence[Dict[str, Any]]:
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    return [c.stats() for c in caches]
+
+
+# ---------------- 流式调用的缓存读写 ----------------
+# LangChain 的 stream() 不经过缓存；这里按与 invoke 相同的键（消息序列化 + llm_string）
+# 手工读写，使流式与非流式调用共享同一份缓存条目。
+
+def _stream_cache_key(llm, messages: Sequence[BaseMessage]):
+    cache = getattr(llm, "cache", None)
+    if not isinstance(cache, BaseCache):
+        return None, None, None
+    normalized = [m.model_copy(update={"id": None}) if getattr(m, "id", None) is not None else m for m in messages]
+    return cache, dumps(normalized), llm._get_llm_string()
+
+
+def lookup_text(llm, messages: Sequence[BaseMessage]) -> Optional[str]:
+    """命中时返回整段回复文本，否则 None。"""
+    cache, prompt, llm_string = _stream_cache_key(llm, messages)
+    if cache is None:
+        return None
+    gens = cache.lookup(prompt, llm_string)
+    if not gens:
+        return None
+    g = gens[0]
+    return g.message.content if isinstance(g, ChatGeneration) else g.text
+
+
+def update_text(llm, messages: Sequence[BaseMessage], text: str) -> None:
+    """仅在流式完整结束时调用（提前中止的半截输出不应入缓存）。"""
+    cache, prompt, llm_string = _stream_cache_key(llm, messages)
+    if cache is None:
+        return
+    cache.update(prompt, llm_string, [ChatGeneration(message=AIMessage(content=text))])
@@ -0,0 +1,138 @@
+# src/llm_providers/http_pool.py
+# -*- coding: utf-8 -*-
+"""
+进程级共享的 keep-alive HTTP 连接池（httpx），供所有 LLM 客户端复用：
+- 同步 / 异步各一个客户端，连接数上限由 llm.pool_size 控制
+- transport 外包一层限流/退避（见 rate_limit.py），未配置限流的网关直接透传
+- 通过 httpcore 的 trace 扩展识别每次请求是否新建了 TCP 连接，统计连接复用率
+- add_metrics_hook(fn) 可注册回调，每个请求结束时收到
+  {"host", "reused", "status", "elapsed_ms"}
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from .rate_limit import AsyncRateLimitedTransport, RateLimitedTransport
+
+DEFAULT_POOL_SIZE = 32
+
+_LOCK = threading.Lock()
+_SYNC_CLIENT: Optional[httpx.Client] = None
+_ASYNC_CLIENT: Optional[httpx.AsyncClient] = None
+_HOOKS: List[Callable[[Dict[str, Any]], None]] = []
+_STATS = {"requests": 0, "new_connections": 0, "reused": 0}
+
+
+def add_metrics_hook(fn: Callable[[Dict[str, Any]], None]) -> None:
+    """注册请求级指标回调；回调异常会被忽略，不影响请求本身。"""
+    with _LOCK:
+        _HOOKS.append(fn)
+
+
+def remove_metrics_hook(fn: Callable[[Dict[str, Any]], None]) -> None:
+    with _LOCK:
+        if fn in _HOOKS:
+            _HOOKS.remove(fn)
+
+
+def pool_stats() -> Dict[str, Any]:
+    with _LOCK:
+        s = dict(_STATS)
+    s["reuse_ratio"] = (s["reused"] / s["requests"]) if s["requests"] else None
+    return s
+
+
+def _record(host: str, new_conn: bool, status: int, started: float) -> None:
+    event = {
+        "host": host,
+        "reused": not new_conn,
+        "status": status,
+        "elapsed_ms": int((time.perf_counter() - started) * 1000),
+    }
+    with _LOCK:
+        _STATS["requests"] += 1
+        _STATS["new_connections" if new_conn else "reused"] += 1
+        hooks = list(_HOOKS)
+    for fn in hooks:
+        try:
+            fn(event)
+        except Exception:
+            pass
+
+
+# ---------------- trace：识别是否新建连接 ----------------
+
+class _ConnTrace:
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.new_conn = False
+        self.started = time.perf_counter()
+
+    def __call__(self, name: str, info: Dict[str, Any]):
+        if name == "connection.connect_tcp.started":
+            self.new_conn = True
+        if self.inner is not None:
+            self.inner(name, info)
+
+
+class _AsyncConnTrace(_ConnTrace):
+    async def __call__(self, name: str, info: Dict[str, Any]):
+        if name == "connection.connect_tcp.started":
+            self.new_conn = True
+        if self.inner is not None:
+            await self.inner(name, info)
+
+
+def _on_request(request: httpx.Request) -> None:
+    request.extensions["trace"] = _ConnTrace(request.extensions.get("trace"))
+
+
+def _on_response(response: httpx.Response) -> None:
+    tr = response.request.extensions.get("trace")
+    if isinstance(tr, _ConnTrace):
+        _record(response.request.url.host, tr.new_conn, response.status_code, tr.started)
+
+
+async def _aon_request(request: httpx.Request) -> None:
+    request.extensions["trace"] = _AsyncConnTrace(request.extensions.get("trace"))
+
+
+async def _aon_response(response: httpx.Response) -> None:
+    _on_response(response)
+
+
+# ---------------- 共享客户端 ----------------
+
+def _limits(pool_size: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=60.0,
+    )
+
+
+def get_http_client(pool_size: int = DEFAULT_POOL_SIZE) -> httpx.Client:
+    """进程内唯一的同步客户端；首次调用时的 pool_size 生效。"""
+    global _SYNC_CLIENT
+    with _LOCK:
+        if _SYNC_CLIENT is None:
+            _SYNC_CLIENT = httpx.Client(
+                transport=RateLimitedTransport(httpx.HTTPTransport(limits=_limits(pool_size))),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                event_hooks={"request": [_on_request], "response": [_on_response]},
+            )
+        return _SYNC_CLIENT
+
+
+def get_async_http_client(pool_size: int = DEFAULT_POOL_SIZE) -> httpx.AsyncClient:
+    global _ASYNC_CLIENT
+    with _LOCK:
+        if _ASYNC_CLIENT is None:
+            _ASYNC_CLIENT = httpx.AsyncClient(
+                transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(limits=_limits(pool_size))),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                event_hooks={"request": [_aon_request], "response": [_aon_response]},
+            )
+        return _ASYNC_CLIENT
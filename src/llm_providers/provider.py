@@ -1,6 +1,8 @@
 # src/llm_providers/provider.py
 import os
-from typing import Any, Dict
+import hashlib
+import threading
+from typing import Any, Dict, Tuple
 
 # 使用新版客户端路径：langchain-openai
 try:
@@ -9,6 +11,15 @@ except Exception:
     # 兼容没装新包的场景，但仍建议 pip install -U langchain-openai
     from langchain_community.chat_models import ChatOpenAI  # type: ignore
 
+from .cache import get_llm_cache
+from .http_pool import DEFAULT_POOL_SIZE, get_async_http_client, get_http_client
+from .rate_limit import configure_rate_limit
+
+# 进程级客户端注册表：(base_url, model, api_key 摘要, 采样参数, 缓存) -> ChatOpenAI
+_CLIENTS: Dict[Tuple, Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+_REGISTRY_STATS = {"created": 0, "reused": 0}
+
 
 def _resolve_llm_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -39,6 +50,8 @@ def get_llm(cfg: dict, override: dict | None = None):
     """
     支持运行时覆盖 provider / base_url / api_key / model / temperature / max_tokens
     优先级：override > cfg['llm'] > 环境变量
+    同一组 (base_url, model, api_key, 采样参数) 在进程内只构造一次客户端，
+    且所有客户端共享 keep-alive 连接池（llm.pool_size）。
     """
     o = override or {}
     c = (cfg or {}).get("llm", {})
@@ -50,15 +63,50 @@ def get_llm(cfg: dict, override: dict | None = None):
     temperature  = o.get("temperature")  or c.get("temperature", 0.7)
     max_tokens   = o.get("max_tokens")   or c.get("max_tokens", 1024)
 
-    # 走 OpenAI 兼容接口（火山/豆包/DeepSeek 网关都支持）
-    llm = ChatOpenAI(
-        model=model,
-        openai_api_key=api_key,
-        openai_api_base=base_url,
-        temperature=float(temperature),
-        max_tokens=int(max_tokens),
+    # 本地响应缓存（llm_cache 节点；未启用时为 None，不影响原有行为）
+    cache = get_llm_cache(cfg)
+
+    key = (
+        base_url,
+        model,
+        hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16],
+        float(temperature),
+        int(max_tokens),
+        id(cache) if cache is not None else None,
     )
-    return llm
+    with _CLIENTS_LOCK:
+        llm = _CLIENTS.get(key)
+        if llm is not None:
+            _REGISTRY_STATS["reused"] += 1
+            return llm
+
+        # 所有客户端共用同一个 keep-alive 连接池，避免每次调用重新握手
+        pool_size = int(c.get("pool_size", DEFAULT_POOL_SIZE))
+        # 限流/退避在共享连接池的 transport 层完成；启用后关闭 openai SDK 自带重试，避免叠加
+        limiter = configure_rate_limit(base_url, model, cfg)
+        extra = {"max_retries": 0} if limiter is not None else {}
+
+        # 走 OpenAI 兼容接口（火山/豆包/DeepSeek 网关都支持）
+        llm = ChatOpenAI(
+            model=model,
+            openai_api_key=api_key,
+            openai_api_base=base_url,
+            temperature=float(temperature),
+            max_tokens=int(max_tokens),
+            cache=cache,
+            http_client=get_http_client(pool_size),
+            http_async_client=get_async_http_client(pool_size),
+            **extra,
+        )
+        _CLIENTS[key] = llm
+        _REGISTRY_STATS["created"] += 1
+        return llm
+
+
+def client_registry_stats() -> Dict[str, int]:
+    """注册表命中情况：created 为新建客户端数，reused 为直接复用次数。"""
+    with _CLIENTS_LOCK:
+        return dict(_REGISTRY_STATS, size=len(_CLIENTS))
 
 
 # 向后兼容：部分模块还引用 get_llm_from_env
@@ -0,0 +1,480 @@
+# src/llm_providers/rate_limit.py
+# -*- coding: utf-8 -*-
+"""
+LLM 网关的共享限流与自适应退避（挂在共享 HTTP 连接池的 transport 上，对所有调用生效）：
+- 令牌桶：按 llm.rate_limit.rpm / tpm 限制每分钟请求数与 token 数
+  （请求前按 prompt 字数 + max_tokens 预估扣减，响应后按 usage 实际值回补；流式响应在流关闭时按
+  SSE 里的 usage 回补，没有 usage 时按已收到的文本字数估算）
+- AIMD 并发：成功一轮 +1，遇到 429/超时减半，在 [min_concurrency, max_concurrency] 间自适应
+- 重试：429 / 5xx / 超时 / 连接错误按带抖动的指数退避重试（至多 max_retries 次），优先遵守 Retry-After，
+  每次失败都让 AIMD 并发减半。生成调用重复执行至多多出一份补全（后续去重会去掉），因此 POST 也重试；
+  对不能重复执行的端点设 retry_non_idempotent: false，POST 只重试 429 与确定没发出去的连接错误
+缓存命中不会走到 HTTP 层，因此不消耗限流额度。
+"""
+import asyncio
+import email.utils
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+# retry_non_idempotent 关闭时，非幂等请求只重试这些状态（服务端确定没处理）
+_RETRY_STATUS_UNSAFE = {429}
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_THROTTLE_STATUS = {429, 503}
+# 请求还没发到服务端的错误，任何情况下都可以安全重试
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+# ---------------- 令牌桶 ----------------
+
+class TokenBucket:
+    """容量 = 每分钟额度，按秒匀速回填；允许短时透支（欠账会延后后续请求）。"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, n: float) -> float:
+        """扣减 n 个令牌，返回需要等待的秒数（0 表示可立即发送）。"""
+        n = min(float(n), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= n
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, n: float) -> None:
+        """预估多扣的部分退回（n 为负时补扣）。"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + float(n))
+
+
+# ---------------- AIMD 并发 ----------------
+
+class AIMDConcurrency:
+    def __init__(self, min_limit: int = 1, max_limit: int = 16, initial: Optional[int] = None):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(initial or self.max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._waiters = []  # 异步等待者 (loop, future)，槽位可能空出时唤醒
+
+    def _notify(self) -> None:
+        # 调用方持有 self._cond
+        self._cond.notify_all()
+        waiters, self._waiters = self._waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait(timeout=0.5)
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        """acquire 的协程版：没有空槽时挂起，直到 release / 上限提高时被唤醒（不轮询）。"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                fut = loop.create_future()
+                self._waiters.append((loop, fut))
+            await fut
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._notify()
+
+    def on_success(self) -> None:
+        # 加性增：每完成约 limit 个成功请求，上限 +1
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1.0 / max(1.0, self.limit))
+            self._notify()
+
+    def on_throttle(self) -> None:
+        # 乘性减
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit / 2.0)
+
+
+def _wake(fut: "asyncio.Future") -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+# ---------------- 组合限流器 ----------------
+
+class RateLimiter:
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        retry_non_idempotent: bool = True,
+    ):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AIMDConcurrency(min_concurrency, max_concurrency)
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.retry_non_idempotent = bool(retry_non_idempotent)
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, k: str) -> None:
+        with self._stats_lock:
+            self.stats[k] += 1
+
+    def reserve(self, est_tokens: float) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and est_tokens:
+            wait = max(wait, self.tokens.reserve(est_tokens))
+        return wait
+
+    def settle(self, est_tokens: float, actual_tokens: Optional[float]) -> None:
+        if self.tokens and actual_tokens is not None:
+            self.tokens.refund(est_tokens - actual_tokens)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after) + random.uniform(0, self.backoff_base / 4)
+        # full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            s = dict(self.stats)
+        s["concurrency_limit"] = round(self.concurrency.limit, 2)
+        s["in_flight"] = self.concurrency.in_flight
+        return s
+
+
+_LIMITERS: Dict[Tuple[str, str], RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def configure_rate_limit(base_url: str, model: str, cfg: Dict[str, Any]) -> Optional[RateLimiter]:
+    """
+    按 llm.rate_limit 为 (网关 host, model) 注册限流器；同一组合只创建一次。
+    rate_limit: {enable, rpm, tpm, min_concurrency, max_concurrency, max_retries, backoff_base, backoff_max,
+                 retry_non_idempotent}
+    """
+    rl = ((cfg or {}).get("llm", {}) or {}).get("rate_limit", {}) or {}
+    if not rl.get("enable", False):
+        return None
+    key = (httpx.URL(base_url).host, model)
+    with _LIMITERS_LOCK:
+        lim = _LIMITERS.get(key)
+        if lim is None:
+            lim = RateLimiter(
+                rpm=rl.get("rpm"),
+                tpm=rl.get("tpm"),
+                min_concurrency=int(rl.get("min_concurrency", 1)),
+                max_concurrency=int(rl.get("max_concurrency", 16)),
+                max_retries=int(rl.get("max_retries", 5)),
+                backoff_base=float(rl.get("backoff_base", 1.0)),
+                backoff_max=float(rl.get("backoff_max", 60.0)),
+                retry_non_idempotent=bool(rl.get("retry_non_idempotent", True)),
+            )
+            _LIMITERS[key] = lim
+        return lim
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    with _LIMITERS_LOCK:
+        items = list(_LIMITERS.items())
+    return {f"{h}/{m}": lim.snapshot() for (h, m), lim in items}
+
+
+def _limiter_for(request: httpx.Request) -> Tuple[Optional[RateLimiter], float, float]:
+    """根据请求里的 host + body.model 找到限流器，并粗估本次 token 消耗（总量, 其中 prompt 部分）。"""
+    if not _LIMITERS or request.method != "POST":
+        return None, 0.0, 0.0
+    try:
+        body = json.loads(request.read() or b"{}")
+    except Exception:
+        return None, 0.0, 0.0
+    with _LIMITERS_LOCK:
+        lim = _LIMITERS.get((request.url.host, body.get("model")))
+    if lim is None:
+        return None, 0.0, 0.0
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []) or [])
+    est = prompt_chars + int(body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+    return lim, float(est), float(prompt_chars)
+
+
+def _may_repeat(lim: RateLimiter, request: httpx.Request) -> bool:
+    return lim.retry_non_idempotent or request.method in _IDEMPOTENT_METHODS
+
+
+def _retry_status(lim: RateLimiter, request: httpx.Request, status: int) -> bool:
+    return status in (_RETRY_STATUS if _may_repeat(lim, request) else _RETRY_STATUS_UNSAFE)
+
+
+def _retry_error(lim: RateLimiter, request: httpx.Request, exc: Exception) -> bool:
+    return _may_repeat(lim, request) or isinstance(exc, _UNSENT_ERRORS)
+
+
+def _retry_after(headers: httpx.Headers) -> Optional[float]:
+    v = headers.get("retry-after-ms")
+    if v:
+        try:
+            return float(v) / 1000.0
+        except ValueError:
+            pass
+    v = headers.get("retry-after")
+    if not v:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(v)
+    except (TypeError, ValueError, IndexError):
+        return None  # 格式不对：交给计算出的退避
+    return max(0.0, dt.timestamp() - time.time()) if dt else None
+
+
+def _usage_tokens(headers: httpx.Headers, raw: bytes) -> Optional[float]:
+    try:
+        # raw 为未解码的原始字节（可能 gzip），借一个临时 Response 按 headers 解码
+        content = httpx.Response(200, headers=headers, content=raw).read()
+        usage = json.loads(content).get("usage") or {}
+        return float(usage["total_tokens"])
+    except Exception:
+        return None
+
+
+def _stream_usage(headers: httpx.Headers, raw: bytes, prompt_est: float) -> Optional[float]:
+    """
+    SSE 流（data: {...} 逐行）的实际 token 数：最后一个带 usage 的 chunk 为准；
+    服务端没发 usage（未开 stream_options.include_usage）时按 prompt 预估 + 已收到的 delta 文本字数估算。
+    """
+    try:
+        text = httpx.Response(200, headers=headers, content=raw).read().decode("utf-8", "replace")
+    except Exception:
+        return None
+    usage, chars = None, 0
+    for line in text.splitlines():
+        if not line.startswith("data:"):
+            continue
+        try:
+            obj = json.loads(line[5:])
+        except ValueError:
+            continue  # [DONE] 或半行
+        if not isinstance(obj, dict):
+            continue
+        if (obj.get("usage") or {}).get("total_tokens") is not None:
+            usage = float(obj["usage"]["total_tokens"])
+        for ch in obj.get("choices") or []:
+            chars += len(str(((ch or {}).get("delta") or {}).get("content") or ""))
+    return usage if usage is not None else prompt_est + chars
+
+
+# ---------------- transport ----------------
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """流式响应读完/关闭时才归还并发槽位；on_close 收到已读到的原始字节，用于回补 token 预估。"""
+
+    def __init__(self, inner, on_close):
+        self.inner, self.on_close, self._raw = inner, on_close, []
+
+    def __iter__(self):
+        for chunk in self.inner:
+            self._raw.append(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self.inner.close()
+        finally:
+            if self.on_close:
+                self.on_close(b"".join(self._raw))
+                self.on_close = None
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, inner, on_close):
+        self.inner, self.on_close, self._raw = inner, on_close, []
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            self._raw.append(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.inner.aclose()
+        finally:
+            if self.on_close:
+                self.on_close(b"".join(self._raw))
+                self.on_close = None
+
+
+def _on_stream_close(lim: RateLimiter, headers: httpx.Headers, est: float, prompt_est: float):
+    def done(raw: bytes) -> None:
+        lim.concurrency.release()
+        lim.settle(est, _stream_usage(headers, raw, prompt_est))
+    return done
+
+
+def _is_stream(request: httpx.Request) -> bool:
+    return b'"stream":true' in (request.content or b"").replace(b" ", b"")
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.BaseTransport):
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        lim, est, prompt_est = _limiter_for(request)
+        if lim is None:
+            return self.inner.handle_request(request)
+
+        attempt = 0
+        while True:
+            wait = lim.reserve(est)
+            if wait > 0:
+                time.sleep(wait)
+            lim.concurrency.acquire()
+            lim._count("requests")
+            try:
+                resp = self.inner.handle_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                lim.concurrency.release()
+                lim.concurrency.on_throttle()
+                lim._count("errors")
+                if isinstance(e, _UNSENT_ERRORS):
+                    lim.settle(est, 0.0)  # 没发出去，不消耗 token
+                if attempt >= lim.max_retries or not _retry_error(lim, request, e):
+                    raise
+                time.sleep(lim.backoff_delay(attempt, None))
+                attempt += 1
+                lim._count("retries")
+                continue
+
+            if _retry_status(lim, request, resp.status_code) and attempt < lim.max_retries:
+                resp.read()
+                resp.close()
+                lim.concurrency.release()
+                lim.concurrency.on_throttle()
+                lim._count("throttled" if resp.status_code in _THROTTLE_STATUS else "errors")
+                if resp.status_code == 429:
+                    lim.settle(est, 0.0)  # 被拒的请求不计 token
+                time.sleep(lim.backoff_delay(attempt, _retry_after(resp.headers)))
+                attempt += 1
+                lim._count("retries")
+                continue
+
+            if resp.status_code < 400:
+                lim.concurrency.on_success()
+            if _is_stream(request):
+                return httpx.Response(
+                    resp.status_code, headers=resp.headers, extensions=resp.extensions,
+                    stream=_ReleasingStream(resp.stream, _on_stream_close(lim, resp.headers, est, prompt_est)),
+                )
+            try:
+                raw = b"".join(resp.stream)
+            finally:
+                resp.close()
+                lim.concurrency.release()
+            lim.settle(est, _usage_tokens(resp.headers, raw))
+            return httpx.Response(resp.status_code, headers=resp.headers, content=raw, extensions=resp.extensions)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        lim, est, prompt_est = _limiter_for(request)
+        if lim is None:
+            return await self.inner.handle_async_request(request)
+
+        attempt = 0
+        while True:
+            wait = lim.reserve(est)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await lim.concurrency.acquire_async()
+            lim._count("requests")
+            try:
+                resp = await self.inner.handle_async_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                lim.concurrency.release()
+                lim.concurrency.on_throttle()
+                lim._count("errors")
+                if isinstance(e, _UNSENT_ERRORS):
+                    lim.settle(est, 0.0)  # 没发出去，不消耗 token
+                if attempt >= lim.max_retries or not _retry_error(lim, request, e):
+                    raise
+                await asyncio.sleep(lim.backoff_delay(attempt, None))
+                attempt += 1
+                lim._count("retries")
+                continue
+
+            if _retry_status(lim, request, resp.status_code) and attempt < lim.max_retries:
+                await resp.aread()
+                await resp.aclose()
+                lim.concurrency.release()
+                lim.concurrency.on_throttle()
+                lim._count("throttled" if resp.status_code in _THROTTLE_STATUS else "errors")
+                if resp.status_code == 429:
+                    lim.settle(est, 0.0)  # 被拒的请求不计 token
+                await asyncio.sleep(lim.backoff_delay(attempt, _retry_after(resp.headers)))
+                attempt += 1
+                lim._count("retries")
+                continue
+
+            if resp.status_code < 400:
+                lim.concurrency.on_success()
+            if _is_stream(request):
+                return httpx.Response(
+                    resp.status_code, headers=resp.headers, extensions=resp.extensions,
+                    stream=_AsyncReleasingStream(resp.stream, _on_stream_close(lim, resp.headers, est, prompt_est)),
+                )
+            try:
+                raw = b"".join([chunk async for chunk in resp.stream])
+            finally:
+                await resp.aclose()
+                lim.concurrency.release()
+            lim.settle(est, _usage_tokens(resp.headers, raw))
+            return httpx.Response(resp.status_code, headers=resp.headers, content=raw, extensions=resp.extensions)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
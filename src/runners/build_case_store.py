@@ -0,0 +1,53 @@
+# src/runners/build_case_store.py
+# -*- coding: utf-8 -*-
+"""
+把已有的散落输出（home_v1 / home_v4 / v2 ... 下的 parquet / csv）导入分区用例库（storage.case_store）：
+- 递归扫描目录下的 parquet / csv（同名 parquet 存在时跳过 csv，跳过 *.near_dups.csv 与以 _ 开头的目录）
+- 运行版本取文件所在目录名（如 home_v4），也可用 --version 统一指定
+- 只追加：重复执行会重复导入，导入前可先用 --dry-run 查看
+
+用法示例：
+python -m src.runners.build_case_store --config configs/agent.yaml --root data/generated
+"""
+import argparse
+import json
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from ..utils.case_store import CaseStore
+from ..utils.io import case_files
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--config", default="configs/agent.yaml")
+    p.add_argument("--root", default=None, help="扫描目录，缺省为 storage.output_dir")
+    p.add_argument("--version", default=None, help="统一的运行版本（缺省取文件所在目录名）")
+    p.add_argument("--dry-run", action="store_true")
+    args = p.parse_args()
+
+    cfg = yaml.safe_load(open(args.config, "r", encoding="utf-8"))
+    # 导入时无视 enable 开关
+    cfg.setdefault("storage", {}).setdefault("case_store", {})["enable"] = True
+    store = CaseStore.from_cfg(cfg)
+    root = Path(args.root or (cfg.get("storage", {}) or {}).get("output_dir", "data/generated"))
+
+    per_file = {}
+    for f in case_files(root):
+        try:
+            df = pd.read_parquet(f) if f.suffix == ".parquet" else pd.read_csv(f, encoding="utf-8-sig")
+        except Exception as e:
+            print(f"[warn] skip {f}: {e}")
+            continue
+        if "query" not in df.columns:
+            continue
+        version = args.version or (f.parent.name if f.parent != root else f.stem)
+        per_file[str(f)] = {"version": version, "rows": len(df)} if args.dry_run else store.append(df, version=version, source=str(f))
+
+    print(json.dumps({"store": store.root, "imported": per_file, "versions": store.versions()}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# src/runners/build_sig_store.py
+# -*- coding: utf-8 -*-
+"""
+用已有的生成结果回填跨运行签名库（dedup.store）：
+- 递归扫描目录下的 parquet / csv（utils/io.case_files：同名 parquet 存在时跳过 csv，跳过 *.near_dups.csv 与以 _ 开头的目录）
+- 分区用例库（storage.case_store，缺省 {output_dir}/_case_store）通过 CaseStore 按批读取，
+  test_type / domain 分区列随行带出（单独读分区文件会丢掉这两列）
+- 每行以 llm_generators._sig(query) 为键写入，已存在的签名自动跳过，可重复执行
+
+用法示例：
+python -m src.runners.build_sig_store --config configs/agent.yaml --root data/generated
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from ..chains import llm_generators as LG
+from ..utils.case_store import CaseStore
+from ..utils.io import case_files
+from ..utils.sig_store import SignatureStore
+
+_SIG_COLUMNS = ["query", "test_type", "domain"]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--config", default="configs/agent.yaml")
+    p.add_argument("--root", default=None, help="扫描目录，缺省为 storage.output_dir")
+    args = p.parse_args()
+
+    cfg = yaml.safe_load(open(args.config, "r", encoding="utf-8"))
+    # 回填时无视 enable 开关
+    cfg.setdefault("dedup", {}).setdefault("store", {})["enable"] = True
+    store = SignatureStore.from_cfg(cfg)
+    root = Path(args.root or (cfg.get("storage", {}) or {}).get("output_dir", "data/generated"))
+
+    per_file = {}
+    case_store = CaseStore((((cfg.get("storage", {}) or {}).get("case_store", {}) or {}).get("path"))
+                           or os.path.join(root, "_case_store"))
+    if os.path.isdir(case_store.root):
+        per_file[case_store.root] = sum(
+            LG.remember_cases(cfg, batch.to_dict("records"), source=case_store.root)
+            for batch in case_store.iter_batches(columns=_SIG_COLUMNS, decode_context=False)
+        )
+    for f in case_files(root):
+        try:
+            df = pd.read_parquet(f) if f.suffix == ".parquet" else pd.read_csv(f, encoding="utf-8-sig")
+        except Exception as e:
+            print(f"[warn] skip {f}: {e}")
+            continue
+        if "query" not in df.columns:
+            continue
+        cols = [c for c in _SIG_COLUMNS if c in df.columns]
+        per_file[str(f)] = LG.remember_cases(cfg, df[cols].to_dict("records"), source=str(f))
+
+    print(json.dumps({"store": store.path, "added": per_file, "total": len(store)}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,99 +3,60 @@
 """
 LLM-only 测试集生成入口：
 - 输入：一句话/短段需求描述 (--desc)
-- 输出：统一表格 (parquet + csv)，包含 BASE / SYN / NOISE / SLANG / DIALECT / TYPO / CTX / SAFETY 等
+- 输出：追加进分区用例库 storage.case_store（domain/test_type/version 分区），可选另存单文件 parquet；
+  包含 BASE / SYN / NOISE / SLANG / DIALECT / TYPO / CTX / SAFETY 等
 - 逻辑：完全依赖 LLM 生成（不走模板/插槽），再做轻量清洗与强去重
 
 用法示例：
 python -m src.runners.llm_only \
   --config configs/agent.yaml \
   --desc "智能家居语音助手，控制灯光/空调/扫地机器人，并支持闲聊与安全测试" \
-  --out data/generated/home_llm/cases.parquet \
+  --version home_llm \
   --total 300
 """
 import argparse
 import os
-import re
 import json
 import uuid
 import pandas as pd
 import yaml
 
 from ..chains import llm_generators as LG
+from ..utils.augment_rules import RuleAugmenter
+from ..utils.neardup import NearDupIndex, near_dup_options
+from ..utils.normalize import dedup_key, normalize_text
+from ..utils.io import save_cases, now_version
 
 
 # =========================
-# 清洗 & 去重（项目内独立实现）
+# 清洗 & 去重
 # =========================
 
-_MID_DOT_CHARS = "·•∙⋅・｡．●"
-_FULLWIDTH_PUNCS = "，。！？；：（）【】「」『』“”‘’／＼"
-_ASCII_PUNCS = ",.!?;:()[]\"'/-\\"
-
-# 标点统一映射（可按需补充）
-_PUNC_MAP = {
-    "，": ",", "。": ".", "！": "!", "？": "?", "；": ";", "：": ":",
-    "（": "(", "）": ")", "【": "[", "】": "]",
-    "「": "\"", "」": "\"", "『": "\"", "』": "\"",
-    "“": "\"", "”": "\"", "‘": "'", "’": "'",
-    "／": "/", "＼": "\\", "－": "-", "—": "-",
-}
-
-# 允许的“轻口语”前后缀（不参与去重键生成时会被清除）
-_SOFT_FILLERS = [
-    "嗯", "呃", "额", "那个", "然后", "请问", "拜托", "麻烦你", "劳驾", "可以不", "能不能",
-    "那个啥", "多谢", "谢谢", "辛苦了", "好嘛", "好吗", "好吧", "好不", "呗", "啦",
-]
-
-def _strip_soft_fillers(s: str) -> str:
-    s = s.strip()
-    # 去掉开头/结尾一些客套或口头禅（用于去重键，不会改动原始 query）
-    # 注意：这里只做极轻量匹配，避免过度清洗
-    for w in _SOFT_FILLERS:
-        if s.startswith(w):
-            s = s[len(w):].strip()
-        if s.endswith(w):
-            s = s[:-len(w)].strip()
-    return s
-
-def normalize_query(s: str) -> str:
-    """归一化：去中点、全半角统一、空白归一、数字/字母的全角->半角（可按需扩展）"""
-    if not isinstance(s, str):
-        return s
-
-    # 删除中点类字符
-    s = re.sub(f"[{re.escape(_MID_DOT_CHARS)}]", "", s)
-
-    # 全角标点 -> 半角
-    for k, v in _PUNC_MAP.items():
-        s = s.replace(k, v)
-
-    # 全角空格 -> 半角；多空格 -> 单空格
-    s = s.replace("\u3000", " ")
-    s = re.sub(r"\s+", " ", s)
-
-    # 去掉首尾空白
-    s = s.strip()
-    return s
-
-def dedup_records(records):
+def dedup_records(records, near_opts=None, rejects=None):
     """
-    以“句子本身”为去重键：
+    以“句子本身”为去重键（utils/normalize.dedup_key，与生成链路、离线清洗同一个键）：
     - 完全相同去重
-    - 仅标点/中点不同视为同句
-    - 轻量去除开头/结尾客套词用于生成键，但不会改写原句
+    - 仅标点/中点/空白/全半角不同视为同句；语气词、客套词不剥离（NOISE / SLANG 改写靠的就是它们）
+    - near_opts 非空时，同一 test_type 内再做 MinHash 近重复拒收，明细（含所属簇）追加到 rejects
     """
     seen = set()
     kept = []
+    nears = {}
     for r in records:
         q = r.get("query") or ""
-        q_norm = normalize_query(q)
-        # 构造去重键：再额外去掉轻口语前后缀
-        key = _strip_soft_fillers(q_norm)
+        key = dedup_key(q)
         if key in seen:
             continue
+        if near_opts:
+            tp = r.get("test_type")
+            near = nears.setdefault(tp, NearDupIndex(**near_opts))
+            if near.add(r.get("case_id") or key, q, {"test_type": tp}):
+                continue
         seen.add(key)
         kept.append(r)
+    if rejects is not None:
+        for near in nears.values():
+            rejects.extend(near.rejected)
     return kept
 
 
@@ -122,16 +83,6 @@ def _normalize_record(rec: dict) -> dict:
         r["case_id"] = f"{r['expected_intent']}-{uuid.uuid4().hex[:8]}"
     return r
 
-def _save_cases(df: pd.DataFrame, out_path: str):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    # parquet（若 pyarrow 缺失会失败，自动回退只存 csv）
-    try:
-        df.to_parquet(out_path, index=False)
-    except Exception:
-        pass
-    df.to_csv(out_path.replace(".parquet", ".csv"), index=False, encoding="utf-8-sig")
-
-
 # =========================
 # 主流程
 # =========================
@@ -140,7 +91,9 @@ def main():
     p = argparse.ArgumentParser()
     p.add_argument("--config", required=True, help="YAML 配置文件（包含 llm/augment 等）")
     p.add_argument("--desc", required=True, help="一句话/短段产品需求描述")
-    p.add_argument("--out", required=True, help="输出 parquet 路径（同时导出 CSV）")
+    p.add_argument("--out", default=None, help="另存一份单文件 parquet（用例本身总是追加进 storage.case_store）")
+    p.add_argument("--version", default=None, help="用例库中的运行版本分区，缺省为当天日期 vYYYYMMDD")
+    p.add_argument("--csv", action="store_true", help="--out 旁再导出一份 CSV")
     p.add_argument("--total", type=int, default=200, help="期望基础+同义总量（LLM 生成的近似目标）")
     args = p.parse_args()
 
@@ -162,27 +115,28 @@ def main():
     dialect_n = int(aug_cfg.get("dialect_per_base", 0))
     noise_n   = int(aug_cfg.get("noise_per_base", 0))
 
-    if any([typo_n, slang_n, dialect_n, noise_n]):
-        for rec in base_syn_cases:
-            q = rec["query"]
+    kind_counts = {"TYPO": typo_n, "SLANG": slang_n, "DIALECT": dialect_n, "NOISE": noise_n}
+    if any(kind_counts.values()):
+        queries = [rec["query"] for rec in base_syn_cases]
+        if aug_cfg.get("local_noisy", False):
+            # 本地规则引擎：离线生成，不走 LLM
+            variants = RuleAugmenter.from_cfg(cfg).variants_for(queries, kind_counts)
+            logic = "规则增强"
+        else:
+            # 批量改写：每 augment.batch_size 条 BASE 打包成一次调用，缺失项再逐条兜底
+            variants = LG.gen_variants_batch(cfg, queries, kind_counts)
+            logic = "LLM增强"
+        for rec, by_kind in zip(base_syn_cases, variants):
             intent = rec["expected_intent"]
-
-            def _emit(kind, times):
-                for _ in range(times):
-                    outs = LG.gen_for_description_by_types(cfg, q, type_counts={kind: 1}) or []
-                    for nq in outs:
-                        augmented.append({
-                            "query": nq,
-                            "expected_intent": intent,
-                            "test_type": kind,
-                            "tags": [kind],
-                            "design_logic": f"LLM增强：{kind}"
-                        })
-
-            _emit("TYPO", typo_n)
-            _emit("SLANG", slang_n)
-            _emit("DIALECT", dialect_n)
-            _emit("NOISE", noise_n)
+            for kind in kind_counts:
+                for nq in by_kind.get(kind, []):
+                    augmented.append({
+                        "query": nq,
+                        "expected_intent": intent,
+                        "test_type": kind,
+                        "tags": [kind],
+                        "design_logic": f"{logic}：{kind}"
+                    })
 
     # 2.2 上下文（多轮/消歧）
     ctx_needed = int(aug_cfg.get("ctx_per_intent", 0))
@@ -213,20 +167,31 @@ def main():
     # 去掉“中点”等奇怪符号差异的重复；仅以“句子本身”作为去重键（不考虑标签/类型差异）
     for r in all_cases:
         # 仅做轻量清洗：不改动业务语义
-        r["query"] = normalize_query(r.get("query", ""))
+        r["query"] = normalize_text(r.get("query", ""))
 
-    all_cases = dedup_records(all_cases)
+    near_rejects = []
+    all_cases = dedup_records(all_cases, near_dup_options(cfg), near_rejects)
 
     # ============ 4) 保存 ============
+    version = args.version or now_version()
     df = pd.DataFrame(all_cases)
-    _save_cases(df, args.out)
+    saved = save_cases(cfg, df, out=args.out, version=version, csv=args.csv)
+    if near_rejects:
+        # 近重复拒收明细：每行注明命中的簇（保留样本的 case_id）与相似度
+        out_dir = (cfg.get("storage", {}) or {}).get("output_dir", "data/generated")
+        rej_path = os.path.splitext(args.out)[0] + ".near_dups.csv" if args.out else os.path.join(out_dir, f"{version}.near_dups.csv")
+        pd.DataFrame(near_rejects).to_csv(rej_path, index=False, encoding="utf-8-sig")
+    # 写入跨运行签名库，下次生成时跳过这些样本
+    store_added = LG.remember_cases(cfg, all_cases, source=args.out or f"case_store:{version}")
 
     # ============ 5) 摘要打印 ============
     vc = df["test_type"].value_counts(dropna=False).to_dict()
     print(json.dumps({
-        "saved": args.out,
+        "saved": saved,
         "total": int(len(df)),
         "by_test_type": vc,
+        "near_dup_rejected": len(near_rejects),
+        "store_added": store_added,
         "note": "LLM-only; 已做归一清洗+强去重（仅句子维度；差标点视同句）。"
     }, ensure_ascii=False, indent=2))
 
@@ -1,44 +1,109 @@
-import argparse, time, json, importlib, pandas as pd, requests
-from ..utils.io import load_cases, ensure_parent
-from ..evaluators.metrics import compute_metrics, save_report
+import argparse, json, os, sys, time
+import pandas as pd
+from ..utils.io import iter_cases, load_cases, ensure_parent
+from ..evaluators.metrics import CASE_COLUMNS, compute_metrics, save_report
+from ..evaluators.executor import PyFuncTarget, ApiTarget, make_target, case_inputs, session_keys, run_predictions, run_sessions, _group_of
+from ..evaluators.checkpoint import PredictionCheckpoint, RowKeys, parse_shard, select_shard, load_predictions
+from ..evaluators.pred_cache import PredictionCache
 
 def call_pyfunc(path, query, context=None):
-    module, func = path.split(':',1)
-    mod = importlib.import_module(module)
-    return getattr(mod, func)(query=query, context=context)
+    return PyFuncTarget(path)(query, context)
 
 def call_api(url, query, context=None, timeout=10.0):
-    payload={'query':query};
-    if context: payload['context']=context
-    r=requests.post(url,json=payload,timeout=timeout); r.raise_for_status(); return r.json()
+    t=ApiTarget(url, timeout=timeout, pool_size=1)
+    try: return t(query, context)
+    finally: t.close()
 
 def main():
     ap=argparse.ArgumentParser()
-    ap.add_argument('--cases', required=True)
+    ap.add_argument('--cases', required=True, help='用例文件（parquet/csv）或分区用例库目录')
+    ap.add_argument('--where', action='append', default=[], help='列=值[,值...]，可重复；用例库目录按分区裁剪（如 domain=车控 test_type=BASE,SYN）')
     ap.add_argument('--api-url', default=None)
     ap.add_argument('--py-func', default='src.utils.demo_nlu:predict_intent')
     ap.add_argument('--report', required=True)
     ap.add_argument('--pred-out', default=None)
     ap.add_argument('--metrics-out', default=None)
+    ap.add_argument('--concurrency', type=int, default=1, help='同时在途的预测请求数（1 = 串行）')
+    ap.add_argument('--timeout', type=float, default=10.0, help='单请求读取超时（秒）')
+    ap.add_argument('--connect-timeout', type=float, default=3.0, help='建连超时（秒）')
+    ap.add_argument('--batch-size', type=int, default=1, help='每次调用的用例数；目标不支持批量协议时自动退回逐条')
+    ap.add_argument('--checkpoint-dir', default=None, help='预测检查点目录（默认 report 同级的 checkpoint/）')
+    ap.add_argument('--checkpoint-every', type=int, default=500, help='每完成多少条落盘一个分片')
+    ap.add_argument('--resume', action='store_true', help='跳过检查点中已完成的用例')
+    ap.add_argument('--shard', default=None, help='i/n：只评测第 i 份（按 case_id 稳定划分），汇总用 --merge')
+    ap.add_argument('--merge', action='store_true', help='不发请求，只合并检查点目录下所有分片并出报告')
+    ap.add_argument('--pred-cache', default=None, help='预测缓存 SQLite 路径（不填则不缓存）')
+    ap.add_argument('--pred-cache-mode', default='readwrite', choices=['readwrite','readonly','refresh'])
+    ap.add_argument('--pred-cache-max-entries', type=int, default=500000)
+    ap.add_argument('--pred-cache-ttl-hours', type=float, default=None)
+    ap.add_argument('--sessions', action=argparse.BooleanOptionalAction, default=True, help='按 group_id/step 逐轮回放多轮会话（前几轮带入 context.history），会话间并发')
+    ap.add_argument('--session-history', type=int, default=0, help='每轮最多带入的历史轮数（0 = 全部）')
+    ap.add_argument('--target-version', default='', help='被测目标版本（计入缓存键；目标更新后务必修改）')
+    ap.add_argument('--chunk-size', type=int, default=50000, help='流式读取用例的批大小：逐批预测、落检查点，不把整个用例集读进内存')
     args=ap.parse_args()
-    cases=load_cases(args.cases)
-    preds=[]
-    for _,r in cases.iterrows():
-        q=str(r['query']); ctx=r.get('context') if 'context' in r else None
-        t0=time.time()
+    filters={k:v.split(',') for k,v in (w.split('=',1) for w in args.where)} or None
+    ckpt_dir=args.checkpoint_dir or os.path.join(os.path.dirname(args.report) or '.', 'checkpoint')
+    cache=None
+    if not args.merge:
+        shard=parse_shard(args.shard)
+        ckpt=PredictionCheckpoint(ckpt_dir, shard, every=args.checkpoint_every, resume=args.resume)
+        done_ids=ckpt.done_ids() if args.resume else set()
+        target=make_target(args.api_url, args.py_func, args.concurrency, args.timeout, args.connect_timeout)
+        if args.pred_cache:
+            ttl=args.pred_cache_ttl_hours*3600 if args.pred_cache_ttl_hours else None
+            cache=PredictionCache(args.pred_cache, f"{target.name}@{args.target_version}" if args.target_version else target.name, args.pred_cache_mode, ttl, args.pred_cache_max_entries)
+        total={'evaluated':0,'cache_hits':0}
+        def _run(todo, sessions):
+            todo=select_shard(todo, shard, session_keys(todo) if sessions else None)
+            if done_ids:
+                if sessions:
+                    # 会话只要有一轮没完成就整段重放（历史要从第一轮带起）
+                    keys=session_keys(todo); pending={k for k,c in zip(keys, todo['case_id'].tolist()) if c not in done_ids}
+                    todo=todo[[k in pending for k in keys]]
+                else:
+                    todo=todo[~todo['case_id'].isin(done_ids)]
+            items=case_inputs(todo)
+            # 多轮会话的 context 依赖前几轮的预测，不走缓存
+            if cache and not sessions:
+                hits, items=cache.split(items)
+                for row in hits: ckpt.append(row)
+                total['cache_hits']+=len(hits)
+            step=max(1, len(items)//20)
+            def _on_done(i, row, done=[0]):
+                ckpt.append(row); done[0]+=1
+                if cache and not sessions: cache.put(items[i], row)
+                if done[0]%step==0 or done[0]==len(items): print(f"[eval] {total['evaluated']+done[0]} done ({done[0]}/{len(items)} in {'sessions' if sessions else 'chunk'})", file=sys.stderr)
+            if sessions: run_sessions(items, target, concurrency=args.concurrency, batch_size=args.batch_size, on_done=_on_done, max_history=args.session_history or None, origin_ns=origin_ns)
+            else: run_predictions(items, target, concurrency=args.concurrency, batch_size=args.batch_size, on_done=_on_done, origin_ns=origin_ns)
+            total['evaluated']+=len(items)
         try:
-            res=call_api(args.api_url,q,ctx) if args.api_url else call_pyfunc(args.py_func,q,ctx)
-            dt=int((time.time()-t0)*1000)
-            preds.append({'case_id':r['case_id'],'intent_pred':res.get('intent',''),'confidence':res.get('confidence',0.0),'topk':json.dumps([x.get('intent',x) if isinstance(x,dict) else x for x in res.get('top_k',res.get('topk',[]))], ensure_ascii=False),'latency_ms':dt,'errors':''})
-        except Exception as e:
-            preds.append({'case_id':r['case_id'],'intent_pred':'','confidence':0.0,'topk':'[]','latency_ms':0,'errors':str(e)})
-    preds_df=pd.DataFrame(preds)
+            # 单轮用例逐批跑完即落检查点；多轮会话的轮次可能跨批，先攒下（只占会话部分的内存），最后整段回放
+            # finished_s 的零点只取一次：各批与会话回放共用，吞吐 / duration_s 覆盖整次运行
+            turns=[]; keys=RowKeys(); origin_ns=time.perf_counter_ns()
+            for chunk in iter_cases(args.cases, filters=filters, batch_size=args.chunk_size):
+                chunk=keys(chunk)   # case_id 缺失/重复的行合成稳定行键，检查点与续跑都按它对齐
+                if args.sessions and 'group_id' in chunk.columns:
+                    grouped=[_group_of(g) is not None for g in chunk['group_id'].tolist()]
+                    turns.append(chunk[grouped]); chunk=chunk[[not g for g in grouped]]
+                if len(chunk): _run(chunk, False)
+            turns=[t for t in turns if len(t)]
+            if turns: _run(pd.concat(turns, ignore_index=True), True)
+        finally:
+            ckpt.flush(); target.close()
+            if cache: cache.close()
+        if cache: print(f"[eval] prediction cache hits {total['cache_hits']}", file=sys.stderr)
+        if shard:
+            print(json.dumps({'shard':args.shard,'evaluated':total['evaluated'],'checkpoint':str(ckpt.dir),'next':'--merge','pred_cache':cache.stats() if cache else None}, ensure_ascii=False))
+            return
+    # 出报告只读指标用到的列（不读 context / design_logic 等大字段）
+    cases=RowKeys()(load_cases(args.cases, filters=filters, columns=CASE_COLUMNS))
+    preds_df=load_predictions(ckpt_dir, cases)
     metrics=compute_metrics(cases, preds_df, k=3)
     ensure_parent(args.report); save_report(metrics, args.report)
     pred_out=args.pred_out or args.report.replace('report.md','predictions.parquet')
     metrics_out=args.metrics_out or args.report.replace('report.md','metrics.json')
     preds_df.to_parquet(pred_out, index=False)
     open(metrics_out,'w',encoding='utf-8').write(json.dumps(metrics, ensure_ascii=False, indent=2))
-    print(json.dumps({'report':args.report,'predictions':pred_out,'metrics':metrics_out,'summary':metrics}, ensure_ascii=False))
+    print(json.dumps({'report':args.report,'predictions':pred_out,'metrics':metrics_out,'summary':{k:v for k,v in metrics.items() if k not in ('slices','sessions','confusion','latency')},'latency':{k:(metrics.get('latency') or {}).get(k) for k in ('status_counts','timeout_rate','overall')},'pred_cache':cache.stats() if cache else None}, ensure_ascii=False))
 
 if __name__=='__main__': main()
@@ -6,6 +6,8 @@ import yaml
 
 from ..chains.description_parser import parse_domains_intents
 from ..chains import llm_generators as LG
+from ..utils.augment_rules import KINDS as LOCAL_KINDS, RuleAugmenter
+from ..utils.io import save_cases, now_version
 
 DEFAULT_ALLOC = {"BASE": 10, "SYN": 10, "NOISE": 10, "SLANG": 10,
                  "DIALECT": 10, "TYPO": 10, "CTX": 10, "SAFETY": 10}
@@ -14,7 +16,9 @@ def main():
     p = argparse.ArgumentParser()
     p.add_argument('--config', required=True)
     p.add_argument('--desc', required=True, help='一句话/产品描述，自动解析 domain 并按类型生成')
-    p.add_argument('--out', required=True)
+    p.add_argument('--out', default=None, help='另存一份单文件 parquet（用例本身总是追加进 storage.case_store）')
+    p.add_argument('--version', default=None, help='用例库中的运行版本分区，缺省为当天日期 vYYYYMMDD')
+    p.add_argument('--csv', action='store_true', help='--out 旁再导出一份 CSV')
     p.add_argument('--domains-max', type=int, default=8)
     p.add_argument('--intents-per-domain', type=int, default=6)
     args = p.parse_args()
@@ -31,6 +35,13 @@ def main():
                  "DIALECT": 10, "TYPO": 10, "CTX": 10, "SAFETY": 10}  # 兜底
     print("[info] type allocation:", alloc)
 
+    # 噪声类（TYPO/SLANG/DIALECT/NOISE）可改由本地规则从 BASE/SYN 派生，LLM 只负责 BASE/SYN/CTX/SAFETY
+    local_quota = {}
+    if (cfg.get('augment', {}) or {}).get('local_noisy', False):
+        local_quota = {k: v for k, v in alloc.items() if k in LOCAL_KINDS}
+        alloc = {k: v for k, v in alloc.items() if k not in LOCAL_KINDS}
+        print("[info] local rule quota:", local_quota)
+
     # 先用 LLM 解析 domains / intents
     taxonomy = parse_domains_intents(cfg, args.desc, max_domains=args.domains_max, intents_per_domain=args.intents_per_domain)
     domains = taxonomy.get("domains") or []
@@ -40,33 +51,45 @@ def main():
 
     print("[info] parsed domains:", [d["name"] for d in domains])
 
-    # 按每个 domain 调用一次 LLM 生成（逐类型）
-    all_cases = []
+    # 所有 domain × 类型一次性并发扇出（并发度见 generation.max_concurrency）
+    sub_descs = []
     for d in domains:
         dname = d.get("name") or "general"
         # 构造一个域内描述，帮助模型保持贴域
-        sub_desc = f"{args.desc} —— 功能域：{dname}。覆盖意图：{('、'.join(d.get('intents') or [])) or '该域常见意图'}。"
-        cases = LG.gen_for_description_by_types(cfg, sub_desc, alloc)  # 关键：逐类型生成
+        sub_descs.append(f"{args.desc} —— 功能域：{dname}。覆盖意图：{('、'.join(d.get('intents') or [])) or '该域常见意图'}。")
+    near_rejects = []
+    per_domain = LG.gen_for_descriptions_by_types(cfg, sub_descs, alloc, rejects=near_rejects)  # 关键：逐类型生成
+    augmenter = RuleAugmenter.from_cfg(cfg) if local_quota else None
+
+    all_cases = []
+    for d, cases in zip(domains, per_domain):
+        dname = d.get("name") or "general"
         # 给该 batch 打上 domain 字段（LLM 也可能返回 domain，这里以我们的为准）
+        if augmenter is not None:
+            seeds = [c for c in cases if c.get("test_type") in ("BASE", "SYN")]
+            cases = cases + augmenter.fill_quota(seeds, local_quota)
         for c in cases:
             c["domain"] = dname
         print(f"[info] domain={dname} generated={len(cases)}")
         all_cases.extend(cases)
 
-    # 保存
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    # 保存：追加进分区用例库（可选另存单文件）
+    version = args.version or now_version()
     df = pd.DataFrame(all_cases)
-    # 兼容没有 pyarrow 的环境
-    try:
-        df.to_parquet(args.out, index=False)
-    except Exception:
-        pass
-    df.to_csv(args.out.replace('.parquet', '.csv'), index=False, encoding='utf-8-sig')
+    saved = save_cases(cfg, df, out=args.out, version=version, csv=args.csv)
+    if near_rejects:
+        # 近重复拒收明细：每行注明命中的簇（保留样本的 case_id）与相似度
+        out_dir = (cfg.get('storage', {}) or {}).get('output_dir', 'data/generated')
+        rej_path = os.path.splitext(args.out)[0] + '.near_dups.csv' if args.out else os.path.join(out_dir, f'{version}.near_dups.csv')
+        pd.DataFrame(near_rejects).to_csv(rej_path, index=False, encoding='utf-8-sig')
+    # 写入跨运行签名库，下次生成时跳过这些样本
+    store_added = LG.remember_cases(cfg, all_cases, source=args.out or f'case_store:{version}')
 
     # 汇总信息
     by_type = df['test_type'].value_counts().to_dict() if not df.empty else {}
     by_domain = df['domain'].value_counts().to_dict() if not df.empty else {}
-    print(json.dumps({"saved": args.out, "total": len(df), "by_type": by_type, "by_domain": by_domain}, ensure_ascii=False))
+    print(json.dumps({"saved": saved, "total": len(df), "by_type": by_type, "by_domain": by_domain,
+                      "near_dup_rejected": len(near_rejects), "store_added": store_added}, ensure_ascii=False))
 
 if __name__ == '__main__':
     main()
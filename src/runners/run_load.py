@@ -0,0 +1,70 @@
+import argparse, json, os, sys
+import pandas as pd
+from ..utils.io import load_cases, ensure_parent
+from ..evaluators.executor import make_target, case_inputs
+from ..evaluators.loadgen import run_open_loop, run_closed_loop, step_summary, find_saturation
+from ..evaluators.metrics import _md_table
+
+def _levels(spec): return [float(x) for x in str(spec).split(',') if x.strip()]
+
+def save_load_report(res, path_md):
+    sat=res['saturation']
+    lines=['# 压测报告','',f"- 模式：{res['mode']}（{'泊松到达，目标 QPS' if res['mode']=='open' else '固定并发'}）",f"- 目标：{res['target']}",f"- 每档时长：{res['duration_s']} s，用例 {res['cases']} 条（循环使用）"]
+    if sat['saturated_at'] is not None: lines.append(f"- 饱和档位：{sat['saturated_at']:g}（{'；'.join(sat['reasons'])}）")
+    else: lines.append('- 所有档位均未饱和')
+    if sat['max_sustainable_qps'] is not None: lines.append(f"- 最高可持续档位：{sat['max_sustainable_level']:g}，实际吞吐 {sat['max_sustainable_qps']:.1f} QPS")
+    lines+=['','## 吞吐 / 延迟曲线','','延迟已做协调遗漏校正（开环按计划发出时刻计时；闭环按期望间隔补记样本），service_* 为纯收发耗时。','']+_md_table(res['steps'], pct_cols=('error_rate',))
+    ensure_parent(path_md); open(path_md,'w',encoding='utf-8').write('\n'.join(lines))
+
+def main():
+    ap=argparse.ArgumentParser()
+    ap.add_argument('--cases', required=True)
+    ap.add_argument('--api-url', default=None)
+    ap.add_argument('--py-func', default=None, help='不走 HTTP，直接压 模块:函数（只测进程内吞吐）')
+    ap.add_argument('--serve-demo', action='store_true', help='在本进程起一个 demo_nlu 替身服务并压它（不需要 --api-url）')
+    ap.add_argument('--demo-delay-ms', type=float, default=10.0)
+    ap.add_argument('--demo-capacity', type=int, default=8, help='替身服务同时处理的请求数上限')
+    ap.add_argument('--mode', choices=['open','closed'], default='open')
+    ap.add_argument('--qps', default='10,20,50,100,200', help='开环：逐档目标 QPS，逗号分隔')
+    ap.add_argument('--concurrency', default='1,2,4,8,16,32', help='闭环：逐档并发数，逗号分隔')
+    ap.add_argument('--duration', type=float, default=10.0, help='每档持续秒数')
+    ap.add_argument('--max-in-flight', type=int, default=256, help='开环：客户端同时在途的请求上限')
+    ap.add_argument('--timeout', type=float, default=10.0)
+    ap.add_argument('--connect-timeout', type=float, default=3.0)
+    ap.add_argument('--slo-p99-ms', type=float, default=None, help='p99 超过即判为饱和')
+    ap.add_argument('--max-error-rate', type=float, default=0.01)
+    ap.add_argument('--expected-interval-ms', type=float, default=None, help='闭环校正的期望间隔（缺省取每档服务耗时中位数）')
+    ap.add_argument('--stop-on-saturation', action='store_true', help='饱和后不再压更高的档位')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', required=True, help='输出目录：load.json / report.md / samples.parquet')
+    args=ap.parse_args()
+    cases=load_cases(args.cases, columns=['case_id','query','context'])
+    items=case_inputs(cases.sample(frac=1.0, random_state=args.seed))
+    server=None
+    if args.serve_demo:
+        from ..utils.demo_server import start
+        server, args.api_url=start(delay_ms=args.demo_delay_ms, capacity=args.demo_capacity)
+    if not args.api_url and not args.py_func: ap.error('需要 --api-url、--py-func 或 --serve-demo 之一')
+    levels=_levels(args.qps if args.mode=='open' else args.concurrency)
+    pool=args.max_in_flight if args.mode=='open' else int(max(levels))
+    target=make_target(args.api_url, args.py_func, pool, args.timeout, args.connect_timeout)
+    steps, samples=[], []
+    try:
+        for i, level in enumerate(levels):
+            print(f"[load] {args.mode} level {level:g} for {args.duration:g}s", file=sys.stderr)
+            if args.mode=='open': df=run_open_loop(target, items, level, args.duration, args.max_in_flight, seed=args.seed+i)
+            else: df=run_closed_loop(target, items, int(level), args.duration)
+            s=step_summary(df, args.mode, level, args.duration, args.expected_interval_ms); steps.append(s); samples.append(df.assign(level=level))
+            print(f"[load]   achieved {s['achieved_qps']:.1f} QPS, p50 {s.get('p50_ms') or 0:.1f} ms, p99 {s.get('p99_ms') or 0:.1f} ms, errors {s['error_rate']:.2%}", file=sys.stderr)
+            if args.stop_on_saturation and find_saturation(steps, args.slo_p99_ms, args.max_error_rate)['saturated_at'] is not None: break
+    finally:
+        target.close()
+        if server: server.shutdown()
+    res={'mode':args.mode,'target':target.name,'duration_s':args.duration,'cases':len(items),'steps':steps,'saturation':find_saturation(steps, args.slo_p99_ms, args.max_error_rate)}
+    os.makedirs(args.out, exist_ok=True)
+    open(os.path.join(args.out,'load.json'),'w',encoding='utf-8').write(json.dumps(res, ensure_ascii=False, indent=2))
+    if samples: pd.concat(samples, ignore_index=True).to_parquet(os.path.join(args.out,'samples.parquet'), index=False)
+    save_load_report(res, os.path.join(args.out,'report.md'))
+    print(json.dumps({'out':args.out,'saturation':res['saturation']}, ensure_ascii=False))
+
+if __name__=='__main__': main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+本地规则增强引擎（TYPO / SLANG / DIALECT / NOISE 的离线快速通道）：
+- 词表从 YAML 加载（默认 data/curated/augment_lexicon.yaml），缺省时回落到 utils/text.py 的内置小词表
+- 错写/方言的所有模式编译成一个按长度优先的交替正则，一次扫描得到全部命中位置
+- 随机数来自 numpy Generator，种子 = (seed, 类型, 轮次)，同样的输入与种子得到同样的输出
+- 以整列为单位处理：随机抽样一次性向量化生成，前后缀拼接直接在 object 数组上完成
+"""
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import text as U
+from .io import rand_id
+
+KINDS = ("TYPO", "SLANG", "DIALECT", "NOISE")
+DEFAULT_LEXICON = Path(__file__).resolve().parents[2] / "data" / "curated" / "augment_lexicon.yaml"
+
+
+def _alternation(keys: Iterable[str]) -> Optional["re.Pattern"]:
+    keys = sorted({k for k in keys if k}, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, keys))) if keys else None
+
+
+class RuleAugmenter:
+    def __init__(self, lexicon: Optional[Dict[str, Any]] = None, seed: int = 42):
+        lx = lexicon or {}
+        self.seed = int(seed)
+        self.typo: Dict[str, List[str]] = {k: list(v) for k, v in (lx.get("typo") or U.TYPO_MAP).items()}
+        self.typo_chars: Dict[str, List[str]] = {k: list(v) for k, v in (lx.get("typo_chars") or {}).items()}
+        dialect = lx.get("dialect")
+        if dialect is None:
+            dialect = {}
+            for pat, rep in U.DIALECT_REPLACEMENTS:
+                dialect.setdefault(pat, []).append(rep)
+        self.dialect: Dict[str, List[str]] = {k: list(v) for k, v in dialect.items()}
+        self.slang_fillers = np.array(lx.get("slang_fillers") or U.SLANG_FILLERS, dtype=object)
+        self.noise_particles = np.array(lx.get("noise_particles") or U.NOISE_PARTICLES, dtype=object)
+        self.noise_fillers = np.array(lx.get("noise_fillers") or U.NOISE_FILLERS, dtype=object)
+
+        self._typo_re = _alternation(self.typo)
+        self._typo_char_re = _alternation(self.typo_chars)
+        self._dialect_re = _alternation(self.dialect)
+
+    @classmethod
+    def from_yaml(cls, path: Optional[str] = None, seed: int = 42) -> "RuleAugmenter":
+        import yaml
+        p = Path(path) if path else DEFAULT_LEXICON
+        lexicon = yaml.safe_load(open(p, "r", encoding="utf-8")) if p.exists() else None
+        return cls(lexicon, seed=seed)
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> "RuleAugmenter":
+        aug = (cfg or {}).get("augment", {}) or {}
+        return cls.from_yaml(aug.get("lexicon"), seed=int(aug.get("seed", 42)))
+
+    # ---------------- 单轮：整列改写 ----------------
+
+    def _rng(self, kind: str, rnd: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, KINDS.index(kind), rnd])
+
+    @staticmethod
+    def _replace_one(qs: np.ndarray, pattern, table: Dict[str, List[str]], u_pos: np.ndarray, u_rep: np.ndarray) -> np.ndarray:
+        out = qs.copy()
+        if pattern is None:
+            return out
+        for i, q in enumerate(qs):
+            hits = list(pattern.finditer(q))
+            if not hits:
+                continue
+            m = hits[int(u_pos[i] * len(hits))]
+            cands = table[m.group(0)]
+            out[i] = q[:m.start()] + cands[int(u_rep[i] * len(cands))] + q[m.end():]
+        return out
+
+    def apply(self, queries, kind: str, rnd: int = 0) -> np.ndarray:
+        """对整列 query 做一轮 kind 类改写，返回等长 object 数组（改不动的保持原样）。"""
+        kind = kind.upper()
+        if kind not in KINDS:
+            raise ValueError(f"本地规则不支持类型：{kind}（可选 {', '.join(KINDS)}）")
+        qs = np.asarray(pd.Series(queries, dtype=object).fillna("").astype(str), dtype=object)
+        n = len(qs)
+        rng = self._rng(kind, rnd)
+        if n == 0:
+            return qs
+
+        if kind == "NOISE":
+            prefix = rng.random(n) < 0.5
+            fillers = self.noise_fillers[rng.integers(0, len(self.noise_fillers), n)]
+            particles = self.noise_particles[rng.integers(0, len(self.noise_particles), n)]
+            return np.where(prefix, fillers + qs, qs + particles)
+
+        if kind == "SLANG":
+            prefix = rng.random(n) < 0.5
+            fillers = self.slang_fillers[rng.integers(0, len(self.slang_fillers), n)]
+            return np.where(prefix, fillers + "…" + qs, qs + "，" + fillers)
+
+        u_pos, u_rep = rng.random(n), rng.random(n)
+        if kind == "DIALECT":
+            return self._replace_one(qs, self._dialect_re, self.dialect, u_pos, u_rep)
+
+        # TYPO：先词级，未命中的再按单字同音兜底
+        out = self._replace_one(qs, self._typo_re, self.typo, u_pos, u_rep)
+        miss = out == qs
+        if miss.any() and self._typo_char_re is not None:
+            out[miss] = self._replace_one(qs[miss], self._typo_char_re, self.typo_chars, u_pos[miss], u_rep[miss])
+        return out
+
+    # ---------------- 多轮：凑满每条所需数量 ----------------
+
+    def variants_for(self, queries: List[str], kind_counts: Dict[str, int], max_rounds: int = 4) -> List[Dict[str, List[str]]]:
+        """
+        与 llm_generators.gen_variants_batch 同形：返回与 queries 对齐的 {类型: [改写...]}。
+        每类最多跑 need × max_rounds 轮，去掉与原句相同或重复的结果。
+        """
+        qs = list(queries)
+        kind_counts = {str(k).upper(): int(n) for k, n in (kind_counts or {}).items() if int(n or 0) > 0}
+        out: List[Dict[str, List[str]]] = [{k: [] for k in kind_counts} for _ in qs]
+        src = np.asarray(qs, dtype=object)
+        for kind, need in kind_counts.items():
+            seen = [{q} for q in qs]
+            for rnd in range(need * max_rounds):
+                todo = np.array([len(o[kind]) < need for o in out], dtype=bool)
+                if not todo.any():
+                    break
+                got = self.apply(src, kind, rnd)
+                for i in np.flatnonzero(todo):
+                    v = got[i]
+                    if v not in seen[i]:
+                        seen[i].add(v)
+                        out[i][kind].append(v)
+        return out
+
+    def augment_column(self, df: pd.DataFrame, kind_counts: Dict[str, int], col: str = "query") -> pd.DataFrame:
+        """
+        DataFrame 版：对 df[col] 整列增强，返回新行（保留源行其余列），
+        test_type/tags/design_logic 改为对应类型，src_index 指向源行。
+        """
+        variants = self.variants_for(df[col].tolist(), kind_counts)
+        rows = []
+        for (idx, rec), by_kind in zip(df.iterrows(), variants):
+            for kind, vs in by_kind.items():
+                for v in vs:
+                    r = rec.to_dict()
+                    r.update({col: v, "test_type": kind, "tags": [kind],
+                              "design_logic": f"规则增强：{kind}", "src_index": idx})
+                    rows.append(r)
+        return pd.DataFrame(rows)
+
+    def fill_quota(self, records: List[Dict[str, Any]], quota: Dict[str, int]) -> List[Dict[str, Any]]:
+        """
+        按“每类总条数”配额从给定源样本派生增强样本（run_generation 等按类型配额生成的场景）：
+        依次轮转源样本，每条每轮派生一个，直到配额满或轮次用尽。
+        """
+        if not records:
+            return []
+        qs = [r.get("query", "") for r in records]
+        out: List[Dict[str, Any]] = []
+        for kind, need in quota.items():
+            need = int(need or 0)
+            if need <= 0:
+                continue
+            per_src = -(-need // len(qs))  # ceil
+            variants = self.variants_for(qs, {kind: per_src})
+            got = []
+            for j in range(per_src):
+                for rec, by_kind in zip(records, variants):
+                    vs = by_kind.get(kind.upper(), [])
+                    if j < len(vs):
+                        got.append((rec, vs[j]))
+            for rec, v in got[:need]:
+                out.append({
+                    "case_id": rand_id(kind.upper()),
+                    "query": v,
+                    "expected_intent": rec.get("expected_intent", "fallback_intent"),
+                    "domain": rec.get("domain", "general"),
+                    "test_type": kind.upper(),
+                    "tags": [kind.upper()],
+                    "design_logic": f"规则增强：{kind.upper()}",
+                    "difficulty": rec.get("difficulty", 2),
+                })
+        return out
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 用例库（storage.db_url，默认 sqlite:///data/testcases.db）：
+- 表结构与旧 init_db 兼容（generated_cases，case_id 主键），tags / context 存 JSON 文本
+- WAL + synchronous=NORMAL；批量写入用 executemany 的 upsert（ON CONFLICT(case_id) DO UPDATE），
+  每 batch_size 行一个事务
+- 二级索引：domain / test_type / expected_intent / group_id 以及 (domain, test_type)
+- FTS5 全文索引（trigram 分词，适合中文子串检索），由触发器与主表保持同步；SQLite 不支持 FTS5 时自动跳过
+- iter_cases() 用游标 fetchmany 流式读取，不把整表读进内存
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+COLUMNS = ["case_id", "query", "test_type", "expected_intent", "domain", "difficulty",
+           "design_logic", "tags", "context", "group_id", "step"]
+INDEXED = ["domain", "test_type", "expected_intent", "group_id"]
+_JSON_COLUMNS = {"tags", "context"}
+
+
+def _missing(v: Any) -> bool:
+    return v is None or (isinstance(v, float) and v != v)
+
+
+_encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+
+def _json(v: Any) -> Any:
+    if isinstance(v, str):
+        return v
+    if hasattr(v, "tolist"):
+        v = v.tolist()
+    return _encode(v)
+
+
+def _json_column(values: List[Any]) -> List[Any]:
+    # tags 取值高度重复：list/ndarray 按元组记忆编码结果
+    memo: Dict[Any, str] = {}
+    out = []
+    for v in values:
+        if _missing(v):
+            out.append(None)
+        elif isinstance(v, (list, tuple)) or hasattr(v, "tolist"):
+            try:
+                key = tuple(v)
+                enc = memo.get(key)
+                if enc is None:
+                    enc = memo[key] = _json(v)
+            except TypeError:
+                enc = _json(v)
+            out.append(enc)
+        else:
+            out.append(_json(v))
+    return out
+
+
+def _int(v: Any) -> Any:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _step(v: Any) -> Any:
+    # 旧表里 step 为 TEXT；统一写成整数的字符串形式，避免 1 / 1.0 / "1" 混存
+    try:
+        return str(int(float(v)))
+    except (TypeError, ValueError):
+        return str(v)
+
+
+def _scalar(v: Any) -> Any:
+    return v if isinstance(v, (str, int, float)) else str(v)
+
+
+_CONVERT = {"tags": _json, "context": _json, "difficulty": _int, "step": _step}
+
+
+def _column(col: str, values: List[Any]) -> List[Any]:
+    """整列转换成 SQLite 可绑定的值（按列分派，避免逐格判断列名）；缺失值 → None。"""
+    f = _CONVERT.get(col, _scalar)
+    if f is _json:
+        return _json_column(values)
+    if f is _scalar:
+        return [None if v is None or v != v else (v if v.__class__ is str else _scalar(v)) for v in values]
+    return [None if _missing(v) else f(v) for v in values]
+
+
+def _where(filters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    """{列: 值 | [值, ...]} → (WHERE 子句, 参数)。列名只允许 COLUMNS 中的列。"""
+    if not filters:
+        return "", []
+    parts, params = [], []
+    for k, v in filters.items():
+        if k not in COLUMNS:
+            raise ValueError(f"unknown column: {k}")
+        if isinstance(v, (list, tuple, set)):
+            v = list(v)
+            parts.append(f"c.{k} IN ({','.join('?' * len(v))})")
+            params.extend(v)
+        elif v is None:
+            parts.append(f"c.{k} IS NULL")
+        else:
+            parts.append(f"c.{k} = ?")
+            params.append(v)
+    return " WHERE " + " AND ".join(parts), params
+
+
+def path_from_url(db_url: str) -> str:
+    """sqlite:///相对路径 / sqlite:////绝对路径 / 直接给文件路径 → 文件路径。"""
+    if db_url.startswith("sqlite:///"):
+        return db_url[len("sqlite:///"):]
+    if "://" in db_url:
+        raise ValueError(f"only sqlite db_url is supported: {db_url}")
+    return db_url
+
+
+_FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS generated_cases_ai AFTER INSERT ON generated_cases BEGIN
+    INSERT INTO generated_cases_fts(rowid, query) VALUES (new.rowid, new.query);
+END;
+CREATE TRIGGER IF NOT EXISTS generated_cases_ad AFTER DELETE ON generated_cases BEGIN
+    INSERT INTO generated_cases_fts(generated_cases_fts, rowid, query) VALUES ('delete', old.rowid, old.query);
+END;
+CREATE TRIGGER IF NOT EXISTS generated_cases_au AFTER UPDATE OF query ON generated_cases BEGIN
+    INSERT INTO generated_cases_fts(generated_cases_fts, rowid, query) VALUES ('delete', old.rowid, old.query);
+    INSERT INTO generated_cases_fts(rowid, query) VALUES (new.rowid, new.query);
+END;
+"""
+_DEFER_FTS_MIN = 100000
+
+
+class CaseRepository:
+    def __init__(self, path: str, fts: bool = True):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA cache_size=-65536")   # 64MB 页缓存
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS generated_cases (
+                case_id TEXT PRIMARY KEY,
+                query TEXT,
+                test_type TEXT,
+                expected_intent TEXT,
+                domain TEXT,
+                difficulty INTEGER,
+                design_logic TEXT,
+                tags TEXT,
+                context TEXT,
+                group_id TEXT,
+                step TEXT
+            );
+            """
+            + "".join(f"CREATE INDEX IF NOT EXISTS idx_cases_{c} ON generated_cases({c});\n" for c in INDEXED)
+            + "CREATE INDEX IF NOT EXISTS idx_cases_domain_type ON generated_cases(domain, test_type);\n"
+        )
+        self.fts = fts and self._init_fts()
+        self._conn.commit()
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> "CaseRepository":
+        """storage.db_url，缺省 sqlite:///data/testcases.db。"""
+        url = ((cfg or {}).get("storage", {}) or {}).get("db_url") or "sqlite:///data/testcases.db"
+        return cls(path_from_url(url))
+
+    def _init_fts(self) -> bool:
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='generated_cases_fts'").fetchone()
+        try:
+            self._conn.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS generated_cases_fts USING fts5(
+                    query, content='generated_cases', content_rowid='rowid', tokenize='trigram'
+                );
+                """
+                + _FTS_TRIGGERS
+            )
+        except sqlite3.OperationalError:
+            # 当前 SQLite 未编译 FTS5 / trigram：只是没有全文检索，其余功能不受影响
+            return False
+        if not exists:
+            # 旧库首次建索引：把已有行灌进去
+            self._conn.execute("INSERT INTO generated_cases_fts(generated_cases_fts) VALUES ('rebuild')")
+        return True
+
+    # ---------------- 写 ----------------
+
+    def upsert(self, cases: Union[pd.DataFrame, Iterable[Dict[str, Any]]], batch_size: int = 50000,
+               defer_fts: Optional[bool] = None) -> int:
+        """
+        按 case_id upsert；缺失 case_id 的行跳过，同一 case_id 出现多次时后面的覆盖前面的。
+        返回写入的不同 case_id 数（与写入后新增/更新的行数一致，不是提交的行数）。
+        defer_fts：先摘掉 FTS 触发器、写完后整体 rebuild（逐行触发器约占大批量写入的 2/3 时间）；
+        缺省在写入量 ≥10 万且不少于现有行数一半时自动启用。期间其他连接的写入不会进全文索引。
+        """
+        if not isinstance(cases, pd.DataFrame):
+            cases = pd.DataFrame(list(cases))
+        if self.fts and (defer_fts if defer_fts is not None else
+                         len(cases) >= max(_DEFER_FTS_MIN, self.count() // 2)):
+            with self._lock:
+                self._conn.executescript("DROP TRIGGER IF EXISTS generated_cases_ai; DROP TRIGGER IF EXISTS generated_cases_ad; "
+                                         "DROP TRIGGER IF EXISTS generated_cases_au;")
+            try:
+                return self._upsert(cases, batch_size)
+            finally:
+                self.rebuild_fts()
+        return self._upsert(cases, batch_size)
+
+    def rebuild_fts(self) -> None:
+        """按主表重建全文索引并恢复同步触发器。"""
+        if not self.fts:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT INTO generated_cases_fts(generated_cases_fts) VALUES ('rebuild')")
+            self._conn.executescript(_FTS_TRIGGERS)
+
+    def _upsert(self, cases: pd.DataFrame, batch_size: int) -> int:
+        cols = [c for c in COLUMNS if c in cases.columns]
+        if "case_id" not in cols:
+            raise ValueError("cases must have a case_id column")
+        sets = ", ".join(f"{c}=excluded.{c}" for c in cols if c != "case_id")
+        sql = (f"INSERT INTO generated_cases({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+               f"ON CONFLICT(case_id) DO UPDATE SET {sets}")
+        key = cols.index("case_id")
+        ids: set = set()
+        for start in range(0, len(cases), batch_size):
+            chunk = cases.iloc[start:start + batch_size]
+            # 批内同一 case_id 只留最后一行（位置取第一次出现处），跨批的重复由 ON CONFLICT 覆盖
+            rows = list({r[key]: r for r in zip(*(_column(c, chunk[c].tolist()) for c in cols))
+                         if r[key] not in (None, "")}.values())
+            if rows:
+                self._write(sql, rows)
+                ids.update(r[key] for r in rows)
+        return len(ids)
+
+    def _write(self, sql: str, rows: List[Tuple[Any, ...]]) -> int:
+        with self._lock:
+            with self._conn:   # 一个事务
+                self._conn.executemany(sql, rows)
+        return len(rows)
+
+    def delete(self, filters: Dict[str, Any]) -> int:
+        where, params = _where(filters)
+        if not where:
+            raise ValueError("refusing to delete without filters")
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"DELETE FROM generated_cases WHERE rowid IN (SELECT c.rowid FROM generated_cases c{where})", params)
+        return cur.rowcount
+
+    # ---------------- 读 ----------------
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        where, params = _where(filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM generated_cases c{where}", params).fetchone()[0]
+
+    def iter_cases(self, filters: Optional[Dict[str, Any]] = None, columns: Optional[Sequence[str]] = None,
+                   batch_size: int = 1000, decode: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        流式读取：独立游标按 batch_size 分批 fetchmany，逐行产出 dict。
+        decode=True 时 tags / context 还原为 JSON 对象。
+        """
+        cols = list(columns or COLUMNS)
+        bad = [c for c in cols if c not in COLUMNS]
+        if bad:
+            raise ValueError(f"unknown columns: {bad}")
+        where, params = _where(filters)
+        cur = self._conn.cursor()
+        cur.execute(f"SELECT {', '.join('c.' + c for c in cols)} FROM generated_cases c{where} ORDER BY c.rowid", params)
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for r in rows:
+                    d = dict(zip(cols, r))
+                    if decode:
+                        for c in _JSON_COLUMNS & d.keys():
+                            d[c] = _decode(d[c])
+                    yield d
+        finally:
+            cur.close()
+
+    def read(self, filters: Optional[Dict[str, Any]] = None, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        return pd.DataFrame(list(self.iter_cases(filters, columns)), columns=list(columns or COLUMNS))
+
+    def slice_counts(self, by: Sequence[str] = ("domain", "test_type"),
+                     filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """按维度计数（走索引的 GROUP BY）。"""
+        bad = [c for c in by if c not in COLUMNS]
+        if bad:
+            raise ValueError(f"unknown columns: {bad}")
+        where, params = _where(filters)
+        cols = ", ".join("c." + c for c in by)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {cols}, COUNT(*) FROM generated_cases c{where} GROUP BY {cols}", params).fetchall()
+        return pd.DataFrame(rows, columns=list(by) + ["n"])
+
+    def search(self, text: str, limit: int = 50, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        query 子串检索：≥3 个字走 FTS5 trigram 索引（按相关度排序），更短或无 FTS5 时退回 LIKE。
+        """
+        where, params = _where(filters)
+        cols = ", ".join("c." + c for c in COLUMNS)
+        if self.fts and len(text) >= 3:
+            cond = " AND " + where[len(" WHERE "):] if where else ""
+            phrase = '"' + text.replace('"', '""') + '"'
+            sql = (f"SELECT {cols} FROM generated_cases_fts f JOIN generated_cases c ON c.rowid = f.rowid "
+                   f"WHERE generated_cases_fts MATCH ?{cond} ORDER BY f.rank LIMIT ?")
+            args = [phrase] + params + [int(limit)]
+        else:
+            esc = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            cond = (where + " AND" if where else " WHERE") + " c.query LIKE ? ESCAPE '\\'"
+            sql = f"SELECT {cols} FROM generated_cases c{cond} LIMIT ?"
+            args = params + [f"%{esc}%", int(limit)]
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [{c: (_decode(v) if c in _JSON_COLUMNS else v) for c, v in zip(COLUMNS, r)} for r in rows]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "CaseRepository":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+def _decode(v: Any) -> Any:
+    if isinstance(v, str) and v[:1] in "{[":
+        try:
+            return json.loads(v)
+        except ValueError:
+            return v
+    return v
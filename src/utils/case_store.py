@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+生成用例的分区 Parquet 数据集（Arrow Dataset，Hive 风格目录）：
+  {root}/domain=<域>/test_type=<类型>/version=<运行版本>/<时间戳>-<uuid>-<i>.parquet
+- 只追加：每次保存写新文件，不改旧文件；version 缺省取 io.now_version()
+- 固定 schema：低基数字符串列用字典编码，tags 为 list<string>，context 存 JSON 字符串，
+  不在 schema 里的列合并成 extra（JSON）；zstd 压缩
+- 读取时按分区裁剪 + 谓词下推，只读需要的列；本地文件走内存映射，iter_batches 按批流式产出
+"""
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+PARTITION_COLUMNS = ['domain', 'test_type', 'version']
+_DICT_COLUMNS = {'expected_intent', 'source'}
+
+
+def _schema():
+    import pyarrow as pa
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('case_id', pa.string()),
+        ('query', pa.string()),
+        ('expected_intent', dict_str),
+        ('difficulty', pa.int16()),
+        ('design_logic', pa.string()),
+        ('tags', pa.list_(pa.string())),
+        ('context', pa.string()),
+        ('group_id', pa.string()),
+        ('step', pa.int32()),
+        ('source', dict_str),
+        ('created_at', pa.timestamp('s')),
+        ('extra', pa.string()),
+    ])
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS]), flavor='hive')
+
+
+def local_fs():
+    """本地文件系统（内存映射读取：列投影时只换入用到的页，不整块拷进堆内存）。"""
+    from pyarrow import fs
+    return fs.LocalFileSystem(use_mmap=True)
+
+
+def _missing(v: Any) -> bool:
+    return v is None or (isinstance(v, float) and v != v)
+
+
+def _tags(v: Any) -> Optional[List[str]]:
+    """list / ndarray / JSON 字符串 / CSV 里的 Python repr → list<string>。"""
+    if _missing(v):
+        return None
+    if isinstance(v, str):
+        s = v.strip()
+        if not s:
+            return []
+        try:
+            v = json.loads(s)
+        except ValueError:
+            import ast
+            try:
+                v = ast.literal_eval(s)
+            except (ValueError, SyntaxError):
+                return [s]
+    if isinstance(v, (list, tuple, np.ndarray)):
+        return [str(x) for x in v if not _missing(x)]
+    return [str(v)]
+
+
+def _json_or_none(v: Any) -> Optional[str]:
+    if _missing(v) or (isinstance(v, str) and not v.strip()):
+        return None
+    if isinstance(v, str):
+        return v
+    if isinstance(v, np.ndarray):
+        v = v.tolist()
+    return json.dumps(v, ensure_ascii=False, default=str)
+
+
+def _int_or_none(v: Any) -> Optional[int]:
+    try:
+        return None if _missing(v) or v == '' else int(float(v))
+    except (TypeError, ValueError):
+        return None
+
+
+def _str_or_none(v: Any) -> Optional[str]:
+    return None if _missing(v) or (isinstance(v, str) and not v.strip()) else str(v)
+
+
+def to_arrow(df: pd.DataFrame, version: str, source: Optional[str] = None):
+    """用例 DataFrame → 符合 schema 的 Arrow 表（含分区列）。"""
+    import pyarrow as pa
+    schema = _schema()
+    n = len(df)
+
+    def col(name):
+        return df[name].tolist() if name in df.columns else [None] * n
+
+    known = set(schema.names) | set(PARTITION_COLUMNS)
+    extra_cols = [c for c in df.columns if c not in known]
+    extras = ([_json_or_none({c: (None if _missing(v) else v) for c, v in zip(extra_cols, row)
+                              if not _missing(v)} or None)
+               for row in zip(*(df[c].tolist() for c in extra_cols))] if extra_cols else [None] * n)
+    now = pd.Timestamp(int(time.time()), unit='s')
+    arrays = {
+        'case_id': [_str_or_none(x) for x in col('case_id')],
+        'query': [None if _missing(x) else str(x) for x in col('query')],
+        'expected_intent': [_str_or_none(x) for x in col('expected_intent')],
+        'difficulty': [_int_or_none(x) for x in col('difficulty')],
+        'design_logic': [_str_or_none(x) for x in col('design_logic')],
+        'tags': [_tags(x) for x in col('tags')],
+        'context': [_json_or_none(x) for x in col('context')],
+        'group_id': [_str_or_none(x) for x in col('group_id')],
+        'step': [_int_or_none(x) for x in col('step')],
+        'source': [source] * n,
+        'created_at': [now] * n,
+        'extra': extras,
+    }
+    fields = list(schema)
+    cols = [pa.array(arrays[f.name], type=f.type.value_type).dictionary_encode() if f.name in _DICT_COLUMNS
+            else pa.array(arrays[f.name], type=f.type) for f in fields]
+    table = pa.Table.from_arrays(cols, schema=schema)
+    parts = {
+        'domain': [_str_or_none(x) or 'general' for x in col('domain')],
+        'test_type': [_str_or_none(x) or 'UNKNOWN' for x in col('test_type')],
+        'version': [version] * n,
+    }
+    for c in PARTITION_COLUMNS:
+        table = table.append_column(c, pa.array(parts[c], type=pa.string()))
+    return table
+
+
+def to_frame(data, decode_context: bool = True) -> pd.DataFrame:
+    """Arrow 表 / RecordBatch → DataFrame：tags 还原为 list，context 还原为 dict/list（decode_context=False 保留 JSON 字符串）。"""
+    df = data.to_pandas()
+    if 'tags' in df.columns:
+        df['tags'] = [list(x) if isinstance(x, np.ndarray) else x for x in df['tags'].tolist()]
+    if decode_context and 'context' in df.columns:
+        df['context'] = [_decode(x) for x in df['context'].tolist()]
+    return df
+
+
+def project(names: List[str], columns: Optional[List[str]]) -> Optional[List[str]]:
+    """按 columns 的顺序取数据里实际存在的列（旧文件缺的列直接忽略）；columns 为空表示全部列。"""
+    if columns is None:
+        return None
+    have = set(names)
+    return [c for c in columns if c in have]
+
+
+def scan_frames(scanner, decode_context: bool = True) -> Iterator[pd.DataFrame]:
+    """Arrow scanner → 逐批 DataFrame；空批跳过，全空时产出一个按投影 schema 建的空表。"""
+    empty = True
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            empty = False
+            yield to_frame(batch, decode_context)
+    if empty:
+        yield to_frame(scanner.projected_schema.empty_table(), decode_context)
+
+
+def _expr(filters: Union[None, Dict[str, Any], Any]):
+    """{列: 值 | [值, ...]} → Arrow 过滤表达式；已是表达式的原样返回。"""
+    if filters is None or not isinstance(filters, dict):
+        return filters
+    import pyarrow.dataset as ds
+    expr = None
+    for k, v in filters.items():
+        e = ds.field(k).isin(list(v)) if isinstance(v, (list, tuple, set)) else ds.field(k) == v
+        expr = e if expr is None else expr & e
+    return expr
+
+
+class CaseStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> Optional['CaseStore']:
+        """storage.case_store: {enable, path}；path 缺省为 {storage.output_dir}/_case_store。未启用返回 None。"""
+        storage = ((cfg or {}).get('storage', {}) or {})
+        st = storage.get('case_store', {}) or {}
+        if not st.get('enable', False):
+            return None
+        return cls(st.get('path') or os.path.join(storage.get('output_dir', 'data/generated'), '_case_store'))
+
+    def append(self, cases: Union[pd.DataFrame, Iterable[Dict[str, Any]]], version: Optional[str] = None,
+               source: Optional[str] = None) -> Dict[str, Any]:
+        import pyarrow.dataset as ds
+        from .io import now_version
+        df = cases if isinstance(cases, pd.DataFrame) else pd.DataFrame(list(cases))
+        version = version or now_version()
+        if df.empty:
+            return {'root': self.root, 'version': version, 'rows': 0}
+        table = to_arrow(df, version, source)
+        fmt = ds.ParquetFileFormat()
+        ds.write_dataset(
+            table, self.root, format=fmt, partitioning=_partitioning(),
+            basename_template=f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            file_options=fmt.make_write_options(compression='zstd'),
+        )
+        return {'root': self.root, 'version': version, 'rows': int(table.num_rows)}
+
+    def dataset(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        schema = pa.schema(list(_schema()) + [pa.field(c, pa.string()) for c in PARTITION_COLUMNS])
+        return ds.dataset(os.path.abspath(self.root), format='parquet', partitioning=_partitioning(), schema=schema,
+                          filesystem=local_fs())
+
+    def read(self, columns: Optional[List[str]] = None, filters: Union[None, Dict[str, Any], Any] = None,
+             decode_context: bool = True) -> pd.DataFrame:
+        """
+        filters 为 {列: 值 | [值, ...]} 或 Arrow 表达式；分区列（domain/test_type/version）上的条件只打开命中的目录。
+        context 还原为 dict/list（decode_context=False 保留 JSON 字符串）；tags 为 list。
+        """
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=columns or (_schema().names + PARTITION_COLUMNS))
+        dset = self.dataset()
+        return to_frame(dset.to_table(columns=project(dset.schema.names, columns), filter=_expr(filters)), decode_context)
+
+    def iter_batches(self, columns: Optional[List[str]] = None, filters: Union[None, Dict[str, Any], Any] = None,
+                     batch_size: int = 65536, decode_context: bool = True) -> Iterator[pd.DataFrame]:
+        """
+        与 read 相同的裁剪 / 投影，按 Arrow 扫描批次逐批产出 DataFrame（每批至多 batch_size 行）。
+        空批跳过；一行都没命中时产出一个带列名的空表。
+        """
+        if not os.path.isdir(self.root):
+            yield self.read(columns=columns)
+            return
+        dset = self.dataset()
+        yield from scan_frames(dset.scanner(columns=project(dset.schema.names, columns), filter=_expr(filters),
+                                            batch_size=batch_size), decode_context)
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        t = self.dataset().to_table(columns=['version'])
+        return sorted(set(t.column('version').to_pylist()))
+
+
+def _decode(v: Any) -> Any:
+    if isinstance(v, str) and v[:1] in '{[':
+        try:
+            return json.loads(v)
+        except ValueError:
+            return v
+    return v
@@ -0,0 +1,48 @@
+import argparse, json, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .demo_nlu import predict_intent
+
+# 本地替身服务：把 demo_nlu.predict_intent 包成 HTTP 接口，供 run_eval / run_load 联调
+# POST {query, context?} → 预测；POST [{query, ...}, ...] → 等长列表（批量协议）
+# delay_ms 模拟模型耗时，capacity 限制同时处理的请求数（超出的排队），便于压出饱和点
+
+def make_handler(delay_ms=0.0, capacity=None):
+    slots=threading.BoundedSemaphore(capacity) if capacity else None
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version='HTTP/1.1'
+        disable_nagle_algorithm=True  # 头和正文分两次写，不关 Nagle 会叠上 ~40ms 的延迟确认
+        def log_message(self, *a): pass
+        def do_POST(self):
+            try:
+                body=json.loads(self.rfile.read(int(self.headers.get('Content-Length',0))) or b'null')
+                items=body if isinstance(body, list) else [body]
+                if not all(isinstance(x, dict) and 'query' in x for x in items): raise ValueError('expected {query} or [{query}, ...]')
+            except Exception as e:
+                return self._send(400, {'error':str(e)})
+            if slots: slots.acquire()
+            try:
+                if delay_ms: time.sleep(delay_ms/1000.0)
+                out=[predict_intent(x['query'], x.get('context')) for x in items]
+            finally:
+                if slots: slots.release()
+            self._send(200, out if isinstance(body, list) else out[0])
+        def _send(self, code, obj):
+            b=json.dumps(obj, ensure_ascii=False).encode('utf-8')
+            self.send_response(code); self.send_header('Content-Type','application/json'); self.send_header('Content-Length',str(len(b))); self.end_headers(); self.wfile.write(b)
+    return Handler
+
+def start(host='127.0.0.1', port=0, delay_ms=0.0, capacity=None):
+    """后台线程启动；port=0 取随机端口。返回 (server, url)，用完 server.shutdown()。"""
+    srv=ThreadingHTTPServer((host, port), make_handler(delay_ms, capacity)); srv.daemon_threads=True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://{host}:{srv.server_address[1]}/predict"
+
+def main():
+    ap=argparse.ArgumentParser(); ap.add_argument('--host', default='127.0.0.1'); ap.add_argument('--port', type=int, default=8790)
+    ap.add_argument('--delay-ms', type=float, default=10.0); ap.add_argument('--capacity', type=int, default=None, help='同时处理的请求数上限（不填不限）')
+    args=ap.parse_args()
+    srv=ThreadingHTTPServer((args.host, args.port), make_handler(args.delay_ms, args.capacity)); srv.daemon_threads=True
+    print(f"demo NLU server on http://{args.host}:{args.port}/predict", flush=True)
+    srv.serve_forever()
+
+if __name__=='__main__': main()
@@ -1,57 +1,103 @@
 from pathlib import Path
 import pandas as pd
-import json, uuid
+import json, os, uuid
 
 def ensure_parent(path): Path(path).parent.mkdir(parents=True, exist_ok=True)
 
 def save_table(df, path):
+    # parquet 写失败直接报错，不再静默退回 csv
     ensure_parent(path)
     p=str(path)
-    if p.endswith('.parquet'):
-        try:
-            df.to_parquet(p, index=False)
-        except Exception:
-            df.to_csv(p.replace('.parquet','.csv'), index=False)
-            return p.replace('.parquet','.csv')
-    else:
-        df.to_csv(p, index=False)
+    if p.endswith('.parquet'): df.to_parquet(p, index=False)
+    else: df.to_csv(p, index=False)
     return p
 
+def save_cases(cfg, df, out=None, version=None, csv=False):
+    """
+    生成结果落盘：追加进分区用例库（storage.case_store，见 case_store.py），
+    给了 out 再额外导出单个 parquet（csv=True 时再带一份 CSV）。返回 {'store': ..., 'out': ...}。
+    """
+    from .case_store import CaseStore
+    store=CaseStore.from_cfg(cfg); res={'store':None,'out':None}
+    if store is None and not out: raise ValueError('storage.case_store 未启用时必须指定 --out')
+    if store is not None: res['store']=store.append(df, version=version, source=out)
+    if out:
+        res['out']=save_table(df, out)
+        if csv: df.to_csv(str(out).replace('.parquet','.csv'), index=False, encoding='utf-8-sig')
+    return res
+
+def case_files(root):
+    """
+    递归列出目录下的用例文件（parquet / csv）：同名 parquet 存在时跳过 csv，跳过 *.near_dups.csv，
+    也跳过以 _ 开头的目录（_case_store 分区库、_signatures.sqlite 等由各自的读写接口处理）。
+    """
+    root=Path(root)
+    for p in sorted(root.rglob('*')):
+        if any(part.startswith('_') for part in p.relative_to(root).parts): continue
+        if p.suffix=='.parquet': yield p
+        elif p.suffix=='.csv' and not p.name.endswith('.near_dups.csv') and not p.with_suffix('.parquet').exists(): yield p
+
 def load_yaml(path):
     import yaml
     return yaml.safe_load(open(path,'r',encoding='utf-8'))
 
-def load_cases(path):
-    p=str(path)
-    return pd.read_parquet(p) if p.endswith('.parquet') else pd.read_csv(p)
+_DB_SUFFIXES=('.db','.sqlite','.sqlite3')
+
+def iter_cases(path, columns=None, filters=None, batch_size=65536):
+    """
+    分批产出用例 DataFrame（同一时刻只有一批在内存里）：
+    - 单个 parquet / 分区用例库目录：Arrow Dataset 扫描，列投影 + 谓词下推（行组统计、分区裁剪），本地文件内存映射
+    - csv：read_csv 分块 + usecols 投影，逐块过滤
+    - .db/.sqlite：case_db.CaseRepository 游标分批
+    columns 里数据没有的列忽略；filters 为 {列: 值 | [值, ...]}（parquet / 用例库也可传 Arrow 表达式）。
+    空批跳过，一行都没命中时产出一个带列名的空表。
+    """
+    p=str(path); batch_size=max(1, int(batch_size))
+    if Path(p).is_dir():
+        from .case_store import CaseStore
+        yield from CaseStore(p).iter_batches(columns=columns, filters=filters, batch_size=batch_size)
+    elif p.endswith('.parquet'):
+        import pyarrow.dataset as ds
+        from .case_store import local_fs, project, scan_frames, _expr
+        dset=ds.dataset(os.path.abspath(p), format='parquet', filesystem=local_fs())
+        # 原样返回 parquet 里的 tags / context，与 pd.read_parquet 一致
+        yield from scan_frames(dset.scanner(columns=project(dset.schema.names, columns), filter=_expr(filters), batch_size=batch_size), decode_context=False)
+    elif p.endswith(_DB_SUFFIXES):
+        from .case_db import CaseRepository, COLUMNS
+        with CaseRepository(p, fts=False) as repo:
+            cols=[c for c in (columns or COLUMNS) if c in COLUMNS]; buf=[]; n=0
+            for row in repo.iter_cases(filters=filters, columns=cols, batch_size=min(batch_size, 10000)):
+                buf.append(row)
+                if len(buf)>=batch_size: yield pd.DataFrame(buf, columns=cols); n+=len(buf); buf=[]
+            if buf or not n: yield pd.DataFrame(buf, columns=cols)
+    else:
+        # 过滤列不在 columns 里时也要读进来，过滤完再投影回 columns；文件里没有的过滤列先报错
+        header=set(pd.read_csv(p, nrows=0, encoding='utf-8-sig').columns)
+        for c in (filters or {}):
+            if c not in header: raise ValueError(f"unknown filter column: {c}")
+        cols=set(columns or ()); keep=(lambda c: c in cols) if columns else None
+        need=cols|set(filters or ()); usecols=(lambda c: c in need) if columns else None; n=0
+        for df in pd.read_csv(p, chunksize=batch_size, usecols=usecols, encoding='utf-8-sig'):
+            for k,v in (filters or {}).items():
+                df=df[df[k].isin(v if isinstance(v,(list,tuple,set)) else [v])]
+            if columns: df=df[[c for c in df.columns if c in cols]]
+            if len(df): n+=len(df); yield df
+        if not n: yield pd.read_csv(p, nrows=0, usecols=keep, encoding='utf-8-sig')
 
-import sqlite3
+def load_cases(path, filters=None, columns=None):
+    """iter_cases 的一次性版本：单个 parquet/csv/.db，或分区用例库目录（按 filters 裁剪分区），只读 columns 列。"""
+    parts=list(iter_cases(path, columns=columns, filters=filters))
+    return pd.concat(parts, ignore_index=True) if len(parts)>1 else parts[0].reset_index(drop=True)
 
 def init_db(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS generated_cases (
-            case_id TEXT PRIMARY KEY,
-            query TEXT,
-            test_type TEXT,
-            expected_intent TEXT,
-            domain TEXT,
-            difficulty INTEGER,
-            design_logic TEXT,
-            tags TEXT,
-            context TEXT,
-            group_id TEXT,
-            step TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    # 建表 + 索引 + FTS5（见 case_db.CaseRepository），旧库可重复执行
+    from .case_db import CaseRepository
+    CaseRepository(db_path).close()
 
 def save_to_db(df, db_path):
-    conn = sqlite3.connect(db_path)
-    df.to_sql('generated_cases', conn, if_exists='append', index=False)
-    conn.close()
+    """按 case_id upsert（重复主键覆盖而不是报错），返回写入的不同 case_id 数。"""
+    from .case_db import CaseRepository
+    with CaseRepository(db_path) as repo: return repo.upsert(df)
 
 def rand_id(prefix):
     return f"{prefix}-{uuid.uuid4().hex[:8]}"
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+近重复检测索引（字符 n-gram MinHash + LSH 分桶）：
+- 每条文本归一化后切成字符 n-gram，计算 num_perm 维 MinHash 签名
+- 签名切成 bands 段，任一段完全相同即成为候选；候选再用 n-gram 集合的精确 Jaccard 复核
+- 插入/查询只访问同桶候选，整体近似线性，不做 O(n²) 两两比较
+- 被判为近重复的行记录其所属簇（簇 id = 该簇第一条被保留的样本 key）
+"""
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .normalize import dedup_key
+
+_MERSENNE = np.int64((1 << 31) - 1)
+# NFKC + 小写 + 去空白/标点，只保留文字本身参与相似度（与精确去重同一个键）
+default_normalize = dedup_key
+
+
+def shingles(s: str, ngram: int) -> Set[str]:
+    if len(s) <= ngram:
+        return {s} if s else set()
+    return {s[i:i + ngram] for i in range(len(s) - ngram + 1)}
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """选 (bands, rows)，使 S 曲线拐点 (1/b)^(1/r) 最接近阈值。"""
+    best, best_err = (num_perm, 1), float("inf")
+    for r in range(1, num_perm + 1):
+        b = num_perm // r
+        if b < 1:
+            break
+        err = abs((1.0 / b) ** (1.0 / r) - threshold)
+        if err < best_err:
+            best, best_err = (b, r), err
+    return best
+
+
+class NearDupIndex:
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        ngram: int = 2,
+        num_perm: int = 64,
+        seed: int = 1,
+        normalize: Optional[Callable[[str], str]] = None,
+    ):
+        self.threshold = float(threshold)
+        self.ngram = int(ngram)
+        self.num_perm = int(num_perm)
+        self.bands, self.rows = _lsh_params(self.threshold, self.num_perm)
+        self.normalize = normalize or default_normalize
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE, self.num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _MERSENNE, self.num_perm, dtype=np.int64)
+
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._keys: List[Any] = []
+        self._texts: List[str] = []
+        self._shingles: List[Set[str]] = []
+        self._cluster: List[Any] = []
+        self._lock = threading.Lock()
+        self.rejected: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> Optional["NearDupIndex"]:
+        """dedup.near_dup: {enable, threshold, ngram, num_perm}；未启用返回 None。"""
+        opts = near_dup_options(cfg)
+        return cls(**opts) if opts is not None else None
+
+    # ---------------- 签名 ----------------
+
+    def signature(self, sh: Set[str]) -> np.ndarray:
+        if not sh:
+            return np.full(self.num_perm, _MERSENNE, dtype=np.int64)
+        x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in sh), dtype=np.int64, count=len(sh)) % _MERSENNE
+        # (a·x + b) mod p，a、x < 2^31，乘积不会溢出 int64
+        h = (np.outer(x, self._a) + self._b) % _MERSENNE
+        return h.min(axis=0)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        r = self.rows
+        return [sig[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def sketch(self, text: str) -> Tuple[Set[str], List[bytes]]:
+        """文本 → (n-gram 集合, 各段 LSH 桶键)；外部持久化存储（如签名库）复用同一套参数。"""
+        sh = shingles(self.normalize(text), self.ngram)
+        return sh, self._band_keys(self.signature(sh))
+
+    @staticmethod
+    def jaccard(a: Set[str], b: Set[str]) -> float:
+        if not a and not b:
+            return 1.0
+        return len(a & b) / float(len(a | b) or 1)
+
+    # ---------------- 查询 / 插入 ----------------
+
+    def _best_match(self, sh: Set[str], bkeys: List[bytes]) -> Tuple[Optional[int], float]:
+        cands: Set[int] = set()
+        for band, k in zip(self._buckets, bkeys):
+            cands.update(band.get(k, ()))
+        best, best_sim = None, 0.0
+        for c in sorted(cands):
+            sim = self.jaccard(sh, self._shingles[c])
+            if sim > best_sim:
+                best, best_sim = c, sim
+        return best, best_sim
+
+    def query(self, text: str) -> Optional[Dict[str, Any]]:
+        """只查不插：命中返回 {cluster, matched_key, matched_text, similarity}。"""
+        sh, bkeys = self.sketch(text)
+        with self._lock:
+            best, sim = self._best_match(sh, bkeys)
+            if best is None or sim < self.threshold:
+                return None
+            return {"cluster": self._cluster[best], "matched_key": self._keys[best],
+                    "matched_text": self._texts[best], "similarity": round(sim, 4)}
+
+    def add(self, key: Any, text: str, meta: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        插入一条；若与已收录样本近重复则不收录，返回命中信息（同时记入 self.rejected），否则返回 None。
+        meta 会原样带进 rejected 记录，便于报告定位。
+        """
+        sh, bkeys = self.sketch(text)
+        return self.add_sketch(key, text, sh, bkeys, meta)
+
+    def add_sketch(self, key: Any, text: str, sh: Set[str], bkeys: List[bytes],
+                   meta: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """同 add，sketch 由调用方给出（如子进程里用同参数的索引算好），这里只做查重与插入。"""
+        with self._lock:
+            best, sim = self._best_match(sh, bkeys)
+            if best is not None and sim >= self.threshold:
+                hit = {"key": key, "text": text, "cluster": self._cluster[best],
+                       "matched_key": self._keys[best], "matched_text": self._texts[best],
+                       "similarity": round(sim, 4), **(meta or {})}
+                self.rejected.append(hit)
+                return hit
+            idx = len(self._keys)
+            self._keys.append(key)
+            self._texts.append(text)
+            self._shingles.append(sh)
+            self._cluster.append(key)
+            for band, k in zip(self._buckets, bkeys):
+                band.setdefault(k, []).append(idx)
+            return None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def near_dup_options(cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    nd = (((cfg or {}).get("dedup", {}) or {}).get("near_dup", {}) or {})
+    if not nd.get("enable", False):
+        return None
+    return {
+        "threshold": float(nd.get("threshold", 0.7)),
+        "ngram": int(nd.get("ngram", 2)),
+        "num_perm": int(nd.get("num_perm", 64)),
+    }
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+query 归一化内核（生成去重、离线清洗、近重复检测共用一套规则）：
+- normalize_text：展示用的轻量清洗，改写后的 query 会落盘，因此不做 NFKC（全角标点、省略号等保持原样）
+    删中点类装饰符、各种空白统一成空格（一张 str.translate 表）
+    → 一个预编译正则压缩连续空格、去掉标点两侧空格 → 去首尾空白与成对引号
+- dedup_key：去重键。NFKC + 小写后只保留文字和数字（标点、空白、emoji、下划线全部去掉），
+  “打开 空调！”“打开空调”“打开·空调”“ＡＣ”/“ac”得到同一个键；signature 为其 md5。
+  所有去重入口（生成链路、llm_only、离线清洗、近重复）都只用这一个键，不再各自叠加规则
+- *_batch：对 list / pandas Series / Arrow 列整体计算；装了 pyarrow 时用 numpy 直接在 UTF-8 字节上处理整列，
+  只有少数行回退到单条接口。
+  “比旧实现快 10×”的要求针对 *_batch 的 Arrow 列 / Series 路径（scripts/bench_normalize.py 实测 13~15×）。
+  dedup_key_batch 的 list 输入要为变化的行逐个建 Python 字符串，约 9×；单条接口受每次调用的解释器开销限制
+  （dedup_key 约 3.7×，normalize_text 约 9×）。这两类不在该目标内
+单条接口先做快速判断（已是 NFKC、已全是文字数字、没有空白引号装饰符），常见输入只走 C 层的几次扫描。
+"""
+import functools
+import hashlib
+import re
+import sys
+import unicodedata
+from typing import Any, List, Optional
+
+# 中点/装饰类字符：直接删除（含半角片假名中点）
+DROP_CHARS = "·•●∙⋅‧・･"
+# 展示清洗时会去掉两侧空格的标点（全角、半角都算）
+_TIGHT_PUNCT = "，。？！、；：,!?;:"
+_QUOTES = "\"'“”‘’＂＇"
+
+# str.isspace() 的全部字符 → 普通空格；装饰符 → 删除
+_SPACES = "".join(c for c in map(chr, range(0x3001)) if c.isspace())
+_TEXT_TABLE = str.maketrans({**{c: " " for c in _SPACES}, **{c: None for c in DROP_CHARS}})
+
+# 没有空白、装饰符、引号的串 normalize_text 不会改动（绝大多数 query），一次字符类查找即可放行
+_TEXT_DIRTY = re.compile(rf"[\s{re.escape(DROP_CHARS + _QUOTES)}]")
+# 只有含空格以外的空白或装饰符时才需要过一遍 translate 表（str.translate 对中文串逐字查 dict，并不便宜）
+_TRANSLATE_NEEDED = re.compile(f"[{re.escape(_SPACES.replace(' ', '') + DROP_CHARS)}]")
+# 标点两侧的空格、连续空格里第一个之后的，整段删掉；替换串是常量，re.sub 全程走 C 层
+_SPACE_RE = re.compile(rf" +(?=[{re.escape(_TIGHT_PUNCT)}])|(?<=[{re.escape(_TIGHT_PUNCT)}]) +|(?<= ) +")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+_is_normalized = unicodedata.is_normalized
+_normalize = unicodedata.normalize
+
+
+def normalize_text(s: Any) -> str:
+    """展示用清洗（会写回 query，不做 NFKC）；None / NaN → ''。"""
+    if not isinstance(s, str) or not s:
+        return ""
+    if _TEXT_DIRTY.search(s) is None:
+        return s
+    if _TRANSLATE_NEEDED.search(s) is not None:
+        s = s.translate(_TEXT_TABLE)
+    s = _SPACE_RE.sub("", s)
+    return s.strip(" ").strip(_QUOTES).strip(" ")
+
+
+def dedup_key(s: Any) -> str:
+    """去重键：只保留文字和数字的小写 NFKC 串。"""
+    if not isinstance(s, str) or not s:
+        return ""
+    if not _is_normalized("NFKC", s):
+        s = _normalize("NFKC", s)
+    s = s.lower()
+    return s if s.isalnum() else _NON_WORD.sub("", s)
+
+
+def signature(s: Any) -> str:
+    """去重签名：dedup_key 的 md5（签名库 signatures.sig 即此值）。"""
+    return hashlib.md5(dedup_key(s).encode("utf-8")).hexdigest()
+
+
+# ---------------- 批量 ----------------
+
+def _arrow_kind(values: Any) -> Optional[str]:
+    mod = type(values).__module__
+    if mod.startswith("pyarrow"):
+        return "arrow"
+    if mod.startswith("pandas") and hasattr(values, "index"):
+        return "pandas"
+    return None
+
+
+def _rewrap(values: Any, out: List[str], kind: Optional[str]) -> Any:
+    """没装 pyarrow 时逐条算出的 list → 与输入同类型。"""
+    if kind == "pandas":
+        import pandas as pd
+        return pd.Series(out, index=values.index, name=values.name, dtype=object)
+    return out
+
+
+def _to_arrow(values: Any, kind: Optional[str]):
+    """输入 → Arrow 字符串数组（Arrow 列、str 类型的 Series 零拷贝）；非字符串元素 → null。"""
+    import pyarrow as pa
+    if kind == "arrow":
+        arr = values
+    else:
+        try:
+            arr = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arr = None
+        if arr is None or not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type) or pa.types.is_null(arr.type)):
+            arr = pa.array([x if isinstance(x, str) else None for x in values], type=pa.string())
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        arr = arr.cast(pa.string())
+    return arr
+
+
+def _to_series(values: Any, arr) -> Any:
+    ser = arr.to_pandas()
+    ser.index, ser.name = values.index, values.name
+    return ser
+
+
+def _null_rows(arr, np):
+    if not arr.null_count:
+        return np.zeros(len(arr), bool)
+    return arr.is_null().to_numpy(zero_copy_only=False)
+
+
+def _utf8(arr, np):
+    """Arrow 字符串数组 → (从 0 起的 offsets, UTF-8 字节视图)。"""
+    import pyarrow as pa
+    off_type = np.int64 if pa.types.is_large_string(arr.type) else np.int32
+    off = np.frombuffer(arr.buffers()[1], off_type, len(arr) + 1, arr.offset * np.dtype(off_type).itemsize)
+    base = int(off[0])
+    off = off - base
+    d = np.frombuffer(arr.buffers()[2], np.uint8, int(off[-1]), base) if off[-1] else np.zeros(0, np.uint8)
+    return off, d
+
+
+def _rows(off, pos, np):
+    """字节位置 → 所在行号。"""
+    return np.searchsorted(off, pos, "right") - 1
+
+
+def _wide_chars(d, np):
+    """
+    汉字以外的多字节字符 → (首字节位置, 码位, 字节数)。
+    首字节 E4~E9 即 U+4000~U+9FFF，除易经卦符（E4 B7 xx）外都是 dedup_key / normalize_text 不改动的汉字，直接跳过。
+    """
+    u8 = np.uint8
+    lead = (d >= 0xC0) & ((d - u8(0xE4)) >= 6)
+    hexa = np.flatnonzero(d[1:] == 0xB7)
+    lead[hexa[d[hexa] == 0xE4]] = True
+    lead = np.flatnonzero(lead)
+    last = len(d) - 1
+    b0 = d[lead].astype(np.int32)
+    b1, b2, b3 = (d[np.minimum(lead + k, last)].astype(np.int32) & 0x3F for k in (1, 2, 3))
+    width = np.where(b0 < 0xE0, 2, np.where(b0 < 0xF0, 3, 4))
+    cp = np.where(width == 2, (b0 & 0x1F) << 6 | b1,
+                  np.where(width == 3, (b0 & 0x0F) << 12 | b1 << 6 | b2,
+                           (b0 & 0x07) << 18 | b1 << 12 | b2 << 6 | b3))
+    return lead, cp, width
+
+
+@functools.lru_cache(maxsize=None)
+def _text_dirty_table():
+    """_TEXT_DIRTY 的码位表（这些字符都在 U+3000 以内或全角区，BMP 足够）。"""
+    import numpy as np
+    return np.array([_TEXT_DIRTY.match(chr(cp)) is not None for cp in range(0x10000)])
+
+
+def normalize_text_batch(values: Any) -> Any:
+    """
+    normalize_text 的批量版：list → list，pandas Series → Series（同 index / name），Arrow 列 → Arrow 数组。
+    装了 pyarrow 时先在 UTF-8 字节上找出含空白、装饰符、引号的行（通常只有几个百分点），
+    只对这些行调用 normalize_text，其余行原样沿用（list 输入直接复用原字符串对象）。
+    """
+    kind = _arrow_kind(values)
+    if kind is None:
+        values = list(values)
+    try:
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        seq = values.to_pylist() if kind == "arrow" else values
+        return _rewrap(values, [normalize_text(x) for x in seq], kind)
+    arr = _to_arrow(values, kind)
+    off, d = _utf8(arr, np)
+    u8 = np.uint8
+    dirty = (d - u8(0x09)) < 5        # \t \n \v \f \r
+    dirty |= (d - u8(0x1C)) < 5       # \x1c~\x1f、空格
+    dirty |= d == 0x22
+    dirty |= d == 0x27
+    lead, cp, _ = _wide_chars(d, np)
+    hit = _null_rows(arr, np)
+    hit[_rows(off, np.flatnonzero(dirty), np)] = True
+    hit[_rows(off, lead[_text_dirty_table()[np.minimum(cp, 0xFFFF)]], np)] = True
+    idx = np.flatnonzero(hit).tolist()
+    if kind is None:
+        out = list(values)
+        for i in idx:
+            out[i] = normalize_text(out[i])
+        return out
+    if idx:
+        mask = pa.array(hit)
+        fixed = [normalize_text(x) for x in arr.filter(mask).to_pylist()]
+        arr = pc.replace_with_mask(arr, mask, pa.array(fixed, type=arr.type))
+    return _to_series(values, arr) if kind == "pandas" else arr
+
+
+@functools.lru_cache(maxsize=None)
+def _nfkc_flags() -> bytearray:
+    """
+    可能被 NFKC 改写或参与规范组合的码位（首次调用时遍历一遍码位表，约 0.3s）：
+    有分解映射的、组合类非 0 的、能作为规范组合第二个字符的，以及韩文中声/终声字母。
+    """
+    flags = bytearray(sys.maxunicode + 1)
+    for cp in range(sys.maxunicode + 1):
+        c = chr(cp)
+        d = unicodedata.decomposition(c)
+        if d:
+            flags[cp] = 1
+            parts = d.split()
+            if not d.startswith("<") and len(parts) == 2:
+                flags[int(parts[1], 16)] = 1
+        elif unicodedata.combining(c):
+            flags[cp] = 1
+    flags[0x1161:0x1176] = b"\x01" * (0x1176 - 0x1161)
+    flags[0x11A8:0x11C3] = b"\x01" * (0x11C3 - 0x11A8)
+    return flags
+
+
+# 多字节字符在 dedup_key 批量内核里的处理方式
+_DROP, _KEEP, _EXACT = 1, 2, 3
+
+
+@functools.lru_cache(maxsize=None)
+def _cp_states():
+    import numpy as np
+    return np.zeros(sys.maxunicode + 1, np.uint8)
+
+
+def _cp_state(cps):
+    """
+    码位 → _DROP（NFKC 后全是非文字、且不参与组合，整字删除）/ _KEEP（dedup_key 不改动它）/
+    _EXACT（该行交给逐条 dedup_key）。按需计算，结果缓存在进程内。
+    """
+    states = _cp_states()
+    todo = cps[states[cps] == 0]
+    if len(todo):
+        flags = _nfkc_flags()
+        for cp in set(todo.tolist()):
+            c = chr(cp)
+            key = dedup_key(c)
+            if key == c and not flags[cp]:
+                states[cp] = _KEEP
+            elif not key and not any(flags[ord(x)] for x in _normalize("NFKC", c)):
+                states[cp] = _DROP
+            else:
+                states[cp] = _EXACT
+    return states[cps]
+
+
+def _key_kernel(arr, np):
+    """
+    直接在 UTF-8 字节上整列算 dedup_key（arr 不含 null）：
+    ASCII 标点空白删字节、大写字母 +32，汉字原样保留，其余多字节字符按 _cp_state 删除或保留。
+    返回 (结果数组, 需要逐条 dedup_key 的行, 结果与输入不同的行)。
+    """
+    import pyarrow as pa
+    off, d = _utf8(arr, np)
+    n = len(arr)
+    u8 = np.uint8
+    upper = (d - u8(0x41)) < 26
+    keep = d >= 0x80
+    keep |= (d - u8(0x61)) < 26
+    keep |= (d - u8(0x30)) < 10
+    keep |= upper
+    exact = np.zeros(n, bool)
+    lead, cp, width = _wide_chars(d, np)
+    if len(lead):
+        state = _cp_state(cp)
+        exact[_rows(off, lead[state == _EXACT], np)] = True
+        drop, width = lead[state == _DROP], width[state == _DROP]
+        for k in range(4):
+            keep[drop[width > k] + k] = False
+    gone = _rows(off, np.flatnonzero(~keep), np)
+    changed = np.zeros(n, bool)
+    changed[gone] = True
+    if upper.any():
+        changed[_rows(off, np.flatnonzero(upper), np)] = True
+    elif not len(gone):
+        return arr, exact, changed
+    cut = np.zeros(n + 1, off.dtype)
+    np.cumsum(np.bincount(gone, minlength=n), out=cut[1:])
+    data = d[keep]
+    data[(data - u8(0x41)) < 26] += 32
+    out = pa.Array.from_buffers(arr.type, n, [None, pa.py_buffer(off - cut), pa.py_buffer(data)])
+    return out, exact, changed
+
+
+def _key_list(keys) -> List[str]:
+    """Arrow 键数组 → list。键里只有文字数字，不会有换行：整列拼成一个串再 split，省掉逐个 Scalar 转换。"""
+    if not len(keys):
+        return []
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    lists = pa.ListArray.from_arrays(pa.array([0, len(keys)], pa.int32()), keys)
+    return pc.binary_join(lists, "\n")[0].as_py().split("\n")
+
+
+def dedup_key_batch(values: Any) -> Any:
+    """
+    dedup_key 的批量版，返回类型同 normalize_text_batch；缺失值 → ''。
+    装了 pyarrow 时整列走 _key_kernel，只有含少见字符（汉字以外的文字、组合符号、需要 NFKC 的字母数字等）
+    的行回退到逐条 dedup_key，结果与逐条计算完全一致。list 输入只为键有变化的行新建字符串。
+    """
+    kind = _arrow_kind(values)
+    if kind is None:
+        values = list(values)
+    try:
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return _rewrap(values, [dedup_key(x) for x in values], kind)
+    arr = _to_arrow(values, kind)
+    missing = _null_rows(arr, np)
+    arr = pc.fill_null(arr, "")
+    out, exact, changed = _key_kernel(arr, np)
+    if exact.any():
+        mask = pa.array(exact)
+        fixed = [dedup_key(x) for x in arr.filter(mask).to_pylist()]
+        out = pc.replace_with_mask(out, mask, pa.array(fixed, type=arr.type))
+    if kind == "arrow":
+        return out
+    if kind == "pandas":
+        return _to_series(values, out)
+    changed |= exact | missing
+    res = list(values)
+    if changed.any():
+        for i, k in zip(np.flatnonzero(changed).tolist(), _key_list(out.filter(pa.array(changed)))):
+            res[i] = k
+    return res
+
+
+def signature_batch(values: Any) -> List[str]:
+    """signature 的批量版，返回 list。"""
+    keys = dedup_key_batch(values)
+    kind = _arrow_kind(keys)
+    if kind == "pandas":
+        keys = keys.tolist()
+    elif kind == "arrow":
+        keys = _key_list(keys)
+    return [hashlib.md5(k.encode("utf-8")).hexdigest() for k in keys]
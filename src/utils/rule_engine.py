@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+关键词规则意图引擎（本地基线 / 替身 NLU）：
+- 规则来自 intents.yaml：各意图的 keywords {词: 权重} 与 requires（每组至少命中一个的门槛），
+  以及 nlu_rules 下不在意图清单里的兜底类标签
+- 全部关键词编译成一个 Aho-Corasick 自动机，一遍扫描拿到所有命中，再一次性给全部意图打分
+- 置信度为 softmax(得分 / temperature)（fallback 记 0 分参与归一），top_k 为按得分排序的真实候选
+"""
+import math
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_WS = re.compile(r'\s+')
+_MEMO_SIZE = 100_000
+
+
+def normalize(q: str) -> str:
+    return _WS.sub('', (q or '').lower())
+
+
+class AhoCorasick:
+    """
+    纯 Python 的多模式匹配自动机：trie + BFS 构建失败指针，输出表沿失败链预先合并；
+    再把失败转移展开成完整的状态转移表（只含模式里出现过的字符），匹配时每个字符一次 dict 查找。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[List[int]] = [[]]
+        for pid, p in enumerate(self.patterns):
+            if not p:
+                continue
+            s = 0
+            for ch in p:
+                nxt = self._goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[s][ch] = nxt
+                    self._goto.append({})
+                    self._out.append([])
+                s = nxt
+            self._out[s].append(pid)
+        fail = [0] * len(self._goto)
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])] + [{} for _ in self._goto[1:]]
+        q = deque(self._goto[0].values())
+        while q:
+            s = q.popleft()
+            # BFS 保证 fail[s] 的转移表已经展开好
+            self._delta[s] = {**self._delta[fail[s]], **self._goto[s]} if s else self._delta[0]
+            for ch, t in self._goto[s].items():
+                fail[t] = self._delta[fail[s]].get(ch, 0) if s else 0
+                self._out[t] = self._out[t] + self._out[fail[t]]
+                q.append(t)
+
+    def matches(self, text: str) -> set:
+        """text 中出现过的模式 id 集合。"""
+        delta, out = self._delta, self._out
+        s, hit = 0, set()
+        for ch in text:
+            s = delta[s].get(ch, 0)
+            if out[s]:
+                hit.update(out[s])
+        return hit
+
+
+def _keyword_weights(kw: Any) -> Dict[str, float]:
+    if isinstance(kw, dict):
+        return {normalize(str(k)): float(v) for k, v in kw.items()}
+    return {normalize(str(k)): 1.0 for k in (kw or [])}
+
+
+class IntentRuleEngine:
+    def __init__(self, rules: List[Dict[str, Any]], fallback: str = '不支持', temperature: float = 1.0, top_k: int = 3):
+        """rules: [{'id', 'keywords': {词: 权重} | [词], 'requires': [[词, ...], ...]}]，顺序即同分时的优先级。"""
+        self.fallback = fallback
+        self.temperature = float(temperature) or 1.0
+        self.top_k = max(1, int(top_k))
+        self.intents = [str(r['id']) for r in rules]
+        self._n_requires = [len(r.get('requires') or []) for r in rules]
+        index: Dict[str, int] = {}
+        self._score: List[List[Tuple[int, float]]] = []   # 模式 → [(意图, 权重)]
+        self._gate: List[List[Tuple[int, int]]] = []      # 模式 → [(意图, 门槛组)]
+
+        def _pid(word: str) -> int:
+            if word not in index:
+                index[word] = len(index)
+                self._score.append([])
+                self._gate.append([])
+            return index[word]
+
+        for i, r in enumerate(rules):
+            for word, w in _keyword_weights(r.get('keywords')).items():
+                if word:
+                    self._score[_pid(word)].append((i, w))
+            for g, group in enumerate(r.get('requires') or []):
+                for word in group:
+                    word = normalize(str(word))
+                    if word:
+                        self._gate[_pid(word)].append((i, g))
+        self._ac = AhoCorasick(index)
+        self._memo: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_yaml(cls, path: str, top_k: int = 3) -> 'IntentRuleEngine':
+        import yaml
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+        extra = data.get('nlu_rules') or {}
+        rules = [it for it in (data.get('intents') or []) + (extra.get('intents') or [])
+                 if isinstance(it, dict) and it.get('id') and it.get('keywords')]
+        if not rules:
+            raise ValueError(f'{path} 里没有带 keywords 的意图')
+        return cls(rules, fallback=extra.get('fallback', '不支持'), temperature=extra.get('temperature', 1.0), top_k=top_k)
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """命中的意图 → 得分（不满足 requires 的不计）。"""
+        score: Dict[int, float] = {}
+        gates: Dict[int, set] = {}
+        for pid in self._ac.matches(normalize(query)):
+            for i, w in self._score[pid]:
+                score[i] = score.get(i, 0.0) + w
+            for i, g in self._gate[pid]:
+                gates.setdefault(i, set()).add(g)
+        return {i: s for i, s in score.items() if s > 0 and len(gates.get(i, ())) == self._n_requires[i]}
+
+    def predict(self, query: str, context: Any = None) -> Dict[str, Any]:
+        # 用例集里重复 query 很常见：按归一化 query 记忆结果（满了整体清空）
+        key = normalize(query)
+        res = self._memo.get(key)
+        if res is None:
+            if len(self._memo) >= _MEMO_SIZE:
+                self._memo.clear()
+            res = self._memo[key] = self._predict(key)
+        return {**res, 'top_k': [dict(x) for x in res['top_k']]}
+
+    def _predict(self, query: str) -> Dict[str, Any]:
+        score = self.scores(query)
+        # 同一标签多条规则（或与 fallback 同名）时取最高分
+        best: Dict[str, Tuple[float, int]] = {}
+        for i, s in score.items():
+            name = self.intents[i]
+            if name not in best or s > best[name][0]:
+                best[name] = (s, i)
+        best.setdefault(self.fallback, (0.0, len(self.intents)))
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1][0], kv[1][1]))
+        z = sum(math.exp(s / self.temperature) for _, (s, _) in ranked)
+        top = [{'intent': name, 'confidence': math.exp(s / self.temperature) / z} for name, (s, _) in ranked[:self.top_k]]
+        return {'intent': top[0]['intent'], 'confidence': top[0]['confidence'], 'top_k': top}
+
+    def predict_batch(self, queries: List[str], contexts: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        return [self.predict(q) for q in queries]
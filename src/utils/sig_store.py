@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+跨运行的持久化去重签名库（SQLite，默认 {storage.output_dir}/_signatures.sqlite）：
+- signatures：以生成器的 _sig（归一化 query 的 md5）为主键，记录 query / test_type / domain / 来源文件
+- sketches  ：近重复检测用的 LSH 桶键（与 utils/neardup.NearDupIndex 同参数），按桶键建索引
+- 生成器在收录一条样本前查询：精确签名命中或近重复命中即视为“已拥有”，直接拒收
+- examples() 按 类型/域 抽取已有样例，拼进提示词引导模型避开已有说法
+- from_cfg 按 (库路径, 近重复参数) 复用进程内同一个实例（一条连接，线程间加锁共享），
+  线程池里的生成任务和常驻的 webapp 反复调用也不会泄漏文件句柄 / WAL 读者
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .neardup import NearDupIndex, near_dup_options, shingles
+
+# (库文件绝对路径, 近重复参数) -> SignatureStore
+_STORES: Dict[Tuple, "SignatureStore"] = {}
+_STORES_LOCK = threading.Lock()
+
+
+class SignatureStore:
+    def __init__(self, path: str, near_opts: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.near = NearDupIndex(**near_opts) if near_opts else None
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                sig TEXT PRIMARY KEY,
+                query TEXT,
+                test_type TEXT,
+                domain TEXT,
+                source TEXT,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sig_type_domain ON signatures(test_type, domain);
+            CREATE TABLE IF NOT EXISTS sketches (
+                bkey BLOB,
+                sig TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_sketch_bkey ON sketches(bkey);
+            """
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> Optional["SignatureStore"]:
+        """
+        dedup.store: {enable, path}；近重复参数沿用 dedup.near_dup。未启用返回 None。
+        path 缺省为 {storage.output_dir}/_signatures.sqlite；同一库文件与参数返回同一个共享实例（不要 close）。
+        """
+        st = (((cfg or {}).get("dedup", {}) or {}).get("store", {}) or {})
+        if not st.get("enable", False):
+            return None
+        out_dir = ((cfg or {}).get("storage", {}) or {}).get("output_dir", "data/generated")
+        path = st.get("path") or os.path.join(out_dir, "_signatures.sqlite")
+        near_opts = near_dup_options(cfg)
+        key = (os.path.abspath(path), tuple(sorted((near_opts or {}).items())))
+        with _STORES_LOCK:
+            store = _STORES.get(key)
+            if store is None:
+                store = _STORES[key] = cls(path, near_opts)
+            return store
+
+    def close(self) -> None:
+        """关闭连接并移出共享表（之后 from_cfg 会重新打开）。"""
+        with _STORES_LOCK:
+            for k in [k for k, v in _STORES.items() if v is self]:
+                del _STORES[k]
+        with self._lock:
+            self._conn.close()
+
+    # ---------------- 查询 ----------------
+
+    def has(self, sig: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM signatures WHERE sig = ?", (sig,)).fetchone() is not None
+
+    def near_match(self, query: str, test_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """近重复查询；给定 test_type 时只与同类型样本比较（噪声类与其 BASE 天然相似）。"""
+        if self.near is None:
+            return None
+        sh, bkeys = self.near.sketch(query)
+        keys = [bytes([i]) + k for i, k in enumerate(bkeys)]
+        sql = ("SELECT DISTINCT s.sig, s.query FROM sketches k JOIN signatures s ON s.sig = k.sig "
+               f"WHERE k.bkey IN ({','.join('?' * len(keys))})")
+        if test_type is not None:
+            sql += " AND s.test_type = ?"
+            keys.append(test_type)
+        with self._lock:
+            rows = self._conn.execute(sql, keys).fetchall()
+        best, best_sim = None, 0.0
+        for sig, q in rows:
+            sim = NearDupIndex.jaccard(sh, shingles(self.near.normalize(q or ""), self.near.ngram))
+            if sim > best_sim:
+                best, best_sim = (sig, q), sim
+        if best is None or best_sim < self.near.threshold:
+            return None
+        return {"matched_sig": best[0], "matched_text": best[1], "similarity": round(best_sim, 4)}
+
+    def owned(self, sig: str, query: str, test_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """已拥有则返回原因（exact：任意类型同句；near：同类型近似）及命中样本，否则 None。"""
+        if self.has(sig):
+            return {"reason": "exact", "matched_sig": sig}
+        hit = self.near_match(query, test_type)
+        return dict(hit, reason="near") if hit else None
+
+    def examples(self, test_type: Optional[str] = None, domain: Optional[str] = None, k: int = 20) -> List[str]:
+        """随机抽取已有样例（先按 类型+域，不足再放宽到只按类型）。"""
+        if k <= 0:
+            return []
+        out: List[str] = []
+        with self._lock:
+            for where, args in (("test_type = ? AND domain = ?", (test_type, domain)),
+                                ("test_type = ?", (test_type,))):
+                if domain is None and "domain" in where:
+                    continue
+                rows = self._conn.execute(
+                    f"SELECT query FROM signatures WHERE {where} ORDER BY RANDOM() LIMIT ?", (*args, k)
+                ).fetchall()
+                for (q,) in rows:
+                    if q not in out:
+                        out.append(q)
+                if len(out) >= k:
+                    break
+        return out[:k]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0])
+
+    # ---------------- 写入 ----------------
+
+    def add(self, rows: Iterable[Tuple[str, str, Optional[str], Optional[str]]], source: str = "") -> int:
+        """rows: (sig, query, test_type, domain)。已存在的签名跳过；返回新增条数。"""
+        now = time.time()
+        added = 0
+        with self._lock:
+            cur = self._conn.cursor()
+            for sig, query, test_type, domain in rows:
+                cur.execute(
+                    "INSERT OR IGNORE INTO signatures(sig, query, test_type, domain, source, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (sig, query, test_type, domain, source, now),
+                )
+                if cur.rowcount <= 0:
+                    continue
+                added += 1
+                if self.near is not None:
+                    _, bkeys = self.near.sketch(query or "")
+                    cur.executemany(
+                        "INSERT INTO sketches(bkey, sig) VALUES (?, ?)",
+                        [(bytes([i]) + k, sig) for i, k in enumerate(bkeys)],
+                    )
+            self._conn.commit()
+        return added
@@ -17,8 +17,8 @@ if str(SRC_DIR) not in sys.path:
 # ——严格使用项目里的实现，不做页面级兜底/重试——
 from src.chains.description_parser import parse_domains_intents
 from src.chains.llm_generators import (
-    _ALLOWED_TYPES,              # 允许的类型集合
-    gen_for_description_by_types # 批量生成函数
+    _ALLOWED_TYPES,               # 允许的类型集合
+    gen_for_descriptions_by_types # 域 × 类型 并发生成函数
 )
 from src.llm_providers.provider import get_llm  # 使用你项目里的 provider
 
@@ -114,6 +114,29 @@ with st.sidebar:
         key="inp_max_tokens",
     )
 
+    max_concurrency = st.number_input(
+        "并发调用数（域 × 类型）",
+        min_value=1, max_value=64,
+        value=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        step=1,
+        key="inp_max_concurrency",
+        help="同时在途的 LLM 请求上限；1 表示逐个串行调用。",
+    )
+
+    streaming = st.checkbox(
+        "流式生成（边生成边展示，配额满即停止）",
+        value=True,
+        key="chk_streaming",
+    )
+
+    cache_mode = st.selectbox(
+        "本地响应缓存",
+        ["readwrite", "readonly", "refresh", "off"],
+        index=0,
+        key="sel_cache_mode",
+        help="readwrite：命中即复用；readonly：只读不写；refresh：忽略旧结果并覆盖；off：不使用缓存。",
+    )
+
     # 高级：显示每次 LLM 调用的详细日志
     debug_show_logs = st.checkbox("显示详细实时日志", value=True, key="chk_debug_logs")
 
@@ -160,7 +183,8 @@ def resolve_alloc(total_count: int, raw: dict):
     out = {k: v for k, v in out.items() if k in _ALLOWED_TYPES and v > 0}
     return out
 
-def build_cfg(model_choice: str, temperature: float, max_tokens: int, total: int, api_key: str):
+def build_cfg(model_choice: str, temperature: float, max_tokens: int, total: int, api_key: str, max_concurrency: int = 8,
+              cache_mode: str = "readwrite", streaming: bool = True):
     """
     从 UI 构造 cfg，显式覆盖 llm 信息（项目里的 provider 会先读 cfg，再读环境变量）。
     """
@@ -175,6 +199,16 @@ def build_cfg(model_choice: str, temperature: float, max_tokens: int, total: int
         },
         "generation": {
             "total": int(total),
+            "max_concurrency": int(max_concurrency),
+            "streaming": bool(streaming),
+        },
+        "dedup": {
+            "near_dup": {"enable": True, "threshold": 0.7},
+        },
+        "llm_cache": {
+            "enable": cache_mode != "off",
+            "mode": cache_mode,
+            "path": str(ROOT / "data" / "generated" / "_llm_cache.sqlite"),
         },
         # 给下游一个运行时 override（如你的 provider.py 支持，会直接读这里）
         "_override": {
@@ -214,7 +248,7 @@ if run_btn:
         st.stop()
 
     # 构建 cfg（显式覆盖到你项目的 provider）
-    cfg = build_cfg(model_choice, temperature, max_tokens, int(total), api_key_input)
+    cfg = build_cfg(model_choice, temperature, max_tokens, int(total), api_key_input, int(max_concurrency), cache_mode, streaming)
 
     # === 1) 域解析（严格调用你项目里的 parse_domains_intents）===
     st.subheader("🧭 域解析")
@@ -249,47 +283,58 @@ if run_btn:
 
     call_metrics = []  # 记录每个域/类型调用的指标
 
-    all_rows = []
     total_domains = len(domain_names)
     total_types_per_domain = len(type_counts)
-    total_calls = total_domains # Each domain will now make one call to gen_for_description_by_types
+    total_calls = total_domains * total_types_per_domain # 每个域 × 每个类型各一次调用，全部并发下发
     call_done = 0
+    t_start = time.perf_counter()
 
-    for i, d in enumerate(domain_names, start=1):
-        per_domain_status.info(f"域 [{i}/{total_domains}]：{d}")
-        d_desc = f"{desc}（功能域：{d}）"
-
-        t_start = time.perf_counter()
-        per_type_status.info(f"  ↳ 正在为域 {d} 生成所有类型…")
-
-        # ——关键：调用 gen_for_description_by_types 获得所有类型级统计——
-        # 假设 gen_for_description_by_types 返回的 rows 已经包含了 domain 信息
-        rows = gen_for_description_by_types(cfg, d_desc, type_counts)
-        all_rows.extend(rows)
+    per_domain_status.info(f"共 {total_domains} 个域 × {total_types_per_domain} 个类型，并发上限 {int(max_concurrency)}")
+    per_type_status.info("  ↳ 正在并发生成所有域 × 类型…")
 
+    def _on_result(i: int, t: str, rows: list):
+        # as_completed 回调在主线程执行，可以安全刷新页面组件
+        global call_done
+        call_done += 1
+        d = domain_names[i]
         t_used = time.perf_counter() - t_start
         got = len(rows)
-        tps = (got / t_used) if t_used > 0 else 0.0
-        call_done += 1
         progress_overall.progress(
             min(100, int(call_done * 100 / max(1, total_calls))),
-            text=f"已完成 {call_done}/{total_calls} 次域调用"
+            text=f"已完成 {call_done}/{total_calls} 次调用（{d} / {t}）"
         )
-
-        # Simplified metrics for domain-level call
         call_metrics.append({
             "domain": d,
-            "need_total": sum(type_counts.values()),
-            "got_total": got,
-            "time_sec": round(t_used, 2),
-            "tps": round(tps, 2),
+            "test_type": t,
+            "need": int(type_counts.get(t, 0)),
+            "got": got,
+            "done_at_sec": round(t_used, 2),
         })
-
         if debug_show_logs:
-            log_line(f"[{d}] 目标 {sum(type_counts.values())} → 实得 {got}；耗时 {t_used:.2f}s，吞吐 {tps:.2f} q/s")
+            log_line(f"[{d}/{t}] 目标 {type_counts.get(t, 0)} → 实得 {got}；完成于 {t_used:.2f}s")
             log_area.code("\n".join(st.session_state["live_logs"]), language="text")
 
-        per_domain_status.success(f"域 {d} 完成。")
+    items_done = 0
+    items_total = sum(type_counts.values()) * total_domains
+
+    def _on_item(i: int, t: str, row: dict):
+        # 每解析出一条就刷新一次（流式模式下即首条用例的实时到达）
+        global items_done
+        items_done += 1
+        per_type_status.info(f"  ↳ 已解析 {items_done}/{items_total} 条｜最新 [{domain_names[i]}/{t}] {row.get('query', '')}")
+
+    d_descs = [f"{desc}（功能域：{d}）" for d in domain_names]
+    near_rejects = []
+    per_domain_rows = gen_for_descriptions_by_types(cfg, d_descs, type_counts, on_result=_on_result, on_item=_on_item,
+                                                    rejects=near_rejects)
+
+    all_rows = []
+    for d, rows in zip(domain_names, per_domain_rows):
+        all_rows.extend(rows)
+
+    t_used = time.perf_counter() - t_start
+    tps = (len(all_rows) / t_used) if t_used > 0 else 0.0
+    per_domain_status.success(f"全部域完成：耗时 {t_used:.2f}s，吞吐 {tps:.2f} q/s")
 
     per_type_status.empty()
     progress_overall.progress(100, text="全部完成")
@@ -332,6 +377,10 @@ if run_btn:
     df_calls = pd.DataFrame(call_metrics)
     st.dataframe(df_calls, use_container_width=True)
 
+    if near_rejects:
+        with st.expander(f"近重复拒收明细（{len(near_rejects)} 条）", expanded=False):
+            st.dataframe(pd.DataFrame(near_rejects), use_container_width=True)
+
     st.subheader("🔎 预览（Top 100）")
     st.dataframe(df.head(100), use_container_width=True, height=420)
 